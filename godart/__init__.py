@@ -1,7 +1,7 @@
 # godart/__init__.py
+import importlib
+
 from .config import Config
-from .sb_manager import SupabaseManager
-from .godart_manager import GodartManager
 
 
 
@@ -10,8 +10,52 @@ from .godart_manager import GodartManager
 __version__ = "1.0.0"
 __author__ = "rodolfocasan"
 
-__all__ = [
-    'Config',
-    'SupabaseManager',
-    'GodartManager'
-]
\ No newline at end of file
+# Importación diferida (PEP 562): google.genai y supabase solo se cargan al usar la clase
+_LAZY_IMPORTS = {
+    'SupabaseManager': '.sb_manager',
+    'GodartManager': '.godart_manager',
+    'AsyncGodartManager': '.async_manager',
+    'GodartStream': '.streaming',
+    'AsyncGodartStream': '.streaming',
+    'ClientPool': '.client_pool',
+    'RateLimitTracker': '.rate_limiter',
+    'SharedRateLimitTracker': '.rate_backends',
+    'SQLiteRateLimitBackend': '.rate_backends',
+    'RedisRateLimitBackend': '.rate_backends',
+    'KeyScheduler': '.key_scheduler',
+    'KeyHealth': '.key_health',
+    'ModelRouter': '.model_router',
+    'RequestQueue': '.request_queue',
+    'AsyncRequestQueue': '.request_queue',
+    'BatchJobs': '.batch_jobs',
+    'MemoryBatchJobStore': '.batch_jobs',
+    'SQLiteBatchJobStore': '.batch_jobs',
+    'ResponseCache': '.response_cache',
+    'MemoryCache': '.response_cache',
+    'SQLiteCache': '.response_cache',
+    'MemorySessionStore': '.session_store',
+    'SQLiteSessionStore': '.session_store',
+    'ContextCache': '.context_cache',
+    'TokenEstimator': '.token_estimator',
+    'Telemetry': '.telemetry',
+    'HedgePolicy': '.hedging'
+}
+
+__all__ = ['Config'] + list(_LAZY_IMPORTS)
+
+
+
+
+
+def __getattr__(name):
+    module_name = _LAZY_IMPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_IMPORTS))
\ No newline at end of file
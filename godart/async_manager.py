@@ -0,0 +1,523 @@
+# godart/async_manager.py
+import time
+import weakref
+import asyncio
+
+from .config import Config
+from .sb_manager import SupabaseManager
+from .godart_manager import GodartManager
+from .single_flight import AsyncSingleFlight
+from .hedging import resolve_deadline, remaining_time, time_left, deadline_passed
+from .streaming import AsyncGodartStream
+from .telemetry import logger
+
+
+
+
+
+class AsyncGodartManager(GodartManager):
+    def __init__(self, supabase_manager: SupabaseManager, max_concurrency=None, client_pool=None, key_scheduler=None, response_cache=None, session_store=None, history_token_budget=None, history_summarizer=None, context_cache=None, token_estimator=None, rate_limit_backend=None, telemetry=None, coalesce=None, hedge_policy=None, key_health=None, model_router=None, batch_job_store=None):
+        super().__init__(supabase_manager, client_pool, key_scheduler, response_cache, session_store, history_token_budget, history_summarizer, context_cache, token_estimator, rate_limit_backend, telemetry, coalesce, hedge_policy, key_health, model_router, batch_job_store)
+        self.max_concurrency = max_concurrency or Config.MAX_CONCURRENCY
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._async_session_locks = weakref.WeakValueDictionary()
+        # single_flight (síncrono) queda para las llamadas bloqueantes, como el resumen de historial
+        self.async_single_flight = AsyncSingleFlight() if self.single_flight is not None else None
+    
+    async def _run_blocking(self, func, *args, **kwargs):
+        # El cliente de Supabase es síncrono: se ejecuta en un hilo para no bloquear el event loop
+        return await asyncio.to_thread(func, *args, **kwargs)
+    
+    async def _run_tracker(self, func, *args):
+        # Con backend compartido cada consulta a un tracker es una transacción SQLite o un round-trip a Redis
+        if self.rate_limit_backend is not None:
+            return await self._run_blocking(func, *args)
+        return func(*args)
+    
+    async def _aget_model_real_name(self, model_alias):
+        return await self._run_blocking(self._get_model_real_name, model_alias)
+    
+    async def _abuild_system_instruction(self, identidad=None, tono=None):
+        return await self._run_blocking(self._build_system_instruction, identidad, tono)
+    
+    async def _aselect_key(self, model_alias, estimated_tokens, attempted_keys, timeout=None):
+        with self.telemetry.span('key_selection', model=model_alias) as span:
+            all_keys = await self._run_blocking(self.supabase.get_all_available_keys)
+            deadline = time.monotonic() + (Config.ACQUIRE_TIMEOUT if timeout is None else timeout)
+            recheck = True
+            
+            while True:
+                lease, min_wait, soonest_key = await self._run_tracker(self._try_select_key, all_keys, model_alias, estimated_tokens, attempted_keys)
+                if lease:
+                    span.set_attribute('key_id', lease.key_id)
+                    self._remember_lease(lease)
+                    return lease
+                
+                remaining = deadline - time.monotonic()
+                if not soonest_key:
+                    # Sin keys en límite de cupo puede quedar alguna pausada por el circuit breaker
+                    wait_time = self._circuit_wait(all_keys, model_alias, attempted_keys)
+                    if wait_time is None:
+                        # La prueba de una key pudo terminar entre la selección y la consulta: se intenta una vez más
+                        if not recheck:
+                            return None
+                        recheck = False
+                        continue
+                    if wait_time > remaining:
+                        logger.info(f" - Todas las keys en pausa. Menor espera: {wait_time:.1f}s")
+                        return None
+                    if wait_time > self.key_health.probe_poll:
+                        logger.info(f" - Todas las keys en pausa. Esperando {wait_time:.1f}s")
+                    await asyncio.sleep(max(wait_time, 0.001))
+                    recheck = True
+                    continue
+                
+                if min_wait > remaining:
+                    logger.info(f" - Todas las keys en límite. Menor espera: {min_wait:.1f}s")
+                    return None
+                
+                logger.info(f" - Todas las keys en límite. Esperando {min_wait:.1f}s por {soonest_key['account_name']}")
+                await asyncio.sleep(max(min_wait, 0.001))
+    
+    def _get_async_session_lock(self, session_id):
+        # El event loop es de un solo hilo: basta con setdefault
+        return self._async_session_locks.setdefault(session_id, asyncio.Lock())
+    
+    async def _aestimate_request(self, *args, **kwargs):
+        # count_tokens hace una llamada de red; la estimación local no necesita salir del event loop
+        if self.token_estimator.count_tokens:
+            return await self._run_blocking(self._estimate_request, *args, **kwargs)
+        return self._estimate_request(*args, **kwargs)
+    
+    async def _alog_request(self, key_id, success, error_message=None, model=None):
+        await self._run_blocking(self.supabase.log_request, key_id, success, error_message, model)
+    
+    async def _aroute_models(self, model, prompt):
+        # Consultar los trackers puede tocar SQLite o Redis: fuera del event loop solo si hay router
+        if self.model_router is None:
+            return self._route_models(model, prompt)
+        return await self._run_blocking(self._route_models, model, prompt)
+    
+    async def make_request(self, prompt, model=None, identidad=None, tono=None, custom_config=None, use_cache=True, timeout=None, deadline=None):
+        deadline = resolve_deadline(timeout, deadline)
+        requested, models = await self._aroute_models(model, prompt)
+        
+        for index, model_alias in enumerate(models):
+            try:
+                text = await self._arequest_model(prompt, model_alias, identidad, tono, custom_config, use_cache, deadline)
+            except Exception as e:
+                if self._can_fall_back(e, models, index):
+                    continue
+                raise
+            return self._model_response(text, model_alias, requested)
+    
+    async def _arequest_model(self, prompt, model_alias, identidad, tono, custom_config, use_cache, deadline):
+        async with self._semaphore:
+            model_real = await self._aget_model_real_name(model_alias)
+            
+            if not model_real:
+                raise Exception(f"[!!] Modelo '{model_alias}' no configurado en Supabase")
+            
+            system_instruction = await self._abuild_system_instruction(identidad, tono)
+            
+            cache_key = self._get_cache_key(model_real, system_instruction, tono, custom_config, prompt, use_cache)
+            if cache_key:
+                cached = await self._run_blocking(self.response_cache.get, cache_key)
+                if cached is not None:
+                    return cached
+        
+        # Los seguidores esperan fuera del semáforo: solo la llamada compartida ocupa un cupo de concurrencia
+        flight_key = self._get_flight_key(model_real, system_instruction, tono, custom_config, prompt, use_cache)
+        if flight_key is None:
+            return await self._asend_request(prompt, model_alias, model_real, system_instruction, tono, custom_config, cache_key, deadline)
+        
+        text, shared = await self.async_single_flight.do(
+            flight_key,
+            lambda: self._asend_request(prompt, model_alias, model_real, system_instruction, tono, custom_config, cache_key, deadline),
+            timeout = remaining_time(deadline)
+        )
+        if shared:
+            self.telemetry.record_coalesced(model_alias)
+        return text
+    
+    async def _await_within(self, awaitable, deadline):
+        # Además del timeout HTTP del SDK, el event loop corta la espera al llegar al deadline
+        remaining = time_left(deadline)
+        if remaining is None:
+            return await awaitable
+        try:
+            return await asyncio.wait_for(awaitable, remaining)
+        except asyncio.TimeoutError:
+            raise TimeoutError("[!!] Se agotó el tiempo del request")
+    
+    async def _agenerate(self, lease, prompt, model_alias, model_real, system_instruction, tono, custom_config, deadline):
+        client = self.client_pool.get(lease.key_id, lease.api_key)
+        
+        config = self._get_generation_config(tono, custom_config)
+        await self._run_blocking(self._apply_system_instruction, config, client, lease.key_id, model_real, system_instruction)
+        self._apply_timeout(config, deadline)
+        
+        with self.telemetry.span('gemini', model=model_alias, key_id=lease.key_id) as span:
+            response = await client.aio.models.generate_content(
+                model = model_real,
+                contents = prompt,
+                config = config
+            )
+        if self.hedge_policy is not None:
+            self.hedge_policy.observe(model_alias, span.duration)
+        return response
+    
+    def _settle_hedge_task(self, lease, model_alias, task):
+        # Se registra fuera del event loop: log_request puede ser una llamada síncrona a Supabase
+        if not task.cancelled():
+            asyncio.get_running_loop().run_in_executor(None, self._settle_hedge, lease, model_alias, task)
+    
+    async def _ahedged_call(self, generate, lease, model_alias, estimated_tokens, attempted_keys, deadline):
+        delay = self.hedge_policy.delay(model_alias)
+        if delay is None:
+            return await self._await_within(generate(lease), deadline), lease
+        
+        primary = asyncio.ensure_future(generate(lease))
+        # Las esperas no lanzan al vencer el deadline: antes de salir cada intento en curso queda registrado
+        left = time_left(deadline)
+        done, _ = await asyncio.wait({primary}, timeout=delay if left is None else min(delay, left))
+        if done:
+            return primary.result(), lease
+        
+        hedge_lease = None if deadline_passed(deadline) else await self._run_blocking(self._lease_hedge_key, model_alias, estimated_tokens, attempted_keys)
+        if hedge_lease is None:
+            done, _ = await asyncio.wait({primary}, timeout=time_left(deadline))
+            if not done:
+                primary.add_done_callback(lambda t: self._settle_hedge_task(lease, model_alias, t))
+                raise TimeoutError("[!!] Se agotó el tiempo del request")
+            return primary.result(), lease
+        
+        logger.info(f" - Request lento, duplicando en {hedge_lease.account_name}")
+        self.telemetry.record_hedge(model_alias)
+        hedge = asyncio.ensure_future(generate(hedge_lease))
+        leases = {primary: lease, hedge: hedge_lease}
+        
+        pending = {primary, hedge}
+        winner = None
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, timeout=time_left(deadline), return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            winner = next((task for task in done if task.exception() is None), None)
+        self.hedge_policy.record(model_alias, winner is hedge)
+        
+        # Igual que en la versión síncrona: la llamada que no se devuelve sigue y se registra al terminar
+        returned = winner or (primary if primary.done() else None)
+        for task, task_lease in leases.items():
+            if task is not returned:
+                task.add_done_callback(lambda t, l=task_lease: self._settle_hedge_task(l, model_alias, t))
+        
+        if returned is None:
+            raise TimeoutError("[!!] Se agotó el tiempo del request")
+        return returned.result(), leases[returned]
+    
+    async def _asend_request(self, prompt, model_alias, model_real, system_instruction, tono, custom_config, cache_key, deadline=None):
+        async with self._semaphore:
+            attempted_keys = set()
+            lease = None
+            
+            estimate = await self._aestimate_request(model_alias, model_real, prompt, system_instruction, tono=tono, custom_config=custom_config)
+            estimated_tokens = estimate.total
+            
+            for attempt in range(Config.MAX_RETRIES):
+                remaining = remaining_time(deadline)
+                try:
+                    lease = await self._aselect_key(model_alias, estimated_tokens, attempted_keys, remaining)
+                    if not lease:
+                        if deadline_passed(deadline):
+                            raise TimeoutError("[!!] Se agotó el tiempo del request")
+                        raise Exception("[!!] No hay API keys disponibles que puedan procesar este request")
+                    
+                    generate = lambda current: self._agenerate(current, prompt, model_alias, model_real, system_instruction, tono, custom_config, deadline)
+                    if self.hedge_policy is not None:
+                        response, lease = await self._ahedged_call(generate, lease, model_alias, estimated_tokens, attempted_keys, deadline)
+                    else:
+                        response = await self._await_within(generate(lease), deadline)
+                    
+                    await self._run_tracker(self._record_usage, lease, response, estimate)
+                    
+                    await self._alog_request(lease.key_id, True, model=model_alias)
+                    
+                    if cache_key and response.text is not None:
+                        await self._run_blocking(self.response_cache.set, cache_key, response.text)
+                    return response.text
+                except Exception as e:
+                    error_msg = str(e)
+                    key_id = lease.key_id if lease else None
+                    await self._alog_request(key_id, False, error_msg, model_alias)
+                    self._record_failure(lease, model_alias, error_msg, e)
+                    
+                    if deadline_passed(deadline) and not isinstance(e, TimeoutError):
+                        raise TimeoutError("[!!] Se agotó el tiempo del request") from e
+                    
+                    if self._discard_cached_context(lease, model_real, error_msg) and attempt < Config.MAX_RETRIES - 1:
+                        logger.info(" - Reintentando con instrucciones en línea...")
+                        attempted_keys.discard(lease.key_id)
+                        continue
+                    
+                    if self._is_quota_error(error_msg):
+                        logger.warning(f"[!!] Key agotada: {lease.account_name if lease else None}")
+                        
+                        if attempt < Config.MAX_RETRIES - 1:
+                            self._record_rotation(lease, model_alias)
+                            await asyncio.sleep(self._retry_delay(deadline, attempt))
+                            continue
+                    raise e
+            raise Exception("[!!] Todas las API keys del pool están agotadas")
+    
+    async def make_request_chat(self, message, session_id="default", model=None, identidad=None, tono=None, history=None, custom_config=None, timeout=None, deadline=None):
+        deadline = resolve_deadline(timeout, deadline)
+        requested, models = await self._aroute_models(model, message)
+        
+        for index, model_alias in enumerate(models):
+            try:
+                text = await self._arequest_chat_model(message, session_id, model_alias, identidad, tono, history, custom_config, deadline)
+            except Exception as e:
+                if self._can_fall_back(e, models, index):
+                    continue
+                raise
+            return self._model_response(text, model_alias, requested)
+    
+    async def _arequest_chat_model(self, message, session_id, model_alias, identidad, tono, history, custom_config, deadline):
+        async with self._semaphore:
+            model_real = await self._aget_model_real_name(model_alias)
+            
+            if not model_real:
+                raise Exception(f"[!!] Modelo '{model_alias}' no configurado en Supabase")
+            
+            system_instruction = await self._abuild_system_instruction(identidad, tono)
+            
+            attempted_keys = set()
+            lease = None
+            
+            async with self._get_async_session_lock(session_id):
+                stored, window = await self._run_blocking(self._load_chat_window, session_id, history)
+                
+                estimate = await self._aestimate_request(model_alias, model_real, message, system_instruction, window, tono, custom_config)
+                estimated_tokens = estimate.total
+                
+                for attempt in range(Config.MAX_RETRIES):
+                    try:
+                        lease = await self._aselect_key(model_alias, estimated_tokens, attempted_keys, remaining_time(deadline))
+                        if not lease:
+                            if deadline_passed(deadline):
+                                raise TimeoutError("[!!] Se agotó el tiempo del request")
+                            raise Exception("[!!] No hay API keys disponibles que puedan procesar este request")
+                        
+                        client = self.client_pool.get(lease.key_id, lease.api_key)
+                        
+                        config = self._get_generation_config(tono, custom_config)
+                        await self._run_blocking(self._apply_system_instruction, config, client, lease.key_id, model_real, system_instruction)
+                        self._apply_timeout(config, deadline)
+                        
+                        chat = client.aio.chats.create(
+                            model = model_real,
+                            config = config,
+                            history = window
+                        )
+                        with self.telemetry.span('gemini', model=model_alias, key_id=lease.key_id):
+                            response = await self._await_within(chat.send_message(message), deadline)
+                        
+                        await self._run_tracker(self._record_usage, lease, response, estimate)
+                        await self._run_blocking(self._save_chat_history, session_id, chat, stored, window)
+                        
+                        await self._alog_request(lease.key_id, True, model=model_alias)
+                        return response.text
+                    except Exception as e:
+                        error_msg = str(e)
+                        key_id = lease.key_id if lease else None
+                        await self._alog_request(key_id, False, error_msg, model_alias)
+                        self._record_failure(lease, model_alias, error_msg, e)
+                        
+                        if deadline_passed(deadline) and not isinstance(e, TimeoutError):
+                            raise TimeoutError("[!!] Se agotó el tiempo del request") from e
+                        
+                        if self._discard_cached_context(lease, model_real, error_msg) and attempt < Config.MAX_RETRIES - 1:
+                            logger.info(" - Reintentando con instrucciones en línea...")
+                            attempted_keys.discard(lease.key_id)
+                            continue
+                        
+                        if self._is_quota_error(error_msg):
+                            logger.warning(f"[!!] Key agotada: {lease.account_name if lease else None}")
+                            
+                            if attempt < Config.MAX_RETRIES - 1:
+                                self._record_rotation(lease, model_alias)
+                                await asyncio.sleep(self._retry_delay(deadline, attempt))
+                                continue
+                        raise e
+                raise Exception("[!!] Todas las API keys del pool están agotadas")
+    
+    async def _stream_chunks(self, stream, open_stream, model_alias, model_real, estimate, on_complete=None, deadline=None):
+        async with self._semaphore:
+            attempted_keys = set()
+            lease = None
+            estimated_tokens = estimate.total
+            
+            for attempt in range(Config.MAX_RETRIES):
+                yielded = False
+                remaining = remaining_time(deadline)
+                try:
+                    lease = await self._aselect_key(model_alias, estimated_tokens, attempted_keys, remaining)
+                    if not lease:
+                        if deadline_passed(deadline):
+                            raise TimeoutError("[!!] Se agotó el tiempo del request")
+                        raise Exception("[!!] No hay API keys disponibles que puedan procesar este request")
+                    
+                    last_chunk = None
+                    with self.telemetry.span('gemini', model=model_alias, key_id=lease.key_id) as span:
+                        async for chunk in await open_stream(lease):
+                            if chunk.usage_metadata:
+                                last_chunk = chunk
+                            if chunk.text:
+                                if not yielded:
+                                    self.telemetry.record_ttft(model_alias, lease.key_id, span.duration)
+                                yielded = True
+                                yield chunk.text
+                            # El deadline cubre el stream completo, no solo la apertura
+                            if deadline_passed(deadline):
+                                raise TimeoutError("[!!] Se agotó el tiempo del request")
+                    
+                    # usage_metadata completo llega en el último chunk del stream
+                    await self._run_tracker(self._record_usage, lease, last_chunk, estimate)
+                    stream.key_id = lease.key_id
+                    stream.usage_metadata = last_chunk.usage_metadata if last_chunk else None
+                    
+                    if on_complete:
+                        await on_complete()
+                    
+                    await self._alog_request(lease.key_id, True, model=model_alias)
+                    return
+                except Exception as e:
+                    error_msg = str(e)
+                    key_id = lease.key_id if lease else None
+                    await self._alog_request(key_id, False, error_msg, model_alias)
+                    self._record_failure(lease, model_alias, error_msg, e)
+                    
+                    if deadline_passed(deadline) and not isinstance(e, TimeoutError):
+                        raise TimeoutError("[!!] Se agotó el tiempo del request") from e
+                    
+                    if self._discard_cached_context(lease, model_real, error_msg) and not yielded and attempt < Config.MAX_RETRIES - 1:
+                        logger.info(" - Reintentando con instrucciones en línea...")
+                        attempted_keys.discard(lease.key_id)
+                        continue
+                    
+                    # Solo se rota si aún no se envió texto al caller
+                    if self._is_quota_error(error_msg) and not yielded:
+                        logger.warning(f"[!!] Key agotada: {lease.account_name if lease else None}")
+                        
+                        if attempt < Config.MAX_RETRIES - 1:
+                            self._record_rotation(lease, model_alias)
+                            await asyncio.sleep(self._retry_delay(deadline, attempt))
+                            continue
+                    raise e
+            raise Exception("[!!] Todas las API keys del pool están agotadas")
+    
+    async def make_request_stream(self, prompt, model=None, identidad=None, tono=None, custom_config=None, timeout=None, deadline=None):
+        started_at = time.perf_counter()
+        deadline = resolve_deadline(timeout, deadline)
+        model_alias = (await self._aroute_models(model, prompt))[1][0]
+        model_real = await self._aget_model_real_name(model_alias)
+        
+        if not model_real:
+            raise Exception(f"[!!] Modelo '{model_alias}' no configurado en Supabase")
+        
+        system_instruction = await self._abuild_system_instruction(identidad, tono)
+        estimate = await self._aestimate_request(model_alias, model_real, prompt, system_instruction, tono=tono, custom_config=custom_config)
+        
+        async def open_stream(lease):
+            client = self.client_pool.get(lease.key_id, lease.api_key)
+            
+            config = self._get_generation_config(tono, custom_config)
+            await self._run_blocking(self._apply_system_instruction, config, client, lease.key_id, model_real, system_instruction)
+            self._apply_timeout(config, deadline)
+            
+            return await client.aio.models.generate_content_stream(
+                model = model_real,
+                contents = prompt,
+                config = config
+            )
+        
+        return AsyncGodartStream(
+            lambda stream: self._stream_chunks(stream, open_stream, model_alias, model_real, estimate, deadline=deadline),
+            model = model_alias,
+            started_at = started_at
+        )
+    
+    async def make_request_chat_stream(self, message, session_id="default", model=None, identidad=None, tono=None, history=None, custom_config=None, timeout=None, deadline=None):
+        started_at = time.perf_counter()
+        deadline = resolve_deadline(timeout, deadline)
+        model_alias = (await self._aroute_models(model, message))[1][0]
+        model_real = await self._aget_model_real_name(model_alias)
+        
+        if not model_real:
+            raise Exception(f"[!!] Modelo '{model_alias}' no configurado en Supabase")
+        
+        system_instruction = await self._abuild_system_instruction(identidad, tono)
+        state = {'stored': None, 'window': None, 'chat': None}
+        
+        async def open_stream(lease):
+            client = self.client_pool.get(lease.key_id, lease.api_key)
+            
+            config = self._get_generation_config(tono, custom_config)
+            await self._run_blocking(self._apply_system_instruction, config, client, lease.key_id, model_real, system_instruction)
+            self._apply_timeout(config, deadline)
+            
+            state['chat'] = client.aio.chats.create(
+                model = model_real,
+                config = config,
+                history = state['window']
+            )
+            return await state['chat'].send_message_stream(message)
+        
+        async def on_complete():
+            await self._run_blocking(self._save_chat_history, session_id, state['chat'], state['stored'], state['window'])
+        
+        async def chunks(stream):
+            async with self._get_async_session_lock(session_id):
+                state['stored'], state['window'] = await self._run_blocking(self._load_chat_window, session_id, history)
+                estimate = await self._aestimate_request(model_alias, model_real, message, system_instruction, state['window'], tono, custom_config)
+                async for text in self._stream_chunks(stream, open_stream, model_alias, model_real, estimate, on_complete, deadline):
+                    yield text
+        
+        return AsyncGodartStream(chunks, model = model_alias, started_at = started_at)
+    
+    async def submit_batch_job(self, prompts, model=None, identidad=None, tono=None, custom_config=None, display_name=None, shards=None):
+        # Subir archivos y crear jobs usa el cliente síncrono: va a un hilo
+        return await self._run_blocking(self.batch_jobs.submit, list(prompts), model, identidad, tono, custom_config, display_name, shards)
+    
+    async def poll_batch_job(self, job_id):
+        return await self._run_blocking(self.batch_jobs.poll, job_id)
+    
+    async def iter_batch_results(self, job_id, wait=True, poll_interval=None, timeout=None):
+        deadline = time.monotonic() + timeout if timeout else None
+        delivered = set()
+        
+        while True:
+            # Consulta y descarga van a un hilo; la espera entre consultas no ocupa ninguno
+            results, done = await self._run_blocking(self.batch_jobs.poll_results, job_id, delivered)
+            for index, result in results:
+                yield index, result
+            if done or not wait:
+                return
+            await asyncio.sleep(self.batch_jobs.poll_delay(job_id, poll_interval, deadline))
+    
+    async def cancel_batch_job(self, job_id):
+        return await self._run_blocking(self.batch_jobs.cancel, job_id)
+    
+    async def list_batch_jobs(self):
+        return await self._run_blocking(self.batch_jobs.list)
+    
+    async def aclose(self):
+        self.client = None
+        await self.client_pool.aclose()
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclose()
\ No newline at end of file
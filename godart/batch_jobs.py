@@ -0,0 +1,424 @@
+# godart/batch_jobs.py
+import os
+import json
+import time
+import uuid
+import sqlite3
+import tempfile
+import threading
+from collections import OrderedDict
+from google.genai import types
+
+from .config import Config
+from .telemetry import logger
+
+
+
+
+
+# Estados de Gemini que ya no cambian; PARTIALLY_SUCCEEDED deja archivo de resultados igual que SUCCEEDED
+TERMINAL_STATES = ('JOB_STATE_SUCCEEDED', 'JOB_STATE_PARTIALLY_SUCCEEDED', 'JOB_STATE_FAILED', 'JOB_STATE_CANCELLED', 'JOB_STATE_EXPIRED')
+RESULT_STATES = ('JOB_STATE_SUCCEEDED', 'JOB_STATE_PARTIALLY_SUCCEEDED')
+
+
+def _state_name(state):
+    return getattr(state, 'value', state) or 'JOB_STATE_PENDING'
+
+
+def build_batch_line(key, prompt, system_instruction=None, generation_config=None):
+    # Una línea del JSONL del Batch API: {"key": ..., "request": GenerateContentRequest}
+    request = {'contents': [{'role': 'user', 'parts': [{'text': prompt}]}]}
+    if system_instruction:
+        request['system_instruction'] = {'parts': [{'text': system_instruction}]}
+    if generation_config:
+        request['generation_config'] = generation_config
+    return json.dumps({'key': str(key), 'request': request}, ensure_ascii=False)
+
+
+def parse_batch_results(data):
+    # Cada línea trae la key del prompt y "response" (GenerateContentResponse) o "error" (google.rpc.Status)
+    if isinstance(data, bytes):
+        data = data.decode('utf-8')
+    for line in data.splitlines():
+        if not line.strip():
+            continue
+        entry = json.loads(line)
+        key = entry.get('key')
+        error = entry.get('error')
+        if error:
+            if isinstance(error, dict):
+                error = f"{error.get('code')} {error.get('message')}" if error.get('code') else error.get('message')
+            yield key, Exception(f"[!!] Error en el batch job: {error}"), None
+            continue
+        response = types.GenerateContentResponse.model_validate(entry.get('response') or {})
+        text = response.text
+        if text is None:
+            yield key, Exception("[!!] Respuesta vacía en el batch job"), response.usage_metadata
+            continue
+        yield key, text, response.usage_metadata
+
+
+def job_summary(job):
+    shards = job['shards']
+    states = [shard['state'] for shard in shards]
+    if any(state not in TERMINAL_STATES for state in states):
+        state = 'running' if any(state == 'JOB_STATE_RUNNING' for state in states) else 'pending'
+    elif all(state == 'JOB_STATE_SUCCEEDED' for state in states):
+        state = 'succeeded'
+    elif any(state in RESULT_STATES for state in states):
+        state = 'partial'
+    elif all(state == 'JOB_STATE_CANCELLED' for state in states):
+        state = 'cancelled'
+    else:
+        state = 'failed'
+    
+    return {
+        'job_id': job['job_id'],
+        'model': job['model'],
+        'state': state,
+        'total': job['total'],
+        'finished': sum(shard['count'] for shard in shards if shard['state'] in TERMINAL_STATES),
+        'created_at': job['created_at'],
+        'shards': [
+            {
+                'name': shard['name'],
+                'key_id': shard['key_id'],
+                'state': shard['state'],
+                'prompts': shard['count'],
+                'error': shard['error']
+            }
+            for shard in shards
+        ]
+    }
+
+
+
+
+
+class MemoryBatchJobStore:
+    def __init__(self, max_jobs=None):
+        self.max_jobs = max_jobs or Config.BATCH_JOB_MAX_STORED
+        
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def load(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return json.loads(job) if job is not None else None
+    
+    def save(self, job):
+        with self._lock:
+            self._jobs[job['job_id']] = json.dumps(job, ensure_ascii=False)
+            self._jobs.move_to_end(job['job_id'])
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+    
+    def list(self):
+        with self._lock:
+            return [json.loads(job) for job in reversed(self._jobs.values())]
+    
+    def delete(self, job_id):
+        with self._lock:
+            return self._jobs.pop(job_id, None) is not None
+
+
+
+
+
+class SQLiteBatchJobStore:
+    # Los jobs tardan horas: el estado en disco permite consultar y recoger resultados desde otro proceso
+    def __init__(self, path):
+        self.path = path
+        
+        self._local = threading.local()
+        
+        conn = self._connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS godart_batch_jobs ('
+            'job_id TEXT PRIMARY KEY, job TEXT NOT NULL, created_at REAL NOT NULL, updated_at REAL NOT NULL)'
+        )
+        conn.commit()
+    
+    def _connect(self):
+        # sqlite3 no comparte conexiones entre hilos: una por hilo
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+    
+    def load(self, job_id):
+        row = self._connect().execute('SELECT job FROM godart_batch_jobs WHERE job_id = ?', (job_id,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+    
+    def save(self, job):
+        conn = self._connect()
+        conn.execute(
+            'INSERT OR REPLACE INTO godart_batch_jobs (job_id, job, created_at, updated_at) VALUES (?, ?, ?, ?)',
+            (job['job_id'], json.dumps(job, ensure_ascii=False), job['created_at'], time.time())
+        )
+        conn.commit()
+    
+    def list(self):
+        rows = self._connect().execute('SELECT job FROM godart_batch_jobs ORDER BY created_at DESC').fetchall()
+        return [json.loads(row[0]) for row in rows]
+    
+    def delete(self, job_id):
+        conn = self._connect()
+        cursor = conn.execute('DELETE FROM godart_batch_jobs WHERE job_id = ?', (job_id,))
+        conn.commit()
+        return cursor.rowcount > 0
+
+
+
+
+
+class BatchJobs:
+    # Jobs del Batch API de Gemini: sin cupo de RPM/TPM, resultados en horas. Un shard por key con su propio archivo JSONL
+    def __init__(self, manager, store=None, shard_size=None, poll_interval=None):
+        self.manager = manager
+        self.store = store
+        if self.store is None:
+            self.store = SQLiteBatchJobStore(Config.BATCH_JOB_STORE_PATH) if Config.BATCH_JOB_STORE_PATH else MemoryBatchJobStore()
+        self.shard_size = shard_size or Config.BATCH_JOB_SHARD_SIZE
+        self.poll_interval = poll_interval if poll_interval is not None else Config.BATCH_JOB_POLL_INTERVAL
+    
+    def _load(self, job_id):
+        job = self.store.load(job_id)
+        if job is None:
+            raise Exception(f"[!!] Batch job '{job_id}' no encontrado")
+        return job
+    
+    def _client_for(self, key_id):
+        # Archivos y jobs pertenecen al proyecto de la key que los creó: se consultan siempre con esa key
+        for force_refresh in (False, True):
+            for key_data in self.manager.supabase.get_all_available_keys(force_refresh=force_refresh):
+                if key_data['key_id'] == key_id:
+                    return self.manager.client_pool.get(key_id, key_data['api_key'])
+        raise Exception(f"[!!] La API key {key_id} del batch job ya no está en el pool")
+    
+    def _shard_bounds(self, total, keys, shards):
+        count = shards or -(-total // self.shard_size)
+        count = max(1, min(count, len(keys), total))
+        size, extra = divmod(total, count)
+        bounds = []
+        start = 0
+        for index in range(count):
+            end = start + size + (1 if index < extra else 0)
+            bounds.append((start, end))
+            start = end
+        return bounds
+    
+    def _upload_and_create(self, client, lines, model_real, display_name):
+        fd, path = tempfile.mkstemp(prefix='godart-batch-', suffix='.jsonl')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as handle:
+                handle.write('\n'.join(lines))
+            uploaded = client.files.upload(file=path, config=types.UploadFileConfig(display_name=display_name, mime_type='jsonl'))
+        finally:
+            os.unlink(path)
+        
+        batch = client.batches.create(model=model_real, src=uploaded.name, config=types.CreateBatchJobConfig(display_name=display_name))
+        return uploaded.name, batch
+    
+    def _submit_shard(self, job, index, keys, lines, start):
+        # Si la key falla (cuota de batch, key revocada) el shard pasa a la siguiente
+        display_name = f"{job['display_name']}-{index}"
+        last_error = None
+        for offset in range(len(keys)):
+            key_data = keys[(index + offset) % len(keys)]
+            client = self.manager.client_pool.get(key_data['key_id'], key_data['api_key'])
+            try:
+                input_file, batch = self._upload_and_create(client, lines, job['model_real'], display_name)
+            except Exception as e:
+                last_error = e
+                logger.warning(f"[!!] Error al crear el shard {index} del batch job con {key_data.get('account_name')}: {e}")
+                continue
+            
+            self.manager.telemetry.inc('batch_job_shards_total', model=job['model'], key_id=key_data['key_id'], state='submitted')
+            logger.info(f" - Shard {index} del batch job {job['job_id']} enviado con {key_data.get('account_name')}: {batch.name} ({len(lines)} prompts)")
+            return {
+                'index': index,
+                'key_id': key_data['key_id'],
+                'account_name': key_data.get('account_name'),
+                'start': start,
+                'count': len(lines),
+                'input_file': input_file,
+                'name': batch.name,
+                'state': _state_name(batch.state),
+                'result_file': getattr(getattr(batch, 'dest', None), 'file_name', None),
+                'error': None
+            }
+        raise last_error
+    
+    def submit(self, prompts, model=None, identidad=None, tono=None, custom_config=None, display_name=None, shards=None):
+        model_alias = model or Config.DEFAULT_MODEL
+        model_real = self.manager._get_model_real_name(model_alias)
+        if not model_real:
+            raise Exception(f"[!!] Modelo '{model_alias}' no configurado en Supabase")
+        
+        prompts = list(prompts)
+        if not prompts:
+            raise Exception("[!!] El batch job no tiene prompts")
+        
+        system_instruction = self.manager._build_system_instruction(identidad, tono)
+        generation_config = self.manager._get_generation_config(tono, custom_config).model_dump(mode='json', exclude_none=True)
+        
+        all_keys = self.manager.supabase.get_all_available_keys()
+        if not all_keys:
+            raise Exception("[!!] No hay API keys disponibles en el pool")
+        # Las keys en pausa por el circuit breaker van al final: el Batch API tiene su propia cuota
+        blocked = self.manager.key_health.blocked(model_alias)
+        keys = [k for k in all_keys if k['key_id'] not in blocked] + [k for k in all_keys if k['key_id'] in blocked]
+        
+        job_id = f"godart-batch-{uuid.uuid4().hex[:12]}"
+        job = {
+            'job_id': job_id,
+            'model': model_alias,
+            'model_real': model_real,
+            'display_name': display_name or job_id,
+            'total': len(prompts),
+            'created_at': time.time(),
+            'shards': []
+        }
+        
+        with self.manager.telemetry.span('batch_submit', model=model_alias):
+            for index, (start, end) in enumerate(self._shard_bounds(len(prompts), keys, shards)):
+                # La key de cada línea es el índice global del prompt
+                lines = [build_batch_line(position, prompts[position], system_instruction, generation_config) for position in range(start, end)]
+                try:
+                    shard = self._submit_shard(job, index, keys, lines, start)
+                except Exception as e:
+                    if not job['shards']:
+                        raise
+                    shard = {
+                        'index': index,
+                        'key_id': None,
+                        'account_name': None,
+                        'start': start,
+                        'count': end - start,
+                        'input_file': None,
+                        'name': None,
+                        'state': 'JOB_STATE_FAILED',
+                        'result_file': None,
+                        'error': str(e)[:500]
+                    }
+                job['shards'].append(shard)
+        
+        self.store.save(job)
+        return job_id
+    
+    def _refresh_shard(self, job, shard):
+        try:
+            batch = self._client_for(shard['key_id']).batches.get(name=shard['name'])
+        except Exception as e:
+            logger.warning(f"[!!] Error al consultar el shard {shard['index']} del batch job {job['job_id']}: {e}")
+            return False
+        
+        state = _state_name(batch.state)
+        if state == shard['state']:
+            return False
+        shard['state'] = state
+        dest = getattr(batch, 'dest', None)
+        shard['result_file'] = getattr(dest, 'file_name', None)
+        if batch.error is not None:
+            shard['error'] = str(batch.error.message or batch.error)[:500]
+        if state in TERMINAL_STATES:
+            self.manager.telemetry.inc('batch_job_shards_total', model=job['model'], key_id=shard['key_id'], state=state.replace('JOB_STATE_', '').lower())
+        return True
+    
+    def _refresh(self, job):
+        changed = False
+        for shard in job['shards']:
+            if shard['state'] not in TERMINAL_STATES:
+                changed = self._refresh_shard(job, shard) or changed
+        if changed:
+            self.store.save(job)
+        return job
+    
+    def poll(self, job_id):
+        return job_summary(self._refresh(self._load(job_id)))
+    
+    def _shard_results(self, job, shard):
+        positions = range(shard['start'], shard['start'] + shard['count'])
+        if shard['state'] not in RESULT_STATES or not shard['result_file']:
+            error = Exception(f"[!!] El shard {shard['index']} del batch job terminó en {shard['state']}: {shard['error'] or 'sin resultados'}")
+            for position in positions:
+                yield position, error
+            return
+        
+        try:
+            data = self._client_for(shard['key_id']).files.download(file=shard['result_file'])
+        except Exception as e:
+            logger.error(f"[!!] Error al descargar los resultados del shard {shard['index']} del batch job {job['job_id']}: {e}")
+            for position in positions:
+                yield position, e
+            return
+        
+        pending = set(positions)
+        for key, result, usage in parse_batch_results(data):
+            try:
+                position = int(key)
+            except (TypeError, ValueError):
+                continue
+            if position not in pending:
+                continue
+            pending.discard(position)
+            if usage is not None:
+                self.manager.telemetry.record_tokens(job['model'], shard['key_id'], usage)
+            yield position, result
+        
+        # Gemini no garantiza una línea por prompt: los que faltan se reportan como error
+        for position in sorted(pending):
+            yield position, Exception("[!!] El batch job no devolvió resultado para este prompt")
+    
+    def poll_results(self, job_id, delivered):
+        # Un paso de la espera: consulta el job y devuelve ([(índice, texto o Exception)], terminado) de los shards
+        # que terminaron y aún no están en delivered; delivered se actualiza para la siguiente vuelta
+        job = self._refresh(self._load(job_id))
+        results = []
+        for shard in job['shards']:
+            if shard['index'] in delivered or shard['state'] not in TERMINAL_STATES:
+                continue
+            delivered.add(shard['index'])
+            results.extend(self._shard_results(job, shard))
+        return results, len(delivered) == len(job['shards'])
+    
+    def poll_delay(self, job_id, poll_interval=None, deadline=None):
+        # Segundos hasta la siguiente consulta; TimeoutError si ya pasó el deadline (time.monotonic)
+        poll_interval = poll_interval if poll_interval is not None else self.poll_interval
+        if deadline is None:
+            return poll_interval
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"[!!] Se agotó el tiempo de espera del batch job {job_id}")
+        return min(poll_interval, remaining)
+    
+    def results(self, job_id, wait=True, poll_interval=None, timeout=None):
+        # Entrega (índice, texto o Exception) a medida que terminan los shards; el orden dentro de un shard es el del archivo
+        deadline = time.monotonic() + timeout if timeout else None
+        delivered = set()
+        
+        while True:
+            results, done = self.poll_results(job_id, delivered)
+            yield from results
+            if done or not wait:
+                return
+            time.sleep(self.poll_delay(job_id, poll_interval, deadline))
+    
+    def cancel(self, job_id):
+        job = self._load(job_id)
+        for shard in job['shards']:
+            if shard['state'] in TERMINAL_STATES:
+                continue
+            try:
+                self._client_for(shard['key_id']).batches.cancel(name=shard['name'])
+            except Exception as e:
+                logger.warning(f"[!!] Error al cancelar el shard {shard['index']} del batch job {job_id}: {e}")
+        return self.poll(job_id)
+    
+    def list(self):
+        return [job_summary(job) for job in self.store.list()]
\ No newline at end of file
@@ -0,0 +1,201 @@
+# godart/batch_runner.py
+import queue
+import threading
+
+from .config import Config
+from .key_lease import KeyLease
+from .telemetry import logger
+
+
+
+
+
+class BatchRunner:
+    def __init__(self, manager, keys, model_alias, model_real, system_instruction, tono=None, custom_config=None, lanes_per_key=1):
+        self.manager = manager
+        self.keys = keys
+        self.model_alias = model_alias
+        self.model_real = model_real
+        self.system_instruction = system_instruction
+        self.tono = tono
+        self.custom_config = custom_config
+        self.lanes_per_key = max(1, lanes_per_key)
+        
+        self.pending = queue.Queue()
+        self.results = queue.Queue()
+        self.stop_event = threading.Event()
+        
+        self._lanes_lock = threading.Lock()
+        self._live_lanes = 0
+    
+    def _build_config(self, client, key_id):
+        config = self.manager._get_generation_config(self.tono, self.custom_config)
+        return self.manager._apply_system_instruction(config, client, key_id, self.model_real, self.system_instruction)
+    
+    def _wait_for_capacity(self, tracker, estimated_tokens):
+        can_request, limit_type = tracker.can_make_request(estimated_tokens)
+        while not can_request and not self.stop_event.is_set():
+            # Una key sin cupo diario no se recupera durante el batch
+            if limit_type == "RPD":
+                return False
+            self.stop_event.wait(max(tracker.get_wait_time(limit_type, estimated_tokens), 0.001))
+            can_request, limit_type = tracker.can_make_request(estimated_tokens)
+        return can_request
+    
+    def _wait_for_circuit(self, key_id):
+        # Una key pausada por el circuit breaker espera su enfriamiento (Retry-After o backoff); aparcada por RPD sale del batch
+        health = self.manager.key_health
+        while not self.stop_event.is_set():
+            if health.parked(key_id, self.model_alias):
+                return False
+            wait_time = health.next_available(self.model_alias, [key_id])
+            if not wait_time:
+                return True
+            self.stop_event.wait(wait_time)
+        return False
+    
+    def _requeue(self, index, prompt, attempts, error):
+        # Cualquier error con el prompt en mano lo devuelve a la cola o lo reporta: nunca se pierde con la lane
+        if attempts + 1 < Config.MAX_RETRIES:
+            self.pending.put((index, prompt, attempts + 1))
+        else:
+            self.results.put((index, error))
+    
+    def _run_lane(self, key_data):
+        key_id = key_data['key_id']
+        try:
+            client = self.manager.client_pool.get(key_id, key_data['api_key'])
+            tracker = self.manager._get_or_create_tracker(key_id, self.model_alias)
+            config = self._build_config(client, key_id)
+            
+            while not self.stop_event.is_set():
+                # La lane solo toma un prompt cuando su key está activa y tiene capacidad en RPM
+                if not self._wait_for_circuit(key_id) or not self._wait_for_capacity(tracker, 0):
+                    break
+                
+                try:
+                    index, prompt, attempts = self.pending.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                
+                held = True
+                try:
+                    estimate = self.manager._estimate_request(
+                        self.model_alias,
+                        self.model_real,
+                        prompt,
+                        self.system_instruction,
+                        tono = self.tono,
+                        custom_config = self.custom_config
+                    )
+                    estimated_tokens = estimate.total
+                    reservation = tracker.acquire(estimated_tokens, timeout=0)
+                    if not reservation:
+                        self.pending.put((index, prompt, attempts))
+                        held = False
+                        if not self._wait_for_capacity(tracker, estimated_tokens):
+                            break
+                        continue
+                    
+                    lease = KeyLease(key_data, self.model_alias, tracker, reservation)
+                    self.manager.key_health.begin(key_id, self.model_alias)
+                    
+                    try:
+                        with self.manager.telemetry.span('gemini', model=self.model_alias, key_id=key_id):
+                            response = client.models.generate_content(
+                                model = self.model_real,
+                                contents = prompt,
+                                config = config
+                            )
+                    except Exception as e:
+                        error_msg = str(e)
+                        self.manager.supabase.log_request(key_id, False, error_msg, self.model_alias)
+                        self.manager._record_failure(lease, self.model_alias, error_msg, e)
+                        
+                        # Si falla el cache de contexto la lane sigue con instrucciones en línea
+                        if self.manager._discard_cached_context(lease, self.model_real, error_msg):
+                            config = self._build_config(client, key_id)
+                            self._requeue(index, prompt, attempts, e)
+                            continue
+                        
+                        if not self.manager._is_quota_error(error_msg):
+                            self.results.put((index, e))
+                            continue
+                        
+                        # El prompt vuelve a la cola para cualquier lane; esta espera la pausa de su key al inicio del ciclo
+                        # Solo sin cupo diario la key deja de usarse en el batch
+                        parked = self.manager.key_health.parked(key_id, self.model_alias)
+                        self.manager.telemetry.record_rotation(self.model_alias, key_id)
+                        self._requeue(index, prompt, attempts, e)
+                        if parked:
+                            logger.warning(f"[!!] Cuota diaria agotada: {key_data['account_name']}. Retirando lane del batch")
+                            break
+                        continue
+                    
+                    self.manager._record_usage(lease, response, estimate)
+                    self.manager.supabase.log_request(key_id, True, model=self.model_alias)
+                    self.results.put((index, response.text))
+                except Exception as e:
+                    # Estimador, tracker compartido (SQLite/Redis) o logging fallaron fuera de la llamada a Gemini
+                    logger.error(f"[!!] Error en lane del batch ({key_data['account_name']}): {e}")
+                    if held:
+                        self._requeue(index, prompt, attempts, e)
+        except Exception as e:
+            # La preparación de la lane o la espera de cupo fallaron: los prompts pendientes los toman otras lanes
+            logger.error(f"[!!] Lane del batch detenida ({key_data['account_name']}): {e}")
+        finally:
+            with self._lanes_lock:
+                self._live_lanes -= 1
+    
+    def _lanes_alive(self):
+        with self._lanes_lock:
+            return self._live_lanes > 0
+    
+    def _drain_pending(self):
+        while True:
+            try:
+                index, _, _ = self.pending.get_nowait()
+            except queue.Empty:
+                return
+            yield index, Exception("[!!] Todas las API keys del pool están agotadas")
+    
+    def run(self, prompts):
+        total = 0
+        for index, prompt in enumerate(prompts):
+            self.pending.put((index, prompt, 0))
+            total += 1
+        
+        # Las keys en pausa reciben lanes que esperan su enfriamiento; solo se omiten las aparcadas por RPD
+        lanes = []
+        for key_data in self.keys:
+            if self.manager.key_health.parked(key_data['key_id'], self.model_alias):
+                continue
+            for _ in range(self.lanes_per_key):
+                lanes.append(threading.Thread(target=self._run_lane, args=(key_data,), daemon=True))
+        
+        with self._lanes_lock:
+            self._live_lanes = len(lanes)
+        
+        for lane in lanes:
+            lane.start()
+        
+        received = 0
+        try:
+            while received < total:
+                try:
+                    index, result = self.results.get(timeout=0.1)
+                except queue.Empty:
+                    if not self._lanes_alive():
+                        # Vaciar resultados tardíos antes de marcar como fallidos los prompts restantes
+                        while not self.results.empty():
+                            received += 1
+                            yield self.results.get_nowait()
+                        for item in self._drain_pending():
+                            received += 1
+                            yield item
+                    continue
+                
+                received += 1
+                yield index, result
+        finally:
+            self.stop_event.set()
\ No newline at end of file
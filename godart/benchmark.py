@@ -0,0 +1,322 @@
+# godart/benchmark.py
+import gc
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from .config import Config
+from .sb_manager import SupabaseManager
+from .godart_manager import GodartManager
+from .async_manager import AsyncGodartManager
+from .client_pool import ClientPool
+from .telemetry import Telemetry, configure_logging
+from .fakes import FakeGeminiBackend, FakeGenaiClient, FakeSupabaseClient, backend_time
+
+
+
+
+
+WORKLOADS = ('single', 'batch', 'chat', 'concurrent', 'async')
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+def _mean(values):
+    return sum(values) / len(values) if values else None
+
+
+
+
+
+class Benchmark:
+    # Mide el overhead del lado cliente contra Gemini y Supabase falsos: overhead = tiempo del request - tiempo dentro de los fakes
+    def __init__(self, requests=200, keys=5, latency=0.02, jitter=0.0, supabase_latency=0.002, error_rate=0.0, rpm=None, exhausted_keys=0, workers=16, sessions=10, lanes_per_key=1, rotation_delay=0.0, warmup=10, memory=True, seed=1):
+        self.requests = requests
+        self.keys = keys
+        self.latency = latency
+        self.jitter = jitter
+        self.supabase_latency = supabase_latency
+        self.error_rate = error_rate
+        self.rpm = rpm
+        self.exhausted_keys = exhausted_keys
+        self.workers = workers
+        self.sessions = max(1, sessions)
+        self.lanes_per_key = lanes_per_key
+        self.rotation_delay = rotation_delay
+        self.warmup = warmup
+        self.memory = memory
+        self.seed = seed
+    
+    def _build(self, manager_class=GodartManager, **kwargs):
+        backend = FakeGeminiBackend(
+            latency = self.latency,
+            jitter = self.jitter,
+            error_rate = self.error_rate,
+            rpm = self.rpm,
+            exhausted_keys = [f"fake-api-key-{i}" for i in range(self.exhausted_keys)],
+            seed = self.seed
+        )
+        telemetry = Telemetry()
+        supabase = SupabaseManager(
+            telemetry = telemetry,
+            client = FakeSupabaseClient(keys=self.keys, latency=self.supabase_latency)
+        )
+        client_pool = ClientPool(client_factory=lambda api_key: FakeGenaiClient(api_key, backend))
+        manager = manager_class(supabase, client_pool=client_pool, telemetry=telemetry, **kwargs)
+        return manager, backend, telemetry
+    
+    def _timed(self, func, *args, **kwargs):
+        spent = [0.0]
+        token = backend_time.set(spent)
+        started = time.perf_counter()
+        try:
+            func(*args, **kwargs)
+            failed = False
+        except Exception:
+            failed = True
+        elapsed = time.perf_counter() - started
+        backend_time.reset(token)
+        return elapsed, elapsed - spent[0], failed
+    
+    async def _atimed(self, coro):
+        spent = [0.0]
+        backend_time.set(spent)
+        started = time.perf_counter()
+        try:
+            await coro
+            failed = False
+        except Exception:
+            failed = True
+        elapsed = time.perf_counter() - started
+        return elapsed, elapsed - spent[0], failed
+    
+    def _sequential(self, call, telemetry, count):
+        overheads = []
+        rotated = []
+        errors = 0
+        for index in range(count):
+            rotations = telemetry.total('rotations_total')
+            _, overhead, failed = self._timed(call, index)
+            overheads.append(overhead)
+            rotated.append(telemetry.total('rotations_total') - rotations)
+            errors += failed
+        return overheads, rotated, errors
+    
+    def _run_single(self, count):
+        manager, backend, telemetry = self._build()
+        call = lambda index: manager.make_request(f"Pregunta de prueba número {index}", use_cache=False)
+        self._sequential(call, telemetry, self.warmup)
+        return manager, backend, telemetry, lambda: self._sequential(call, telemetry, count)
+    
+    def _run_chat(self, count):
+        manager, backend, telemetry = self._build()
+        call = lambda index: manager.make_request_chat(f"Mensaje {index}", session_id=f"bench-{index % self.sessions}")
+        self._sequential(call, telemetry, self.warmup)
+        return manager, backend, telemetry, lambda: self._sequential(call, telemetry, count)
+    
+    def _run_concurrent(self, count):
+        manager, backend, telemetry = self._build()
+        
+        def workload():
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                timings = list(executor.map(
+                    lambda index: self._timed(manager.make_request, f"Pregunta concurrente {index}", use_cache=False),
+                    range(count)
+                ))
+            return [t[1] for t in timings], [], sum(t[2] for t in timings)
+        
+        self._sequential(lambda index: manager.make_request(f"warmup {index}", use_cache=False), telemetry, self.warmup)
+        return manager, backend, telemetry, workload
+    
+    def _run_batch(self, count):
+        manager, backend, telemetry = self._build()
+        lanes = self.keys * max(1, self.lanes_per_key)
+        
+        def workload():
+            # Las lanes corren en hilos propios: el overhead se reparte como tiempo de lane fuera de Gemini
+            busy = backend.busy_time
+            started = time.perf_counter()
+            results = manager.make_requests_batch(
+                [f"Prompt de lote {index}" for index in range(count)],
+                return_exceptions = True,
+                lanes_per_key = self.lanes_per_key
+            )
+            elapsed = time.perf_counter() - started
+            overhead = max(0.0, elapsed * lanes - (backend.busy_time - busy)) / max(1, count)
+            return [overhead], [], sum(isinstance(result, Exception) for result in results)
+        
+        manager.make_requests_batch([f"warmup {index}" for index in range(self.warmup)], return_exceptions=True)
+        return manager, backend, telemetry, workload
+    
+    def _run_async(self, count):
+        manager, backend, telemetry = self._build(AsyncGodartManager, max_concurrency=self.workers)
+        
+        async def gather(total, prefix):
+            # Mismo paralelismo que el workload concurrente: la espera en cola no cuenta como overhead
+            semaphore = asyncio.Semaphore(self.workers)
+            
+            async def timed(index):
+                async with semaphore:
+                    return await self._atimed(manager.make_request(f"{prefix} {index}", use_cache=False))
+            
+            timings = await asyncio.gather(*(timed(index) for index in range(total)))
+            return [t[1] for t in timings], [], sum(t[2] for t in timings)
+        
+        asyncio.run(gather(self.warmup, 'warmup'))
+        return manager, backend, telemetry, lambda: asyncio.run(gather(count, 'Pregunta async'))
+    
+    def _measure_memory(self, workload_name, count):
+        # Segunda pasada con tracemalloc para no inflar los tiempos de la primera
+        _, _, _, workload = getattr(self, f"_run_{workload_name}")(count)
+        gc.collect()
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            workload()
+            gc.collect()
+            after = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        return after - before
+    
+    def run_workload(self, workload_name):
+        if workload_name not in WORKLOADS:
+            raise ValueError(f"[!!] Workload desconocido: {workload_name}. Opciones: {', '.join(WORKLOADS)}")
+        
+        manager, backend, telemetry, workload = getattr(self, f"_run_{workload_name}")(self.requests)
+        backend.reset_stats()
+        telemetry.reset()
+        
+        started = time.perf_counter()
+        overheads, rotated, errors = workload()
+        elapsed = time.perf_counter() - started
+        manager.close()
+        manager.supabase.close()
+        
+        # Costo de rotar: overhead extra de los requests que rotaron, por rotación
+        rotation_cost = None
+        with_rotation = [(o, r) for o, r in zip(overheads, rotated) if r]
+        without_rotation = [o for o, r in zip(overheads, rotated) if not r]
+        if with_rotation and without_rotation:
+            extra = _mean([o for o, _ in with_rotation]) - _mean(without_rotation)
+            rotation_cost = extra / _mean([r for _, r in with_rotation])
+        
+        per_request = workload_name != 'batch'
+        return {
+            'workload': workload_name,
+            'requests': self.requests,
+            'errors': errors,
+            'seconds': round(elapsed, 4),
+            'throughput': round(self.requests / elapsed, 2) if elapsed else None,
+            'overhead_mean_ms': _ms(_mean(overheads)),
+            'overhead_p50_ms': _ms(percentile(overheads, 50)) if per_request else None,
+            'overhead_p99_ms': _ms(percentile(overheads, 99)) if per_request else None,
+            'rotations': telemetry.total('rotations_total'),
+            'rotation_cost_ms': _ms(rotation_cost),
+            'quota_errors': telemetry.total('quota_errors_total'),
+            'backend_calls': backend.calls,
+            'memory_growth_kb': round(self._measure_memory(workload_name, self.requests) / 1024, 1) if self.memory else None
+        }
+    
+    def run(self, workloads=WORKLOADS):
+        rotation_delay = Config.ROTATION_DELAY
+        Config.ROTATION_DELAY = self.rotation_delay
+        try:
+            return [self.run_workload(workload_name) for workload_name in workloads]
+        finally:
+            Config.ROTATION_DELAY = rotation_delay
+
+
+
+
+
+COLUMNS = (
+    ('workload', 'workload'),
+    ('requests', 'reqs'),
+    ('errors', 'err'),
+    ('throughput', 'req/s'),
+    ('overhead_mean_ms', 'mean ms'),
+    ('overhead_p50_ms', 'p50 ms'),
+    ('overhead_p99_ms', 'p99 ms'),
+    ('rotations', 'rot'),
+    ('rotation_cost_ms', 'ms/rot'),
+    ('quota_errors', '429'),
+    ('memory_growth_kb', 'mem KB')
+)
+
+
+def format_results(results):
+    rows = [[title for _, title in COLUMNS]]
+    for result in results:
+        rows.append(['-' if result[key] is None else str(result[key]) for key, _ in COLUMNS])
+    widths = [max(len(row[i]) for row in rows) for i in range(len(COLUMNS))]
+    return '\n'.join('  '.join(cell.rjust(width) for cell, width in zip(row, widths)) for row in rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m godart.benchmark', description='Benchmark offline de godart con Gemini y Supabase falsos')
+    parser.add_argument('--workloads', default=','.join(WORKLOADS), help='Lista separada por comas: ' + ', '.join(WORKLOADS))
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--keys', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.02, help='Latencia de Gemini falsa (segundos)')
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--supabase-latency', type=float, default=0.002)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Probabilidad de 429 inyectado por llamada')
+    parser.add_argument('--rpm', type=int, default=None, help='Cupo real por key en la Gemini falsa')
+    parser.add_argument('--exhausted-keys', type=int, default=0, help='Keys que siempre responden 429')
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--sessions', type=int, default=10)
+    parser.add_argument('--lanes-per-key', type=int, default=1)
+    parser.add_argument('--rotation-delay', type=float, default=0.0)
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--no-memory', action='store_true', help='Omite la pasada con tracemalloc')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--log-level', default='ERROR')
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args(argv)
+    
+    configure_logging(level=args.log_level, console=True)
+    benchmark = Benchmark(
+        requests = args.requests,
+        keys = args.keys,
+        latency = args.latency,
+        jitter = args.jitter,
+        supabase_latency = args.supabase_latency,
+        error_rate = args.error_rate,
+        rpm = args.rpm,
+        exhausted_keys = args.exhausted_keys,
+        workers = args.workers,
+        sessions = args.sessions,
+        lanes_per_key = args.lanes_per_key,
+        rotation_delay = args.rotation_delay,
+        warmup = args.warmup,
+        memory = not args.no_memory,
+        seed = args.seed
+    )
+    results = benchmark.run([name.strip() for name in args.workloads.split(',') if name.strip()])
+    
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(format_results(results))
+    return 0
+
+
+
+
+
+if __name__ == '__main__':
+    sys.exit(main())
\ No newline at end of file
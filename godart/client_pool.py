@@ -0,0 +1,133 @@
+# godart/client_pool.py
+import time
+import asyncio
+import threading
+from google import genai
+from collections import OrderedDict
+
+from .config import Config
+from .telemetry import logger
+
+
+
+
+
+class _PooledClient:
+    __slots__ = ('client', 'api_key', 'last_used')
+    
+    def __init__(self, client, api_key, last_used):
+        self.client = client
+        self.api_key = api_key
+        self.last_used = last_used
+
+
+
+
+
+class ClientPool:
+    def __init__(self, max_clients=None, idle_timeout=None, client_factory=None):
+        self.max_clients = max_clients or Config.CLIENT_POOL_MAX_SIZE
+        self.idle_timeout = idle_timeout if idle_timeout is not None else Config.CLIENT_POOL_IDLE_TIMEOUT
+        self.client_factory = client_factory or genai.Client
+        
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+        self._closing = set()
+    
+    def __len__(self):
+        with self._lock:
+            return len(self._clients)
+    
+    def _evict_locked(self, now):
+        # OrderedDict en orden LRU: los clientes más antiguos están al inicio
+        evicted = []
+        while self._clients:
+            key_id, entry = next(iter(self._clients.items()))
+            expired = self.idle_timeout and now - entry.last_used > self.idle_timeout
+            if not expired and len(self._clients) <= self.max_clients:
+                break
+            del self._clients[key_id]
+            evicted.append(entry.client)
+        return evicted
+    
+    def _close_client(self, client):
+        # Cierra los pools de conexiones httpx del cliente síncrono y de .aio en vez de esperar al GC
+        try:
+            client.close()
+        except Exception as e:
+            logger.error(f"[!!] Error al cerrar cliente: {e}")
+        
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        try:
+            if loop is not None:
+                # En el event loop el cliente asíncrono se cierra en una tarea aparte
+                task = loop.create_task(client.aio.aclose())
+                self._closing.add(task)
+                task.add_done_callback(self._closing.discard)
+            else:
+                asyncio.run(client.aio.aclose())
+        except Exception as e:
+            logger.error(f"[!!] Error al cerrar cliente: {e}")
+    
+    def get(self, key_id, api_key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._clients.get(key_id)
+            if entry and entry.api_key == api_key:
+                entry.last_used = now
+                self._clients.move_to_end(key_id)
+                return entry.client
+            
+            # Una key que cambió de api_key deja su cliente anterior para cerrar
+            evicted = [entry.client] if entry else []
+            client = self.client_factory(api_key=api_key)
+            self._clients[key_id] = _PooledClient(client, api_key, now)
+            self._clients.move_to_end(key_id)
+            evicted.extend(self._evict_locked(now))
+        
+        for old_client in evicted:
+            self._close_client(old_client)
+        return client
+    
+    def discard(self, key_id):
+        with self._lock:
+            entry = self._clients.pop(key_id, None)
+        if entry is None:
+            return False
+        self._close_client(entry.client)
+        return True
+    
+    def _drain(self):
+        with self._lock:
+            clients = [entry.client for entry in self._clients.values()]
+            self._clients.clear()
+        return clients
+    
+    def close(self):
+        for client in self._drain():
+            self._close_client(client)
+    
+    async def aclose(self):
+        for client in self._drain():
+            try:
+                await client.aio.aclose()
+                client.close()
+            except Exception as e:
+                logger.error(f"[!!] Error al cerrar cliente: {e}")
+        if self._closing:
+            await asyncio.gather(*self._closing, return_exceptions=True)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclose()
\ No newline at end of file
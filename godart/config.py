@@ -12,6 +12,118 @@ class Config:
     # Configuraciones por defecto
     DEFAULT_MODEL = "mini"
     MAX_RETRIES = 3
+    # Espera entre reintentos: ROTATION_DELAY * 2^intento con jitter, hasta ROTATION_DELAY_MAX
+    ROTATION_DELAY = 1
+    ROTATION_DELAY_MAX = 8
+    ACQUIRE_TIMEOUT = 30
+    
+    # Ruta SQLite para compartir los límites entre procesos del mismo host (None = por proceso)
+    RATE_LIMIT_SHARED_PATH = None
+    
+    # Selección de API keys: 'least_loaded', 'weighted', 'round_robin' o 'first_fit'
+    KEY_SELECTION_STRATEGY = 'weighted'
+    KEY_SCHEDULER_REFRESH = 1.0
+    
+    # Cache de respuestas (opcional)
+    RESPONSE_CACHE_TTL = 3600
+    RESPONSE_CACHE_MAX_ENTRIES = 1024
+    
+    # Circuit breaker por key y modelo: un 429 pausa la key (Retry-After o backoff) y luego se prueba con un request
+    CIRCUIT_FAILURE_THRESHOLD = 3
+    CIRCUIT_BASE_COOLDOWN = 5
+    CIRCUIT_MAX_COOLDOWN = 300
+    CIRCUIT_PROBE_TIMEOUT = 60
+    # Mientras la prueba de una key está en curso, los demás requests vuelven a mirar cada CIRCUIT_PROBE_POLL segundos
+    CIRCUIT_PROBE_POLL = 0.05
+    
+    # Fallback entre modelos: si el pedido no tiene cupo se usa el siguiente de su cadena
+    MODEL_ROUTING_ENABLED = False
+    MODEL_FALLBACKS = {
+        'max': ('base', 'mini'),
+        'base': ('mini',)
+    }
+    # Ruteo opcional por tokens estimados cuando no se indica modelo: ((4000, 'mini'), (32000, 'base'), (None, 'max'))
+    MODEL_SIZE_ROUTES = None
+    MODEL_FALLBACK_MAX_WAIT = 0
+    
+    # Timeout por request en segundos (None = sin límite)
+    REQUEST_TIMEOUT = None
+    
+    # Hedging: si un request supera el percentil de latencia del modelo se duplica en otra key
+    HEDGE_ENABLED = False
+    HEDGE_PERCENTILE = 95
+    HEDGE_MIN_SAMPLES = 20
+    HEDGE_MIN_DELAY = 0.05
+    HEDGE_WINDOW = 200
+    HEDGE_MAX_WORKERS = 32
+    
+    # Cola de requests: prioridades de mayor a menor, tamaño máximo por prioridad y requests en curso
+    QUEUE_PRIORITIES = ('interactive', 'batch')
+    QUEUE_MAX_SIZE = 1000
+    QUEUE_WORKERS = 16
+    QUEUE_MAX_IDLE_WAIT = 1.0
+    
+    # Batch API de Gemini para trabajos offline: prompts por shard (un shard por key), consulta y estado en SQLite (None = memoria)
+    BATCH_JOB_SHARD_SIZE = 5000
+    BATCH_JOB_POLL_INTERVAL = 30
+    BATCH_JOB_STORE_PATH = None
+    BATCH_JOB_MAX_STORED = 500
+    
+    # Requests idénticos simultáneos comparten una sola llamada a Gemini (opt-in: cambia la semántica de make_request)
+    COALESCE_REQUESTS = False
+    
+    # Sesiones de chat: límite de sesiones, expiración por inactividad (segundos) y presupuesto de historial
+    CHAT_MAX_SESSIONS = 1000
+    CHAT_SESSION_IDLE_TTL = 3600
+    CHAT_HISTORY_TOKEN_BUDGET = 8000
+    CHAT_HISTORY_SUMMARIZE = False
+    
+    # Cache explícito de instrucciones de sistema en Gemini, por API key (segundos). Opcional: Gemini cobra el almacenamiento
+    CONTEXT_CACHE_ENABLED = False
+    CONTEXT_CACHE_TTL = 3600
+    CONTEXT_CACHE_RENEW_BEFORE = 300
+    CONTEXT_CACHE_MIN_TOKENS = 1024
+    CONTEXT_CACHE_RETRY_AFTER = 600
+    
+    # Estimación de tokens: ratio aprendido, salida esperada por defecto y count_tokens opcional
+    TOKEN_ESTIMATE_LEARNING_RATE = 0.1
+    TOKEN_ESTIMATE_OUTPUT_DEFAULT = 256
+    TOKEN_ESTIMATE_MEDIA_TOKENS = 258
+    TOKEN_ESTIMATE_COUNT_TOKENS = False
+    TOKEN_ESTIMATE_COUNT_CACHE_SIZE = 4096
+    
+    # Telemetría: valores por defecto de configure_logging() (nivel del logger 'godart' y salida por stdout)
+    TELEMETRY_LOG_LEVEL = 'INFO'
+    TELEMETRY_CONSOLE = False
+    
+    # Configuraciones asíncronas
+    MAX_CONCURRENCY = 64
+    
+    # Cache del pool de API keys (segundos)
+    KEY_POOL_TTL = 30
+    KEY_POOL_REFRESH_AHEAD = 0.8
+    
+    # Alias de modelo que Supabase no tiene: se recuerda la ausencia para no consultarlo en cada request (segundos)
+    MODEL_CONFIG_MISS_TTL = 60
+    
+    # Precarga y snapshot en disco de modelos, contextos y keys (contiene API keys)
+    SUPABASE_PRELOAD_MODELS = ('mini', 'base', 'max')
+    SUPABASE_SNAPSHOT_PATH = None
+    SUPABASE_SNAPSHOT_MAX_AGE = 86400
+    
+    # Pool de clientes genai por API key
+    CLIENT_POOL_MAX_SIZE = 64
+    CLIENT_POOL_IDLE_TIMEOUT = 900
+    
+    # Logging de requests en lotes (fuera del camino crítico)
+    LOG_BUFFERED = True
+    LOG_BATCH_SIZE = 100
+    LOG_FLUSH_INTERVAL = 2.0
+    LOG_MAX_QUEUE = 10000
+    LOG_OVERFLOW_POLICY = 'drop_oldest'
+    LOG_SPILL_PATH = None
+    LOG_FLUSH_RETRIES = 3
+    LOG_FLUSH_RETRY_DELAY = 0.5
     
     # Configuraciones de generación optimizadas
     DEFAULT_TEMPERATURE = 0.85
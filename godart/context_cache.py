@@ -0,0 +1,165 @@
+# godart/context_cache.py
+import time
+import hashlib
+import threading
+from google.genai import types
+
+from .config import Config
+from .telemetry import logger
+
+
+
+
+
+class _CachedContext:
+    __slots__ = ('name', 'client', 'key_id', 'model', 'expires_at')
+    
+    def __init__(self, name, client, key_id, model, expires_at):
+        self.name = name
+        self.client = client
+        self.key_id = key_id
+        self.model = model
+        self.expires_at = expires_at
+
+
+
+
+
+class ContextCache:
+    def __init__(self, ttl=None, renew_before=None, min_tokens=None, retry_after=None):
+        self.ttl = ttl or Config.CONTEXT_CACHE_TTL
+        self.renew_before = renew_before if renew_before is not None else Config.CONTEXT_CACHE_RENEW_BEFORE
+        self.min_tokens = min_tokens if min_tokens is not None else Config.CONTEXT_CACHE_MIN_TOKENS
+        self.retry_after = retry_after if retry_after is not None else Config.CONTEXT_CACHE_RETRY_AFTER
+        
+        self.hits = 0
+        self.created = 0
+        self.renewed = 0
+        self.fallbacks = 0
+        
+        self._entries = {}
+        self._failed = {}
+        self._version = None
+        self._lock = threading.Lock()
+        self._slot_locks = {}
+    
+    @staticmethod
+    def is_cache_error(error_msg):
+        error_msg = error_msg.lower()
+        return any(x in error_msg for x in ['cachedcontent', 'cached_content', 'cached content'])
+    
+    def _expiry(self, cached):
+        expire_time = getattr(cached, 'expire_time', None)
+        if expire_time:
+            return expire_time.timestamp()
+        return time.time() + self.ttl
+    
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+    
+    def _slot_lock(self, slot):
+        with self._lock:
+            return self._slot_locks.setdefault(slot, threading.Lock())
+    
+    def _sync_version(self, version):
+        # Si cambian los contextos en Supabase, los caches anteriores ya no sirven
+        if version is None or version == self._version:
+            return
+        with self._lock:
+            if version == self._version:
+                return
+            stale = list(self._entries.values())
+            self._entries.clear()
+            self._version = version
+        self._delete_remote(stale)
+    
+    def _delete_remote(self, entries):
+        for entry in entries:
+            try:
+                entry.client.caches.delete(name=entry.name)
+            except Exception as e:
+                logger.error(f"[!!] Error al eliminar cache de contexto {entry.name}: {e}")
+    
+    def _create(self, client, key_id, model, system_instruction):
+        cached = client.caches.create(
+            model = model,
+            config = types.CreateCachedContentConfig(
+                system_instruction = system_instruction,
+                ttl = f"{int(self.ttl)}s",
+                display_name = f"godart-{key_id}"
+            )
+        )
+        self._count('created')
+        logger.info(f" - Cache de contexto creado: {cached.name}")
+        return _CachedContext(cached.name, client, key_id, model, self._expiry(cached))
+    
+    def _renew(self, entry):
+        cached = entry.client.caches.update(
+            name = entry.name,
+            config = types.UpdateCachedContentConfig(ttl=f"{int(self.ttl)}s")
+        )
+        entry.expires_at = self._expiry(cached)
+        self._count('renewed')
+    
+    def get(self, client, key_id, model, system_instruction, estimated_tokens, version=None):
+        # Gemini exige un mínimo de tokens para cachear; por debajo se envían en línea
+        if not system_instruction or estimated_tokens < self.min_tokens:
+            return None
+        
+        self._sync_version(version)
+        
+        now = time.time()
+        if max(self._failed.get((key_id, model), 0), self._failed.get((key_id, None), 0)) > now:
+            self._count('fallbacks')
+            return None
+        
+        digest = hashlib.sha256(system_instruction.encode('utf-8')).hexdigest()
+        slot = (key_id, model, digest)
+        
+        # Un lock por combinación evita crear el mismo cache dos veces en paralelo
+        with self._slot_lock(slot):
+            entry = self._entries.get(slot)
+            try:
+                if entry is not None and entry.expires_at - now <= self.renew_before:
+                    if entry.expires_at > now + 1:
+                        self._renew(entry)
+                    else:
+                        entry = None
+                
+                if entry is None:
+                    entry = self._create(client, key_id, model, system_instruction)
+                    with self._lock:
+                        self._entries[slot] = entry
+                else:
+                    self._count('hits')
+                return entry.name
+            except Exception as e:
+                logger.warning(f"[!!] Cache de contexto no disponible, usando instrucciones en línea: {e}")
+                self.discard(key_id, model)
+                self._count('fallbacks')
+                return None
+    
+    def discard(self, key_id, model=None):
+        # Tras un error la combinación usa instrucciones en línea durante retry_after
+        with self._lock:
+            for slot in [s for s in self._entries if s[0] == key_id and (model is None or s[1] == model)]:
+                del self._entries[slot]
+            self._failed[(key_id, model)] = time.time() + self.retry_after
+    
+    def invalidate(self):
+        with self._lock:
+            stale = list(self._entries.values())
+            self._entries.clear()
+            self._failed.clear()
+        self._delete_remote(stale)
+    
+    def get_stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'created': self.created,
+                'renewed': self.renewed,
+                'fallbacks': self.fallbacks
+            }
\ No newline at end of file
@@ -0,0 +1,591 @@
+# godart/fakes.py
+import json
+import time
+import random
+import asyncio
+import datetime
+import threading
+import contextvars
+from types import SimpleNamespace
+from collections import deque
+from itertools import count
+from google.genai import types
+
+
+
+
+
+class FakeCaches:
+    # Sustituto local de client.caches para probar el cache de contexto sin llamar a Gemini
+    def __init__(self, min_tokens=0, fail_create=False):
+        self.min_tokens = min_tokens
+        self.fail_create = fail_create
+        self.calls = {'create': 0, 'get': 0, 'update': 0, 'delete': 0}
+        
+        self._contents = {}
+        self._seq = count(1)
+        self._lock = threading.Lock()
+    
+    def _parse_ttl(self, ttl):
+        return float(str(ttl).rstrip('s')) if ttl else 3600
+    
+    def _build(self, name, model, display_name, token_count, expires_at):
+        return types.CachedContent(
+            name = name,
+            model = model,
+            display_name = display_name,
+            expire_time = datetime.datetime.fromtimestamp(expires_at, datetime.timezone.utc),
+            usage_metadata = types.CachedContentUsageMetadata(total_token_count=token_count)
+        )
+    
+    def _lookup_locked(self, name):
+        entry = self._contents.get(name)
+        if entry is None or entry['expires_at'] <= time.time():
+            self._contents.pop(name, None)
+            raise Exception(f"404 NOT_FOUND. CachedContent not found (or permission denied): {name}")
+        return entry
+    
+    def create(self, model, config=None):
+        with self._lock:
+            self.calls['create'] += 1
+            if self.fail_create:
+                raise Exception("400 INVALID_ARGUMENT. Model does not support cached content")
+            
+            system_instruction = getattr(config, 'system_instruction', None) or ''
+            token_count = len(str(system_instruction)) // 4
+            if token_count < self.min_tokens:
+                raise Exception(f"400 INVALID_ARGUMENT. Cached content is too small. total_token_count={token_count}, min_total_token_count={self.min_tokens}")
+            
+            name = f"cachedContents/fake-{next(self._seq)}"
+            self._contents[name] = {
+                'model': model,
+                'display_name': getattr(config, 'display_name', None),
+                'system_instruction': system_instruction,
+                'token_count': token_count,
+                'expires_at': time.time() + self._parse_ttl(getattr(config, 'ttl', None))
+            }
+            entry = self._contents[name]
+            return self._build(name, model, entry['display_name'], token_count, entry['expires_at'])
+    
+    def get(self, name, config=None):
+        with self._lock:
+            self.calls['get'] += 1
+            entry = self._lookup_locked(name)
+            return self._build(name, entry['model'], entry['display_name'], entry['token_count'], entry['expires_at'])
+    
+    def update(self, name, config=None):
+        with self._lock:
+            self.calls['update'] += 1
+            entry = self._lookup_locked(name)
+            entry['expires_at'] = time.time() + self._parse_ttl(getattr(config, 'ttl', None))
+            return self._build(name, entry['model'], entry['display_name'], entry['token_count'], entry['expires_at'])
+    
+    def delete(self, name, config=None):
+        with self._lock:
+            self.calls['delete'] += 1
+            self._lookup_locked(name)
+            del self._contents[name]
+    
+    def list(self, config=None):
+        with self._lock:
+            now = time.time()
+            return [
+                self._build(name, entry['model'], entry['display_name'], entry['token_count'], entry['expires_at'])
+                for name, entry in self._contents.items()
+                if entry['expires_at'] > now
+            ]
+    
+    def resolve(self, name):
+        # Lo usa un cliente falso al recibir config.cached_content: falla igual que Gemini si expiró
+        with self._lock:
+            return self._lookup_locked(name)['system_instruction']
+    
+    def expire(self, name=None):
+        with self._lock:
+            for entry_name, entry in self._contents.items():
+                if name is None or entry_name == name:
+                    entry['expires_at'] = 0
+
+
+
+
+
+# Tiempo pasado dentro de los fakes durante el request actual; el benchmark lo descuenta para medir overhead
+backend_time = contextvars.ContextVar('godart_fake_backend_time', default=None)
+
+
+def _add_backend_time(seconds):
+    spent = backend_time.get()
+    if spent is not None:
+        spent[0] += seconds
+
+
+def _text_of(contents):
+    if isinstance(contents, str):
+        return contents
+    if isinstance(contents, (list, tuple)):
+        return ' '.join(_text_of(item) for item in contents)
+    parts = getattr(contents, 'parts', None)
+    if parts is not None:
+        return ' '.join(part.text or '' for part in parts)
+    return str(contents)
+
+
+def _response(text, prompt_tokens, cached_tokens=0, final=True):
+    usage = None
+    if final:
+        output_tokens = max(1, len(text) // 4)
+        usage = types.GenerateContentResponseUsageMetadata(
+            prompt_token_count = prompt_tokens,
+            candidates_token_count = output_tokens,
+            cached_content_token_count = cached_tokens or None,
+            total_token_count = prompt_tokens + output_tokens
+        )
+    return types.GenerateContentResponse(
+        candidates = [types.Candidate(
+            content = types.Content(role='model', parts=[types.Part(text=text)]),
+            finish_reason = 'STOP' if final else None
+        )],
+        usage_metadata = usage
+    )
+
+
+
+
+
+class FakeGeminiBackend:
+    # Estado compartido por todos los clientes falsos: latencia, cupo real por key y 429 inyectados
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, rpm=None, exhausted_keys=None, stream_chunks=4, reply_chars=200, seed=None, key_latency=None, batch_latency=0.0):
+        self.latency = latency
+        self.key_latency = dict(key_latency or {})
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rpm = rpm
+        self.exhausted_keys = set(exhausted_keys or [])
+        self.stream_chunks = max(1, stream_chunks)
+        self.reply_chars = reply_chars
+        self.batch_latency = batch_latency
+        self.calls = 0
+        self.errors = 0
+        self.busy_time = 0.0
+        
+        self._random = random.Random(seed)
+        self._windows = {}
+        self._lock = threading.Lock()
+        # Archivos y batch jobs por nombre, con la key dueña: otra key recibe 404 como en Gemini
+        self.files = {}
+        self.batches = {}
+        self._seq = count(1)
+    
+    def admit(self, api_key):
+        # Decide si la llamada responde o falla con 429, como lo haría Gemini
+        now = time.monotonic()
+        with self._lock:
+            self.calls += 1
+            # Mismos textos que Gemini: cuota diaria agotada, límite por minuto con "retry in" y 429 genérico
+            error = None
+            if api_key in self.exhausted_keys:
+                error = "429 RESOURCE_EXHAUSTED. You exceeded your current quota, please check your plan and billing details. Quota exceeded for quotaId: GenerateRequestsPerDayPerProjectPerModel-FreeTier"
+            elif self.error_rate and self._random.random() < self.error_rate:
+                error = "429 RESOURCE_EXHAUSTED. You exceeded your current quota, please check your plan and billing details."
+            elif self.rpm:
+                window = self._windows.setdefault(api_key, deque())
+                while window and now - window[0] >= 60:
+                    window.popleft()
+                if len(window) >= self.rpm:
+                    error = f"429 RESOURCE_EXHAUSTED. Quota exceeded for quotaId: GenerateRequestsPerMinutePerProjectPerModel-FreeTier. Please retry in {window[0] + 60 - now:.1f}s."
+                else:
+                    window.append(now)
+            if error is not None:
+                self.errors += 1
+                raise Exception(error)
+            latency = self.key_latency.get(api_key, self.latency)
+            return max(0.0, latency + self._random.uniform(-self.jitter, self.jitter)) if self.jitter else latency
+    
+    def spent(self, seconds):
+        _add_backend_time(seconds)
+        with self._lock:
+            self.busy_time += seconds
+    
+    def reply(self, prompt_text):
+        return (f"Respuesta a: {prompt_text[:40]} " + 'lorem ipsum ' * self.reply_chars)[:self.reply_chars]
+    
+    def reset_stats(self):
+        with self._lock:
+            self.calls = 0
+            self.errors = 0
+            self.busy_time = 0.0
+            self._windows.clear()
+
+
+
+
+
+class _FakeCall:
+    def __init__(self, client):
+        self.client = client
+        self.backend = client.backend
+    
+    def _prompt_tokens(self, contents, config):
+        text = _text_of(contents)
+        system_instruction = getattr(config, 'system_instruction', None)
+        cached_name = getattr(config, 'cached_content', None)
+        cached_tokens = 0
+        if cached_name:
+            cached_tokens = len(self.client.caches.resolve(cached_name)) // 4
+        elif system_instruction:
+            text = f"{system_instruction} {text}"
+        return text, len(text) // 4 + cached_tokens, cached_tokens
+    
+    def _reply_to(self, contents):
+        # La respuesta cita el último mensaje (sin la instrucción de sistema): así se puede emparejar con su prompt
+        if isinstance(contents, (list, tuple)) and contents:
+            contents = contents[-1]
+        return self.backend.reply(_text_of(contents))
+    
+    def _timeout(self, config):
+        # Respeta config.http_options.timeout (milisegundos) como lo hace el SDK
+        timeout = getattr(getattr(config, 'http_options', None), 'timeout', None)
+        return timeout / 1000 if timeout else None
+    
+    def _run(self, contents, config):
+        delay = self.backend.admit(self.client.api_key)
+        _, prompt_tokens, cached_tokens = self._prompt_tokens(contents, config)
+        timeout = self._timeout(config)
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            self.backend.spent(timeout)
+            raise TimeoutError("The read operation timed out")
+        time.sleep(delay)
+        self.backend.spent(delay)
+        return _response(self._reply_to(contents), prompt_tokens, cached_tokens)
+    
+    def _chunks(self, contents, config):
+        delay = self.backend.admit(self.client.api_key)
+        _, prompt_tokens, cached_tokens = self._prompt_tokens(contents, config)
+        reply = self._reply_to(contents)
+        size = max(1, len(reply) // self.backend.stream_chunks)
+        pieces = [reply[i:i + size] for i in range(0, len(reply), size)]
+        return delay / len(pieces), pieces, prompt_tokens, cached_tokens
+    
+    def _stream(self, contents, config):
+        step, pieces, prompt_tokens, cached_tokens = self._chunks(contents, config)
+        for index, piece in enumerate(pieces):
+            time.sleep(step)
+            self.backend.spent(step)
+            yield _response(piece, prompt_tokens, cached_tokens, final=index == len(pieces) - 1)
+    
+    async def _arun(self, contents, config):
+        delay = self.backend.admit(self.client.api_key)
+        _, prompt_tokens, cached_tokens = self._prompt_tokens(contents, config)
+        timeout = self._timeout(config)
+        if timeout is not None and delay > timeout:
+            await asyncio.sleep(timeout)
+            self.backend.spent(timeout)
+            raise TimeoutError("The read operation timed out")
+        await asyncio.sleep(delay)
+        self.backend.spent(delay)
+        return _response(self._reply_to(contents), prompt_tokens, cached_tokens)
+    
+    async def _astream(self, contents, config):
+        step, pieces, prompt_tokens, cached_tokens = self._chunks(contents, config)
+        
+        async def chunks():
+            for index, piece in enumerate(pieces):
+                await asyncio.sleep(step)
+                self.backend.spent(step)
+                yield _response(piece, prompt_tokens, cached_tokens, final=index == len(pieces) - 1)
+        return chunks()
+
+
+
+
+
+class _FakeModels(_FakeCall):
+    def generate_content(self, model, contents, config=None):
+        return self._run(contents, config)
+    
+    def generate_content_stream(self, model, contents, config=None):
+        return self._stream(contents, config)
+    
+    def count_tokens(self, model, contents, config=None):
+        return types.CountTokensResponse(total_tokens=len(_text_of(contents)) // 4)
+
+
+class _FakeAsyncModels(_FakeCall):
+    async def generate_content(self, model, contents, config=None):
+        return await self._arun(contents, config)
+    
+    async def generate_content_stream(self, model, contents, config=None):
+        return await self._astream(contents, config)
+
+
+
+
+
+class _FakeChat(_FakeCall):
+    def __init__(self, client, config, history):
+        super().__init__(client)
+        self.config = config
+        self.history = [types.Content.model_validate(content) for content in history or []]
+    
+    def get_history(self, curated=False):
+        return list(self.history)
+    
+    def _turn(self, message):
+        self.history.append(types.Content(role='user', parts=[types.Part(text=_text_of(message))]))
+        return list(self.history)
+    
+    def _reply(self, text):
+        self.history.append(types.Content(role='model', parts=[types.Part(text=text)]))
+    
+    def send_message(self, message, config=None):
+        response = self._run(self._turn(message), self.config)
+        self._reply(response.text)
+        return response
+    
+    def send_message_stream(self, message, config=None):
+        parts = []
+        for chunk in self._stream(self._turn(message), self.config):
+            parts.append(chunk.text)
+            yield chunk
+        self._reply(''.join(parts))
+
+
+class _FakeAsyncChat(_FakeChat):
+    async def send_message(self, message, config=None):
+        response = await self._arun(self._turn(message), self.config)
+        self._reply(response.text)
+        return response
+    
+    async def send_message_stream(self, message, config=None):
+        stream = await self._astream(self._turn(message), self.config)
+        
+        async def chunks():
+            parts = []
+            async for chunk in stream:
+                parts.append(chunk.text)
+                yield chunk
+            self._reply(''.join(parts))
+        return chunks()
+
+
+class _FakeChats:
+    def __init__(self, client, chat_class):
+        self.client = client
+        self.chat_class = chat_class
+    
+    def create(self, model, config=None, history=None):
+        return self.chat_class(self.client, config, history)
+
+
+
+
+
+class _FakeFiles:
+    # Sustituto de client.files para el Batch API: guarda el contenido subido en el backend
+    def __init__(self, client):
+        self.client = client
+        self.backend = client.backend
+    
+    def _lookup(self, name):
+        entry = self.backend.files.get(name)
+        if entry is None or entry['owner'] != self.client.api_key:
+            raise Exception(f"404 NOT_FOUND. File {name} not found (or permission denied)")
+        return entry
+    
+    def upload(self, file, config=None):
+        with open(file, 'rb') as handle:
+            data = handle.read()
+        with self.backend._lock:
+            name = f"files/fake-{next(self.backend._seq)}"
+            self.backend.files[name] = {'owner': self.client.api_key, 'data': data}
+        return types.File(name=name, display_name=getattr(config, 'display_name', None), mime_type=getattr(config, 'mime_type', None), size_bytes=len(data))
+    
+    def download(self, file, config=None):
+        with self.backend._lock:
+            return self._lookup(getattr(file, 'name', file))['data']
+
+
+class _FakeBatches:
+    # Sustituto de client.batches: el job pasa a RUNNING y termina tras backend.batch_latency segundos
+    def __init__(self, client):
+        self.client = client
+        self.backend = client.backend
+    
+    def _lookup(self, name):
+        entry = self.backend.batches.get(name)
+        if entry is None or entry['owner'] != self.client.api_key:
+            raise Exception(f"404 NOT_FOUND. Batch {name} not found (or permission denied)")
+        return entry
+    
+    def _complete(self, entry):
+        lines = []
+        for line in entry['src'].decode('utf-8').splitlines():
+            request = json.loads(line)
+            contents = request['request']['contents']
+            text = ' '.join(part.get('text', '') for content in contents for part in content['parts'])
+            if self.backend.error_rate and self.backend._random.random() < self.backend.error_rate:
+                lines.append(json.dumps({'key': request['key'], 'error': {'code': 500, 'message': 'Internal error encountered.', 'status': 'INTERNAL'}}))
+                continue
+            response = _response(self.backend.reply(text), len(text) // 4)
+            lines.append(json.dumps({'key': request['key'], 'response': response.model_dump(mode='json', by_alias=True, exclude_none=True)}))
+        name = f"files/fake-{next(self.backend._seq)}"
+        self.backend.files[name] = {'owner': entry['owner'], 'data': '\n'.join(lines).encode('utf-8')}
+        entry['result_file'] = name
+        entry['state'] = 'JOB_STATE_SUCCEEDED'
+    
+    def _build(self, name, entry):
+        elapsed = time.monotonic() - entry['created_at']
+        if entry['state'] in ('JOB_STATE_PENDING', 'JOB_STATE_RUNNING'):
+            if elapsed >= self.backend.batch_latency:
+                self._complete(entry)
+            elif elapsed >= self.backend.batch_latency / 2:
+                entry['state'] = 'JOB_STATE_RUNNING'
+        dest = types.BatchJobDestination(file_name=entry['result_file']) if entry['result_file'] else None
+        return types.BatchJob(name=name, display_name=entry['display_name'], model=entry['model'], state=entry['state'], dest=dest)
+    
+    def create(self, model, src, config=None):
+        with self.backend._lock:
+            if self.client.api_key in self.backend.exhausted_keys:
+                raise Exception("429 RESOURCE_EXHAUSTED. Quota exceeded for quotaId: BatchEnqueuedTokensPerDayPerProjectPerModel")
+            source = self.backend.files.get(src)
+            if source is None or source['owner'] != self.client.api_key:
+                raise Exception(f"400 INVALID_ARGUMENT. Input file {src} not found")
+            name = f"batches/fake-{next(self.backend._seq)}"
+            self.backend.batches[name] = {
+                'owner': self.client.api_key,
+                'model': model,
+                'display_name': getattr(config, 'display_name', None),
+                'src': source['data'],
+                'state': 'JOB_STATE_PENDING',
+                'result_file': None,
+                'created_at': time.monotonic()
+            }
+            return self._build(name, self.backend.batches[name])
+    
+    def get(self, name, config=None):
+        with self.backend._lock:
+            return self._build(name, self._lookup(name))
+    
+    def cancel(self, name, config=None):
+        with self.backend._lock:
+            entry = self._lookup(name)
+            if entry['state'] in ('JOB_STATE_PENDING', 'JOB_STATE_RUNNING'):
+                entry['state'] = 'JOB_STATE_CANCELLED'
+    
+    def list(self, config=None):
+        with self.backend._lock:
+            return [self._build(name, entry) for name, entry in self.backend.batches.items() if entry['owner'] == self.client.api_key]
+
+
+
+
+
+class _FakeAsyncClient:
+    def __init__(self, client):
+        self.models = _FakeAsyncModels(client)
+        self.chats = _FakeChats(client, _FakeAsyncChat)
+        self.caches = client.caches
+        self.closed = False
+    
+    async def aclose(self):
+        self.closed = True
+
+
+class FakeGenaiClient:
+    # Sustituto de genai.Client: ClientPool(client_factory=lambda api_key: FakeGenaiClient(api_key, backend))
+    def __init__(self, api_key=None, backend=None):
+        self.api_key = api_key
+        self.backend = backend if backend is not None else FakeGeminiBackend()
+        self.caches = FakeCaches()
+        self.models = _FakeModels(self)
+        self.chats = _FakeChats(self, _FakeChat)
+        self.files = _FakeFiles(self)
+        self.batches = _FakeBatches(self)
+        self.aio = _FakeAsyncClient(self)
+        self.closed = False
+    
+    def close(self):
+        self.closed = True
+
+
+
+
+
+class _FakeRPC:
+    def __init__(self, supabase, name, params):
+        self.supabase = supabase
+        self.name = name
+        self.params = params or {}
+    
+    def execute(self):
+        return self.supabase._execute(self.name, self.params)
+
+
+class FakeSupabaseClient:
+    # Responde las RPC que usa SupabaseManager: SupabaseManager(client=FakeSupabaseClient())
+    def __init__(self, keys=5, models=None, contexts=None, latency=0.0, bulk_rpcs=True):
+        self.keys = keys if isinstance(keys, list) else [
+            {'key_id': f"fake-key-{i}", 'api_key': f"fake-api-key-{i}", 'account_name': f"fake-{i}"}
+            for i in range(keys)
+        ]
+        self.models = models or {
+            alias: {'model_alias': alias, 'model_real_name': f"gemini-fake-{alias}", 'rpm_limit': 100000, 'tpm_limit': 100000000, 'rpd_limit': 10000000}
+            for alias in ('mini', 'base', 'max')
+        }
+        self.contexts = contexts or {'identity_default': 'Eres Godart, un asistente útil y directo.'}
+        self.latency = latency
+        self.bulk_rpcs = bulk_rpcs
+        self.calls = {}
+        self.logs = []
+        
+        self._lock = threading.Lock()
+    
+    def rpc(self, name, params=None):
+        return _FakeRPC(self, name, params)
+    
+    def _missing(self, name):
+        return Exception(f"{{'code': 'PGRST202', 'message': 'Could not find the function public.{name} without parameters in the schema cache'}}")
+    
+    def _execute(self, name, params):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+        
+        if name == 'get_godart_model_config':
+            config = self.models.get(params.get('p_model_alias'))
+            data = [config] if config else []
+        elif name == 'get_all_godart_model_configs':
+            if not self.bulk_rpcs:
+                raise self._missing(name)
+            data = list(self.models.values())
+        elif name == 'get_godart_context':
+            content = self.contexts.get(params.get('p_context_key'))
+            data = [{'context_content': content}] if content else []
+        elif name == 'get_all_godart_tones':
+            data = [{'context_key': key, 'context_content': value} for key, value in self.contexts.items() if key != 'identity_default']
+        elif name == 'get_next_available_godart_key':
+            data = self.keys[:1]
+        elif name == 'get_all_available_godart_keys':
+            data = list(self.keys)
+        elif name == 'log_godart_request':
+            with self._lock:
+                self.logs.append(dict(params))
+            data = []
+        elif name == 'log_godart_requests_bulk':
+            if not self.bulk_rpcs:
+                raise self._missing(name)
+            with self._lock:
+                self.logs.extend(params.get('p_logs') or [])
+            data = []
+        elif name == 'get_godart_keys_stats':
+            with self._lock:
+                data = [
+                    {'key_id': key['key_id'], 'account_name': key['account_name'], 'requests': sum(1 for log in self.logs if str(log.get('p_key_id', log.get('key_id'))) == key['key_id'])}
+                    for key in self.keys
+                ]
+        else:
+            raise self._missing(name)
+        return SimpleNamespace(data=data)
\ No newline at end of file
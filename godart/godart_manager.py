@@ -1,93 +1,86 @@
 # godart/godart_manager.py
 import time
-from google import genai
-from collections import deque
+import random
+import weakref
+import logging
+import threading
+import contextvars
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from google.genai import types
 
 from .config import Config
 from .sb_manager import SupabaseManager
-
-
-
-
-
-class RateLimitTracker:
-    def __init__(self, rpm_limit, tpm_limit):
-        self.rpm_limit = rpm_limit
-        self.tpm_limit = tpm_limit
-        
-        self.request_times = deque()
-        self.token_usage = deque()
-    
-    def _clean_old_entries(self):
-        current_time = time.time()
-        cutoff_time = current_time - 60
-        
-        while self.request_times and self.request_times[0] < cutoff_time:
-            self.request_times.popleft()
-        
-        while self.token_usage and self.token_usage[0]['timestamp'] < cutoff_time:
-            self.token_usage.popleft()
-    
-    def can_make_request(self, estimated_tokens=0):
-        self._clean_old_entries()
-        
-        if len(self.request_times) >= self.rpm_limit:
-            return False, "RPM"
-        
-        current_tokens = sum(entry['tokens'] for entry in self.token_usage)
-        if current_tokens + estimated_tokens > self.tpm_limit:
-            return False, "TPM"
-        return True, None
-    
-    def record_request(self, tokens_used):
-        current_time = time.time()
-        
-        self.request_times.append(current_time)
-        self.token_usage.append({
-            'timestamp': current_time,
-            'tokens': tokens_used
-        })
-        self._clean_old_entries()
-    
-    def get_wait_time(self, limit_type):
-        if limit_type == "RPM":
-            if self.request_times:
-                oldest_request = self.request_times[0]
-                wait_time = 60 - (time.time() - oldest_request)
-                return max(0, wait_time)
-        elif limit_type == "TPM":
-            if self.token_usage:
-                oldest_token = self.token_usage[0]['timestamp']
-                wait_time = 60 - (time.time() - oldest_token)
-                return max(0, wait_time)
-        return 0
-    
-    def get_current_usage(self):
-        self._clean_old_entries()
-        current_tokens = sum(entry['tokens'] for entry in self.token_usage)
-        return {
-            'requests': len(self.request_times),
-            'tokens': current_tokens,
-            'rpm_limit': self.rpm_limit,
-            'tpm_limit': self.tpm_limit
-        }
+from .batch_runner import BatchRunner
+from .batch_jobs import BatchJobs
+from .streaming import GodartStream
+from .client_pool import ClientPool
+from .key_lease import KeyLease
+from .key_scheduler import KeyScheduler
+from .key_health import KeyHealth, is_quota_error
+from .model_router import ModelRouter, ModelResponse
+from .response_cache import ResponseCache
+from .single_flight import SingleFlight
+from .hedging import HedgePolicy, resolve_deadline, remaining_time, time_left, deadline_passed
+from .context_cache import ContextCache
+from .token_estimator import TokenEstimator
+from .session_store import MemorySessionStore, serialize_history, trim_history
+from .rate_limiter import RateLimitTracker
+from .rate_backends import SQLiteRateLimitBackend, SharedRateLimitTracker
+from .telemetry import logger, get_telemetry
 
 
 
 
 
 class GodartManager:
-    def __init__(self, supabase_manager: SupabaseManager):
+    def __init__(self, supabase_manager: SupabaseManager, client_pool=None, key_scheduler=None, response_cache=None, session_store=None, history_token_budget=None, history_summarizer=None, context_cache=None, token_estimator=None, rate_limit_backend=None, telemetry=None, coalesce=None, hedge_policy=None, key_health=None, model_router=None, batch_job_store=None):
         self.supabase = supabase_manager
+        # Por defecto se comparte la telemetría del SupabaseManager para tener todas las fases juntas
+        self.telemetry = telemetry if telemetry is not None else getattr(supabase_manager, 'telemetry', None) or get_telemetry()
+        self.client_pool = client_pool if client_pool is not None else ClientPool()
+        self.key_scheduler = key_scheduler or KeyScheduler()
+        self.key_health = key_health if key_health is not None else KeyHealth()
+        self.model_router = model_router
+        if self.model_router is None and Config.MODEL_ROUTING_ENABLED:
+            self.model_router = ModelRouter()
+        self.response_cache = response_cache
+        self.single_flight = None
+        if coalesce if coalesce is not None else Config.COALESCE_REQUESTS:
+            self.single_flight = SingleFlight()
+        self.hedge_policy = hedge_policy
+        if self.hedge_policy is None and Config.HEDGE_ENABLED:
+            self.hedge_policy = HedgePolicy()
+        self._hedge_executor = None
+        self.token_estimator = token_estimator if token_estimator is not None else TokenEstimator()
+        self.context_cache = context_cache
+        if self.context_cache is None and Config.CONTEXT_CACHE_ENABLED:
+            self.context_cache = ContextCache()
+        self.session_store = session_store if session_store is not None else MemorySessionStore()
+        self.batch_jobs = BatchJobs(self, batch_job_store)
+        self.history_token_budget = history_token_budget if history_token_budget is not None else Config.CHAT_HISTORY_TOKEN_BUDGET
+        self.history_summarizer = history_summarizer
+        if self.history_summarizer is None and Config.CHAT_HISTORY_SUMMARIZE:
+            self.history_summarizer = self._summarize_history
+        self._history_summaries = OrderedDict()
         self.current_key = None
         self.current_key_id = None
         self.current_account = None
+        self.current_lease = None
         self.client = None
-        self.chat_sessions = {}
         
         self.rate_trackers = {}
+        self.rate_limit_backend = rate_limit_backend
+        if self.rate_limit_backend is None and Config.RATE_LIMIT_SHARED_PATH:
+            self.rate_limit_backend = SQLiteRateLimitBackend(Config.RATE_LIMIT_SHARED_PATH)
         self.attempted_keys = set()
+        
+        self._trackers_lock = threading.Lock()
+        self._sessions_lock = threading.Lock()
+        # Los locks de sesiones inactivas se liberan solos
+        self._session_locks = weakref.WeakValueDictionary()
+        self._current_lock = threading.Lock()
+        self._hedge_lock = threading.Lock()
     
     def _get_model_real_name(self, model_alias):
         model_config = self.supabase.get_model_config(model_alias)
@@ -106,18 +99,59 @@ class GodartManager:
         return {'rpm': 10, 'tpm': 100000, 'rpd': 500}
     
     def _get_or_create_tracker(self, key_id, model_alias):
-        if key_id not in self.rate_trackers:
-            limits = self._get_rate_limits(model_alias)
-            self.rate_trackers[key_id] = RateLimitTracker(
-                rpm_limit = limits['rpm'],
-                tpm_limit = limits['tpm']
-            )
-        return self.rate_trackers[key_id]
+        # Los límites de Gemini son por key y por modelo
+        tracker_key = (key_id, model_alias)
+        tracker = self.rate_trackers.get(tracker_key)
+        if tracker is not None:
+            return tracker
+        
+        limits = self._get_rate_limits(model_alias)
+        with self._trackers_lock:
+            tracker = self.rate_trackers.get(tracker_key)
+            if tracker is None:
+                if self.rate_limit_backend is not None:
+                    # Con backend compartido todos los procesos descuentan del mismo cupo
+                    tracker = SharedRateLimitTracker(
+                        self.rate_limit_backend,
+                        f"{key_id}:{model_alias}",
+                        rpm_limit = limits['rpm'],
+                        tpm_limit = limits['tpm'],
+                        rpd_limit = limits['rpd']
+                    )
+                else:
+                    tracker = RateLimitTracker(
+                        rpm_limit = limits['rpm'],
+                        tpm_limit = limits['tpm'],
+                        rpd_limit = limits['rpd']
+                    )
+                self.rate_trackers[tracker_key] = tracker
+        return tracker
+    
+    def _get_session_lock(self, session_id):
+        with self._sessions_lock:
+            return self._session_locks.setdefault(session_id, threading.RLock())
     
     def _estimate_tokens(self, prompt):
-        if isinstance(prompt, str):
-            return len(prompt) // 4
-        return 500
+        return self.token_estimator.estimate_text(prompt)
+    
+    def _estimate_request(self, model_alias, model_real, prompt, system_instruction=None, history=None, tono=None, custom_config=None):
+        # Entrada completa (instrucción de sistema, historial y prompt) más la salida esperada
+        client = None
+        if self.token_estimator.count_tokens:
+            all_keys = self.supabase.get_all_available_keys()
+            if all_keys:
+                client = self.client_pool.get(all_keys[0]['key_id'], all_keys[0]['api_key'])
+        
+        max_output_tokens = self._get_generation_config(tono, custom_config).max_output_tokens
+        return self.token_estimator.estimate(
+            model_alias,
+            prompt,
+            system_instruction = system_instruction,
+            history = history,
+            max_output_tokens = max_output_tokens,
+            client = client,
+            model_real = model_real
+        )
     
     def _build_system_instruction(self, identidad=None, tono=None):
         identity = identidad if identidad else self.supabase.get_identity()
@@ -132,54 +166,372 @@ class GodartManager:
         
         return identity
     
-    def get_available_key(self, model=None, estimated_tokens=0):
-        model = model or Config.DEFAULT_MODEL
+    def _apply_system_instruction(self, config, client, key_id, model_real, system_instruction):
+        cached_name = None
+        if self.context_cache is not None:
+            cached_name = self.context_cache.get(
+                client,
+                key_id,
+                model_real,
+                system_instruction,
+                self._estimate_tokens(system_instruction),
+                version = self.supabase.contexts_version
+            )
         
-        all_keys = self.supabase.get_all_available_keys()
+        # Con cache la identidad y el tono no se reenvían; sin él van en línea como siempre
+        if cached_name:
+            config.cached_content = cached_name
+        else:
+            config.system_instruction = system_instruction
+        return config
+    
+    def _discard_cached_context(self, lease, model_real, error_msg):
+        if self.context_cache is None or lease is None or not ContextCache.is_cache_error(error_msg):
+            return False
+        logger.warning(f"[!!] Cache de contexto inválido para {lease.account_name}")
+        self.context_cache.discard(lease.key_id, model_real)
+        return True
+    
+    def _summarize_history(self, contents):
+        transcript = '\n'.join(
+            f"{content.get('role', 'user')}: {' '.join(part.get('text') or '' for part in content.get('parts') or [])}"
+            for content in contents
+        )
+        prompt = f"Resume de forma breve los hechos y acuerdos importantes de esta conversación:\n\n{transcript}"
+        # Se llama a la versión síncrona explícitamente para que también funcione desde AsyncGodartManager
+        return GodartManager.make_request(self, prompt, use_cache=False)
+    
+    def _summarize_dropped(self, session_id, dropped):
+        # El resumen recuerda cuántos turnos cubre: en el siguiente turno solo se resume lo que salió de la ventana
+        with self._sessions_lock:
+            cached = self._history_summaries.get(session_id)
+        
+        pending = dropped
+        if cached is not None and cached[0] <= len(dropped):
+            covered, summary = cached
+            if covered == len(dropped):
+                return summary
+            pending = [{'role': 'user', 'parts': [{'text': f"Resumen previo:\n{summary}"}]}] + dropped[covered:]
         
+        summary = self.history_summarizer(pending)
+        if summary:
+            with self._sessions_lock:
+                self._history_summaries[session_id] = (len(dropped), summary)
+                self._history_summaries.move_to_end(session_id)
+                while len(self._history_summaries) > Config.CHAT_MAX_SESSIONS:
+                    self._history_summaries.popitem(last=False)
+        return summary
+    
+    def _load_chat_window(self, session_id, history=None):
+        stored = self.session_store.load(session_id)
+        if stored is None:
+            stored = serialize_history(history)
+        
+        # Solo los turnos recientes dentro del presupuesto se reenvían a Gemini; el store conserva el historial completo
+        summarizer = None
+        if self.history_summarizer is not None:
+            summarizer = lambda dropped: self._summarize_dropped(session_id, dropped)
+        return stored, trim_history(stored, self.history_token_budget, self._estimate_tokens, summarizer)
+    
+    def _save_chat_history(self, session_id, chat, stored, window):
+        # El chat se creó con la ventana: lo que sigue a ella es el turno nuevo, que se agrega al historial completo
+        try:
+            new_turns = serialize_history(chat.get_history())[len(window):]
+            self.session_store.save(session_id, list(stored) + new_turns)
+        except Exception as e:
+            logger.error(f"[!!] Error al guardar sesión de chat: {e}")
+    
+    def _try_select_key(self, all_keys, model, estimated_tokens, attempted_keys):
         if not all_keys:
-            print("[!!] No hay API keys disponibles en el pool")
-            return False
+            logger.error("[!!] No hay API keys disponibles en el pool")
+            return None, None, None
         
-        available_keys = [k for k in all_keys if k['key_id'] not in self.attempted_keys]
+        if len(attempted_keys) >= len(all_keys) and all(k['key_id'] in attempted_keys for k in all_keys):
+            logger.error("[!!] Se agotaron todas las API keys disponibles")
+            return None, None, None
         
-        if not available_keys:
-            print("[!!] Se agotaron todas las API keys disponibles")
-            return False
+        # Las keys con el circuito abierto se saltan sin gastar un request
+        exclude = attempted_keys
+        blocked = self.key_health.blocked(model)
+        if blocked:
+            exclude = attempted_keys | blocked
+            if all(k['key_id'] in exclude for k in all_keys):
+                return None, None, None
         
-        for key_data in available_keys:
-            key_id = key_data['key_id']
-            tracker = self._get_or_create_tracker(key_id, model)
-            
+        key_data, reservation, min_wait, soonest_key = self.key_scheduler.acquire(
+            model,
+            all_keys,
+            lambda key_id: self._get_or_create_tracker(key_id, model),
+            estimated_tokens = estimated_tokens,
+            exclude = exclude,
+            version = self.supabase.keys_version
+        )
+        
+        if not key_data:
+            return None, min_wait, soonest_key
+        
+        attempted_keys.add(key_data['key_id'])
+        self.key_health.begin(key_data['key_id'], model)
+        tracker = self._get_or_create_tracker(key_data['key_id'], model)
+        
+        # get_current_usage toma locks: solo se calcula si el nivel DEBUG está activo
+        if logger.isEnabledFor(logging.DEBUG):
+            usage = tracker.get_current_usage()
+            logger.debug(f" - Usando: {key_data['account_name']} | RPM: {usage['requests']}/{usage['rpm_limit']} | TPM: {usage['tokens']}/{usage['tpm_limit']} | RPD: {usage['requests_today']}/{usage['rpd_limit']}")
+        return KeyLease(key_data, model, tracker, reservation), 0, key_data
+    
+    def _circuit_wait(self, all_keys, model, attempted_keys):
+        # Segundos hasta que una key pausada por el circuit breaker acepte un request; None si ninguna está en pausa
+        blocked = self.key_health.blocked(model)
+        key_ids = [k['key_id'] for k in all_keys if k['key_id'] not in attempted_keys and k['key_id'] in blocked]
+        return self.key_health.next_available(model, key_ids) if key_ids else None
+    
+    def _free_slots(self, tracker, estimated_tokens):
+        # Cuántos requests más admite la key ahora mismo, aproximado desde su uso actual
+        usage = tracker.get_current_usage()
+        slots = usage['rpm_limit'] - usage['requests']
+        if usage['rpd_limit']:
+            slots = min(slots, usage['rpd_limit'] - usage['requests_today'])
+        if estimated_tokens:
+            slots = min(slots, (usage['tpm_limit'] - usage['tokens']) // estimated_tokens)
+        return max(1, slots)
+    
+    def _capacity_wait(self, model_alias, estimated_tokens=0, reserved=0):
+        # Segundos hasta que alguna key del modelo pueda atender el request según sus trackers y el circuit breaker.
+        # reserved: requests ya despachados (RequestQueue) que aún no tomaron su key; ocupan el cupo libre antes que este
+        all_keys = self.supabase.get_all_available_keys()
+        blocked = self.key_health.blocked(model_alias)
+        best = float('inf')
+        free = 0
+        for key_data in all_keys:
+            if key_data['key_id'] in blocked:
+                continue
+            tracker = self._get_or_create_tracker(key_data['key_id'], model_alias)
             can_request, limit_type = tracker.can_make_request(estimated_tokens)
-            
             if can_request:
-                self.current_key = key_data['api_key']
-                self.current_key_id = key_id
-                self.current_account = key_data['account_name']
-                self.client = genai.Client(api_key=self.current_key)
-                
-                self.attempted_keys.add(key_id)
-                
-                usage = tracker.get_current_usage()
-                print(f" - Usando: {self.current_account} | RPM: {usage['requests']}/{usage['rpm_limit']} | TPM: {usage['tokens']}/{usage['tpm_limit']}")
-                return True
+                if not reserved:
+                    return 0.0
+                free += self._free_slots(tracker, estimated_tokens)
+                if free > reserved:
+                    return 0.0
+                continue
+            best = min(best, tracker.get_wait_time(limit_type, estimated_tokens))
+        
+        if free:
+            # Todo el cupo libre está reservado: se libera al terminar un request despachado, que despierta a la cola
+            best = min(best, Config.QUEUE_MAX_IDLE_WAIT)
+        
+        if blocked:
+            paused = self.key_health.next_available(model_alias, [k['key_id'] for k in all_keys if k['key_id'] in blocked])
+            if paused is not None:
+                best = min(best, paused)
+        return best
+    
+    def _select_key(self, all_keys, model, estimated_tokens, attempted_keys, timeout=None):
+        timeout = Config.ACQUIRE_TIMEOUT if timeout is None else timeout
+        give_up_at = time.monotonic() + timeout
+        recheck = True
+        
+        while True:
+            lease, min_wait, soonest_key = self._try_select_key(all_keys, model, estimated_tokens, attempted_keys)
+            if lease or soonest_key:
+                break
+            
+            # Sin keys en límite de cupo puede quedar alguna pausada por el circuit breaker: se espera hasta el timeout
+            wait_time = self._circuit_wait(all_keys, model, attempted_keys)
+            if wait_time is None:
+                # La prueba de una key pudo terminar entre la selección y la consulta: se intenta una vez más
+                if not recheck:
+                    return None
+                recheck = False
+                continue
+            
+            remaining = give_up_at - time.monotonic()
+            if wait_time > remaining:
+                logger.info(f" - Todas las keys en pausa. Menor espera: {wait_time:.1f}s")
+                return None
+            if wait_time > self.key_health.probe_poll:
+                logger.info(f" - Todas las keys en pausa. Esperando {wait_time:.1f}s")
+            time.sleep(max(wait_time, 0.001))
+            recheck = True
+        
+        if lease:
+            return lease
+        
+        timeout = max(0.0, give_up_at - time.monotonic())
+        if min_wait > timeout:
+            logger.info(f" - Todas las keys en límite. Menor espera: {min_wait:.1f}s")
+            return None
+        
+        # Espera exactamente hasta que la key más próxima libere capacidad
+        logger.info(f" - Todas las keys en límite. Esperando {min_wait:.1f}s por {soonest_key['account_name']}")
+        tracker = self._get_or_create_tracker(soonest_key['key_id'], model)
+        reservation = tracker.acquire(estimated_tokens, timeout=timeout)
+        
+        if not reservation:
+            return None
+        
+        attempted_keys.add(soonest_key['key_id'])
+        self.key_health.begin(soonest_key['key_id'], model)
+        return KeyLease(soonest_key, model, tracker, reservation)
+    
+    def _remember_lease(self, lease):
+        # current_* solo informa la última key usada; los requests no dependen de estos atributos
+        with self._current_lock:
+            self.current_lease = lease
+            self.current_key = lease.api_key
+            self.current_key_id = lease.key_id
+            self.current_account = lease.account_name
+    
+    def _lease_key(self, model, estimated_tokens, attempted_keys, timeout=None):
+        with self.telemetry.span('key_selection', model=model) as span:
+            all_keys = self.supabase.get_all_available_keys()
+            lease = self._select_key(all_keys, model, estimated_tokens, attempted_keys, timeout)
+            if lease:
+                span.set_attribute('key_id', lease.key_id)
+                self._remember_lease(lease)
+            return lease
+    
+    def get_available_key(self, model=None, estimated_tokens=0):
+        model = model or Config.DEFAULT_MODEL
+        
+        lease = self._lease_key(model, estimated_tokens, self.attempted_keys)
+        
+        if not lease:
+            return False
+        
+        self.client = self.client_pool.get(lease.key_id, lease.api_key)
+        return True
+    
+    def _record_usage(self, lease, response, estimate=None):
+        usage = getattr(response, 'usage_metadata', None)
+        self.token_estimator.observe(estimate, usage)
+        self.telemetry.record_request(lease.model, lease.key_id, 'ok')
+        if self.key_health.record_success(lease.key_id, lease.model):
+            logger.info(f" - Key recuperada: {lease.account_name}")
+            self.telemetry.record_circuit(lease.model, lease.key_id, KeyHealth.CLOSED)
+        
+        # Sin usage_metadata la reserva conserva los tokens estimados
+        if usage and usage.total_token_count is not None:
+            total_tokens = usage.total_token_count
+            lease.settle(total_tokens)
+            self.telemetry.record_tokens(lease.model, lease.key_id, usage)
+            
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f" - Tokens: in={usage.prompt_token_count} out={usage.candidates_token_count} cached={usage.cached_content_token_count or 0} total={total_tokens}")
+    
+    def _is_quota_error(self, error_msg):
+        return is_quota_error(error_msg)
+    
+    def _record_failure(self, lease, model_alias, error_msg, error=None):
+        key_id = lease.key_id if lease else None
+        if self._is_quota_error(error_msg):
+            self.telemetry.record_request(model_alias, key_id, 'quota')
+            self.telemetry.record_quota_error(model_alias, key_id)
+        else:
+            self.telemetry.record_request(model_alias, key_id, 'error')
+        
+        if lease is None:
+            return
+        opened = self.key_health.record_failure(lease.key_id, model_alias, error_msg, error)
+        if opened:
+            state, cooldown = opened
+            if state == 'parked':
+                logger.warning(f"[!!] Cuota diaria agotada en {lease.account_name}. En pausa hasta el reinicio ({cooldown / 3600:.1f}h)")
+                # Sin cupo diario la key sale del pool hasta el reinicio, aunque Supabase la siga listando
+                self.supabase.invalidate_key(lease.key_id, until=time.time() + cooldown)
             else:
-                wait_time = tracker.get_wait_time(limit_type)
-                print(f" - {key_data['account_name']}: Límite {limit_type} alcanzado. Espera: {wait_time:.1f}s")
-        
-        min_wait = float('inf')
-        for key_data in available_keys:
-            key_id = key_data['key_id']
-            tracker = self._get_or_create_tracker(key_id, model)
-            _, limit_type = tracker.can_make_request(estimated_tokens)
-            if limit_type:
-                wait = tracker.get_wait_time(limit_type)
-                min_wait = min(min_wait, wait)
-        
-        if min_wait < float('inf') and min_wait > 0:
-            print(f" - Todas las keys en límite. Menor espera: {min_wait:.1f}s")
-        return False
+                logger.info(f" - Key en pausa por {cooldown:.1f}s: {lease.account_name}")
+            self.telemetry.record_circuit(model_alias, lease.key_id, state)
+    
+    def _record_rotation(self, lease, model_alias):
+        logger.info(" - Rotando a siguiente key del pool...")
+        self.telemetry.record_rotation(model_alias, lease.key_id if lease else None)
+    
+    def _retry_delay(self, deadline, attempt=0):
+        # Backoff exponencial con jitter completo: los reintentos simultáneos no llegan todos a la vez
+        delay = random.uniform(0, min(Config.ROTATION_DELAY_MAX, Config.ROTATION_DELAY * 2 ** attempt))
+        remaining = remaining_time(deadline)
+        return delay if remaining is None else min(delay, remaining)
+    
+    def _apply_timeout(self, config, deadline):
+        # El SDK corta la llamada HTTP cuando se acaba el tiempo restante del request
+        remaining = remaining_time(deadline)
+        if remaining is not None:
+            config.http_options = types.HttpOptions(timeout=max(1, int(remaining * 1000)))
+        return config
+    
+    def _get_hedge_executor(self):
+        with self._hedge_lock:
+            if self._hedge_executor is None:
+                self._hedge_executor = ThreadPoolExecutor(max_workers=Config.HEDGE_MAX_WORKERS, thread_name_prefix='godart-hedge')
+            return self._hedge_executor
+    
+    def _lease_hedge_key(self, model_alias, estimated_tokens, attempted_keys):
+        # Solo se duplica hacia una key distinta que tenga cupo ahora mismo; nunca se espera por una
+        if len(self.supabase.get_all_available_keys()) <= len(attempted_keys):
+            return None
+        return self._lease_key(model_alias, estimated_tokens, attempted_keys, 0)
+    
+    def _settle_hedge(self, lease, model_alias, future):
+        # La llamada que no se devolvió también consumió cupo: se registra como cualquier otra
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is None:
+            self._record_usage(lease, future.result())
+            self.supabase.log_request(lease.key_id, True, model=model_alias)
+            return
+        
+        error_msg = str(error)
+        self.supabase.log_request(lease.key_id, False, error_msg, model_alias)
+        self._record_failure(lease, model_alias, error_msg, error)
+    
+    def _hedged_call(self, generate, lease, model_alias, estimated_tokens, attempted_keys, deadline):
+        delay = self.hedge_policy.delay(model_alias)
+        if delay is None:
+            return generate(lease), lease
+        
+        executor = self._get_hedge_executor()
+        primary = executor.submit(contextvars.copy_context().run, generate, lease)
+        # Las esperas no lanzan al vencer el deadline: antes de salir cada intento en curso queda registrado
+        left = time_left(deadline)
+        done, _ = wait([primary], timeout=delay if left is None else min(delay, left))
+        if done:
+            return primary.result(), lease
+        
+        hedge_lease = None if deadline_passed(deadline) else self._lease_hedge_key(model_alias, estimated_tokens, attempted_keys)
+        if hedge_lease is None:
+            done, _ = wait([primary], timeout=time_left(deadline))
+            if not done:
+                primary.add_done_callback(lambda f: self._settle_hedge(lease, model_alias, f))
+                raise TimeoutError("[!!] Se agotó el tiempo del request")
+            return primary.result(), lease
+        
+        logger.info(f" - Request lento, duplicando en {hedge_lease.account_name}")
+        self.telemetry.record_hedge(model_alias)
+        hedge = executor.submit(contextvars.copy_context().run, generate, hedge_lease)
+        leases = {primary: lease, hedge: hedge_lease}
+        
+        pending = {primary, hedge}
+        winner = None
+        while pending and winner is None:
+            done, pending = wait(pending, timeout=time_left(deadline), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            winner = next((future for future in done if future.exception() is None), None)
+        self.hedge_policy.record(model_alias, winner is hedge)
+        
+        # Gana la primera respuesta válida; si ambas fallan se propaga el error del intento original.
+        # Las llamadas que no se devuelven se registran en sus trackers y logs al terminar
+        returned = winner or (primary if primary.done() else None)
+        for future, future_lease in leases.items():
+            if future is not returned:
+                future.add_done_callback(lambda f, l=future_lease: self._settle_hedge(l, model_alias, f))
+        
+        if returned is None:
+            raise TimeoutError("[!!] Se agotó el tiempo del request")
+        return returned.result(), leases[returned]
     
     def _get_generation_config(self, tono=None, custom_config=None):
         tone_key = tono if tono else 'default'
@@ -196,8 +548,55 @@ class GodartManager:
             stop_sequences = custom_config.get('stop_sequences') if custom_config else None
         )
     
-    def make_request(self, prompt, model=None, identidad=None, tono=None, custom_config=None):
+    def _get_cache_key(self, model_real, system_instruction, tono, custom_config, prompt, use_cache):
+        # Solo se cachean prompts de texto; contenidos multimodales siempre van a Gemini
+        if self.response_cache is None or not use_cache or not isinstance(prompt, str):
+            return None
+        config = self._get_generation_config(tono, custom_config)
+        return ResponseCache.make_key(model_real, system_instruction, config, prompt)
+    
+    def _get_flight_key(self, model_real, system_instruction, tono, custom_config, prompt, use_cache):
+        # Misma clave que el cache de respuestas, pero sin depender de que haya uno configurado.
+        # use_cache=False pide una respuesta propia: tampoco se comparte la de un request en curso
+        if self.single_flight is None or not use_cache or not isinstance(prompt, str):
+            return None
+        config = self._get_generation_config(tono, custom_config)
+        return ResponseCache.make_key(model_real, system_instruction, config, prompt)
+    
+    def _route_models(self, model, prompt):
+        # Devuelve el modelo pedido y el orden en que se intentan los de su cadena de fallback
         model_alias = model or Config.DEFAULT_MODEL
+        if self.model_router is None:
+            return model_alias, [model_alias]
+        estimated_tokens = self._estimate_tokens(prompt)
+        requested = self.model_router.select(model_alias, estimated_tokens, explicit=model is not None)
+        return requested, self.model_router.plan(self, requested, estimated_tokens)
+    
+    def _can_fall_back(self, error, models, index):
+        if index == len(models) - 1 or not self.model_router.should_fallback(error):
+            return False
+        logger.info(f" - Modelo {models[index]} sin cupo, usando {models[index + 1]}")
+        return True
+    
+    def _model_response(self, text, model_alias, requested):
+        if model_alias != requested:
+            self.telemetry.record_fallback(requested, model_alias)
+        return ModelResponse(text, model_alias, requested) if text is not None else None
+    
+    def make_request(self, prompt, model=None, identidad=None, tono=None, custom_config=None, use_cache=True, timeout=None, deadline=None):
+        deadline = resolve_deadline(timeout, deadline)
+        requested, models = self._route_models(model, prompt)
+        
+        for index, model_alias in enumerate(models):
+            try:
+                text = self._request_model(prompt, model_alias, identidad, tono, custom_config, use_cache, deadline)
+            except Exception as e:
+                if self._can_fall_back(e, models, index):
+                    continue
+                raise
+            return self._model_response(text, model_alias, requested)
+    
+    def _request_model(self, prompt, model_alias, identidad, tono, custom_config, use_cache, deadline):
         model_real = self._get_model_real_name(model_alias)
         
         if not model_real:
@@ -205,57 +604,111 @@ class GodartManager:
         
         system_instruction = self._build_system_instruction(identidad, tono)
         
-        self.attempted_keys.clear()
+        cache_key = self._get_cache_key(model_real, system_instruction, tono, custom_config, prompt, use_cache)
+        if cache_key:
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                return cached
         
-        estimated_tokens = self._estimate_tokens(prompt)
+        flight_key = self._get_flight_key(model_real, system_instruction, tono, custom_config, prompt, use_cache)
+        if flight_key is None:
+            return self._send_request(prompt, model_alias, model_real, system_instruction, tono, custom_config, cache_key, deadline)
+        
+        # Requests idénticos simultáneos comparten una sola llamada a Gemini
+        text, shared = self.single_flight.do(
+            flight_key,
+            lambda: self._send_request(prompt, model_alias, model_real, system_instruction, tono, custom_config, cache_key, deadline),
+            timeout = remaining_time(deadline)
+        )
+        if shared:
+            self.telemetry.record_coalesced(model_alias)
+        return text
+    
+    def _generate(self, lease, prompt, model_alias, model_real, system_instruction, tono, custom_config, deadline):
+        client = self.client_pool.get(lease.key_id, lease.api_key)
+        
+        config = self._get_generation_config(tono, custom_config)
+        self._apply_system_instruction(config, client, lease.key_id, model_real, system_instruction)
+        self._apply_timeout(config, deadline)
+        
+        with self.telemetry.span('gemini', model=model_alias, key_id=lease.key_id) as span:
+            response = client.models.generate_content(
+                model = model_real,
+                contents = prompt,
+                config = config
+            )
+        if self.hedge_policy is not None:
+            self.hedge_policy.observe(model_alias, span.duration)
+        return response
+    
+    def _send_request(self, prompt, model_alias, model_real, system_instruction, tono, custom_config, cache_key, deadline=None):
+        # Estado por llamada: varios hilos pueden compartir la misma instancia
+        attempted_keys = set()
+        lease = None
+        
+        estimate = self._estimate_request(model_alias, model_real, prompt, system_instruction, tono=tono, custom_config=custom_config)
+        estimated_tokens = estimate.total
         
         for attempt in range(Config.MAX_RETRIES):
+            remaining = remaining_time(deadline)
             try:
-                if not self.client and not self.get_available_key(model_alias, estimated_tokens):
-                    if not self.get_available_key(model_alias, estimated_tokens):
-                        raise Exception("[!!] No hay API keys disponibles que puedan procesar este request")
+                lease = self._lease_key(model_alias, estimated_tokens, attempted_keys, remaining)
+                if not lease:
+                    if deadline_passed(deadline):
+                        raise TimeoutError("[!!] Se agotó el tiempo del request")
+                    raise Exception("[!!] No hay API keys disponibles que puedan procesar este request")
                 
-                config = self._get_generation_config(tono, custom_config)
-                config.system_instruction = system_instruction
+                generate = lambda current: self._generate(current, prompt, model_alias, model_real, system_instruction, tono, custom_config, deadline)
+                if self.hedge_policy is not None:
+                    response, lease = self._hedged_call(generate, lease, model_alias, estimated_tokens, attempted_keys, deadline)
+                else:
+                    response = generate(lease)
                 
-                response = self.client.models.generate_content(
-                    model = model_real,
-                    contents = prompt,
-                    config = config
-                )
+                self._record_usage(lease, response, estimate)
                 
-                if hasattr(response, 'usage_metadata'):
-                    usage = response.usage_metadata
-                    total_tokens = usage.total_token_count
-                    
-                    tracker = self._get_or_create_tracker(self.current_key_id, model_alias)
-                    tracker.record_request(total_tokens)
-                    
-                    print(f" - Tokens: in={usage.prompt_token_count} out={usage.candidates_token_count} total={total_tokens}")
-                else:
-                    tracker = self._get_or_create_tracker(self.current_key_id, model_alias)
-                    tracker.record_request(estimated_tokens)
+                self.supabase.log_request(lease.key_id, True, model=model_alias)
                 
-                self.supabase.log_request(self.current_key_id, True, model=model_alias)
+                if cache_key and response.text is not None:
+                    self.response_cache.set(cache_key, response.text)
                 return response.text
             except Exception as e:
                 error_msg = str(e)
-                self.supabase.log_request(self.current_key_id, False, error_msg, model_alias)
+                key_id = lease.key_id if lease else None
+                self.supabase.log_request(key_id, False, error_msg, model_alias)
+                self._record_failure(lease, model_alias, error_msg, e)
                 
-                if any(x in error_msg.lower() for x in ['429', 'quota', 'resource_exhausted']):
-                    print(f"[!!] Key agotada: {self.current_account}")
-                    
-                    self.client = None
+                if deadline_passed(deadline) and not isinstance(e, TimeoutError):
+                    raise TimeoutError("[!!] Se agotó el tiempo del request") from e
+                
+                if self._discard_cached_context(lease, model_real, error_msg) and attempt < Config.MAX_RETRIES - 1:
+                    logger.info(" - Reintentando con instrucciones en línea...")
+                    attempted_keys.discard(lease.key_id)
+                    continue
+                
+                if self._is_quota_error(error_msg):
+                    logger.warning(f"[!!] Key agotada: {lease.account_name if lease else None}")
                     
                     if attempt < Config.MAX_RETRIES - 1:
-                        print(" - Rotando a siguiente key del pool...")
-                        time.sleep(1)
+                        self._record_rotation(lease, model_alias)
+                        time.sleep(self._retry_delay(deadline, attempt))
                         continue
                 raise e
         raise Exception("[!!] Todas las API keys del pool están agotadas")
     
-    def make_request_chat(self, message, session_id="default", model=None, identidad=None, tono=None, history=None, custom_config=None):
-        model_alias = model or Config.DEFAULT_MODEL
+    def make_request_chat(self, message, session_id="default", model=None, identidad=None, tono=None, history=None, custom_config=None, timeout=None, deadline=None):
+        deadline = resolve_deadline(timeout, deadline)
+        requested, models = self._route_models(model, message)
+        
+        for index, model_alias in enumerate(models):
+            try:
+                text = self._request_chat_model(message, session_id, model_alias, identidad, tono, history, custom_config, deadline)
+            except Exception as e:
+                if self._can_fall_back(e, models, index):
+                    continue
+                raise
+            return self._model_response(text, model_alias, requested)
+    
+    def _request_chat_model(self, message, session_id, model_alias, identidad, tono, history, custom_config, deadline):
         model_real = self._get_model_real_name(model_alias)
         
         if not model_real:
@@ -263,77 +716,288 @@ class GodartManager:
         
         system_instruction = self._build_system_instruction(identidad, tono)
         
-        self.attempted_keys.clear()
-        
-        estimated_tokens = self._estimate_tokens(message)
+        attempted_keys = set()
+        lease = None
         
-        for attempt in range(Config.MAX_RETRIES):
-            try:
-                if not self.client and not self.get_available_key(model_alias, estimated_tokens):
-                    if not self.get_available_key(model_alias, estimated_tokens):
+        # Los turnos de una misma sesión se serializan; sesiones distintas corren en paralelo
+        with self._get_session_lock(session_id):
+            stored, window = self._load_chat_window(session_id, history)
+            
+            estimate = self._estimate_request(model_alias, model_real, message, system_instruction, window, tono, custom_config)
+            estimated_tokens = estimate.total
+            
+            for attempt in range(Config.MAX_RETRIES):
+                try:
+                    lease = self._lease_key(model_alias, estimated_tokens, attempted_keys, remaining_time(deadline))
+                    if not lease:
+                        if deadline_passed(deadline):
+                            raise TimeoutError("[!!] Se agotó el tiempo del request")
                         raise Exception("[!!] No hay API keys disponibles que puedan procesar este request")
-                
-                if session_id not in self.chat_sessions:
+                    
+                    client = self.client_pool.get(lease.key_id, lease.api_key)
+                    
                     config = self._get_generation_config(tono, custom_config)
-                    config.system_instruction = system_instruction
+                    self._apply_system_instruction(config, client, lease.key_id, model_real, system_instruction)
+                    self._apply_timeout(config, deadline)
                     
-                    self.chat_sessions[session_id] = self.client.chats.create(
+                    # El chat se reconstruye desde el store en cada turno, así cualquier key o worker puede continuarlo
+                    chat = client.chats.create(
                         model = model_real,
                         config = config,
-                        history = history or []
+                        history = window
                     )
-                
-                chat = self.chat_sessions[session_id]
-                response = chat.send_message(message)
-                
-                if hasattr(response, 'usage_metadata'):
-                    usage = response.usage_metadata
-                    total_tokens = usage.total_token_count
+                    with self.telemetry.span('gemini', model=model_alias, key_id=lease.key_id):
+                        response = chat.send_message(message)
                     
-                    tracker = self._get_or_create_tracker(self.current_key_id, model_alias)
-                    tracker.record_request(total_tokens)
+                    self._record_usage(lease, response, estimate)
+                    self._save_chat_history(session_id, chat, stored, window)
                     
-                    print(f" - Tokens: in={usage.prompt_token_count} out={usage.candidates_token_count} total={total_tokens}")
-                else:
-                    tracker = self._get_or_create_tracker(self.current_key_id, model_alias)
-                    tracker.record_request(estimated_tokens)
+                    self.supabase.log_request(lease.key_id, True, model=model_alias)
+                    return response.text
+                except Exception as e:
+                    error_msg = str(e)
+                    key_id = lease.key_id if lease else None
+                    self.supabase.log_request(key_id, False, error_msg, model_alias)
+                    self._record_failure(lease, model_alias, error_msg, e)
+                    
+                    if deadline_passed(deadline) and not isinstance(e, TimeoutError):
+                        raise TimeoutError("[!!] Se agotó el tiempo del request") from e
+                    
+                    if self._discard_cached_context(lease, model_real, error_msg) and attempt < Config.MAX_RETRIES - 1:
+                        logger.info(" - Reintentando con instrucciones en línea...")
+                        attempted_keys.discard(lease.key_id)
+                        continue
+                    
+                    if self._is_quota_error(error_msg):
+                        logger.warning(f"[!!] Key agotada: {lease.account_name if lease else None}")
+                        
+                        if attempt < Config.MAX_RETRIES - 1:
+                            self._record_rotation(lease, model_alias)
+                            time.sleep(self._retry_delay(deadline, attempt))
+                            continue
+                    raise e
+            raise Exception("[!!] Todas las API keys del pool están agotadas")
+    
+    def _stream_chunks(self, stream, open_stream, model_alias, model_real, estimate, on_complete=None, deadline=None):
+        attempted_keys = set()
+        lease = None
+        estimated_tokens = estimate.total
+        
+        for attempt in range(Config.MAX_RETRIES):
+            yielded = False
+            remaining = remaining_time(deadline)
+            try:
+                lease = self._lease_key(model_alias, estimated_tokens, attempted_keys, remaining)
+                if not lease:
+                    if deadline_passed(deadline):
+                        raise TimeoutError("[!!] Se agotó el tiempo del request")
+                    raise Exception("[!!] No hay API keys disponibles que puedan procesar este request")
                 
-                self.supabase.log_request(self.current_key_id, True, model=model_alias)
-                return response.text
+                last_chunk = None
+                with self.telemetry.span('gemini', model=model_alias, key_id=lease.key_id) as span:
+                    for chunk in open_stream(lease):
+                        if chunk.usage_metadata:
+                            last_chunk = chunk
+                        if chunk.text:
+                            if not yielded:
+                                self.telemetry.record_ttft(model_alias, lease.key_id, span.duration)
+                            yielded = True
+                            yield chunk.text
+                        # El deadline cubre el stream completo, no solo la apertura
+                        if deadline_passed(deadline):
+                            raise TimeoutError("[!!] Se agotó el tiempo del request")
+                
+                # usage_metadata completo llega en el último chunk del stream
+                self._record_usage(lease, last_chunk, estimate)
+                stream.key_id = lease.key_id
+                stream.usage_metadata = last_chunk.usage_metadata if last_chunk else None
+                
+                if on_complete:
+                    on_complete()
+                
+                self.supabase.log_request(lease.key_id, True, model=model_alias)
+                return
             except Exception as e:
                 error_msg = str(e)
-                self.supabase.log_request(self.current_key_id, False, error_msg, model_alias)
+                key_id = lease.key_id if lease else None
+                self.supabase.log_request(key_id, False, error_msg, model_alias)
+                self._record_failure(lease, model_alias, error_msg, e)
                 
-                if any(x in error_msg.lower() for x in ['429', 'quota', 'resource_exhausted']):
-                    print(f"[!!] Key agotada: {self.current_account}")
-                    
-                    if session_id in self.chat_sessions:
-                        saved_history = self.chat_sessions[session_id].get_history()
-                        del self.chat_sessions[session_id]
-                    else:
-                        saved_history = None
-                    
-                    self.client = None
+                if deadline_passed(deadline) and not isinstance(e, TimeoutError):
+                    raise TimeoutError("[!!] Se agotó el tiempo del request") from e
+                
+                if self._discard_cached_context(lease, model_real, error_msg) and not yielded and attempt < Config.MAX_RETRIES - 1:
+                    logger.info(" - Reintentando con instrucciones en línea...")
+                    attempted_keys.discard(lease.key_id)
+                    continue
+                
+                # Solo se rota si aún no se envió texto al caller
+                if self._is_quota_error(error_msg) and not yielded:
+                    logger.warning(f"[!!] Key agotada: {lease.account_name if lease else None}")
                     
                     if attempt < Config.MAX_RETRIES - 1:
-                        if saved_history:
-                            history = saved_history
-                        print(" - Rotando a siguiente key del pool...")
-                        time.sleep(1)
+                        self._record_rotation(lease, model_alias)
+                        time.sleep(self._retry_delay(deadline, attempt))
                         continue
                 raise e
         raise Exception("[!!] Todas las API keys del pool están agotadas")
     
+    def make_request_stream(self, prompt, model=None, identidad=None, tono=None, custom_config=None, timeout=None, deadline=None):
+        started_at = time.perf_counter()
+        deadline = resolve_deadline(timeout, deadline)
+        # Un stream no cambia de modelo a mitad de respuesta: solo se elige el que tiene cupo ahora
+        model_alias = self._route_models(model, prompt)[1][0]
+        model_real = self._get_model_real_name(model_alias)
+        
+        if not model_real:
+            raise Exception(f"[!!] Modelo '{model_alias}' no configurado en Supabase")
+        
+        system_instruction = self._build_system_instruction(identidad, tono)
+        estimate = self._estimate_request(model_alias, model_real, prompt, system_instruction, tono=tono, custom_config=custom_config)
+        
+        def open_stream(lease):
+            client = self.client_pool.get(lease.key_id, lease.api_key)
+            
+            config = self._get_generation_config(tono, custom_config)
+            self._apply_system_instruction(config, client, lease.key_id, model_real, system_instruction)
+            self._apply_timeout(config, deadline)
+            
+            return client.models.generate_content_stream(
+                model = model_real,
+                contents = prompt,
+                config = config
+            )
+        
+        return GodartStream(
+            lambda stream: self._stream_chunks(stream, open_stream, model_alias, model_real, estimate, deadline=deadline),
+            model = model_alias,
+            started_at = started_at
+        )
+    
+    def make_request_chat_stream(self, message, session_id="default", model=None, identidad=None, tono=None, history=None, custom_config=None, timeout=None, deadline=None):
+        started_at = time.perf_counter()
+        deadline = resolve_deadline(timeout, deadline)
+        model_alias = self._route_models(model, message)[1][0]
+        model_real = self._get_model_real_name(model_alias)
+        
+        if not model_real:
+            raise Exception(f"[!!] Modelo '{model_alias}' no configurado en Supabase")
+        
+        system_instruction = self._build_system_instruction(identidad, tono)
+        state = {'stored': None, 'window': None, 'chat': None}
+        
+        def open_stream(lease):
+            client = self.client_pool.get(lease.key_id, lease.api_key)
+            
+            config = self._get_generation_config(tono, custom_config)
+            self._apply_system_instruction(config, client, lease.key_id, model_real, system_instruction)
+            self._apply_timeout(config, deadline)
+            
+            state['chat'] = client.chats.create(
+                model = model_real,
+                config = config,
+                history = state['window']
+            )
+            return state['chat'].send_message_stream(message)
+        
+        def on_complete():
+            self._save_chat_history(session_id, state['chat'], state['stored'], state['window'])
+        
+        def chunks(stream):
+            with self._get_session_lock(session_id):
+                state['stored'], state['window'] = self._load_chat_window(session_id, history)
+                estimate = self._estimate_request(model_alias, model_real, message, system_instruction, state['window'], tono, custom_config)
+                yield from self._stream_chunks(stream, open_stream, model_alias, model_real, estimate, on_complete, deadline)
+        
+        return GodartStream(chunks, model = model_alias, started_at = started_at)
+    
+    def make_requests_batch(self, prompts, model=None, identidad=None, tono=None, custom_config=None, stream=False, return_exceptions=False, lanes_per_key=1):
+        model_alias = model or Config.DEFAULT_MODEL
+        model_real = self._get_model_real_name(model_alias)
+        
+        if not model_real:
+            raise Exception(f"[!!] Modelo '{model_alias}' no configurado en Supabase")
+        
+        system_instruction = self._build_system_instruction(identidad, tono)
+        
+        all_keys = self.supabase.get_all_available_keys()
+        if not all_keys:
+            raise Exception("[!!] No hay API keys disponibles en el pool")
+        
+        runner = BatchRunner(
+            self,
+            all_keys,
+            model_alias,
+            model_real,
+            system_instruction,
+            tono = tono,
+            custom_config = custom_config,
+            lanes_per_key = lanes_per_key
+        )
+        
+        prompts = list(prompts)
+        if stream:
+            return self._stream_batch(runner, prompts, return_exceptions)
+        
+        results = [None] * len(prompts)
+        batch = runner.run(prompts)
+        try:
+            for index, result in batch:
+                if isinstance(result, Exception) and not return_exceptions:
+                    raise result
+                results[index] = result
+        finally:
+            batch.close()
+        return results
+    
+    def _stream_batch(self, runner, prompts, return_exceptions):
+        batch = runner.run(prompts)
+        try:
+            for index, result in batch:
+                if isinstance(result, Exception) and not return_exceptions:
+                    raise result
+                yield index, result
+        finally:
+            batch.close()
+    
+    def submit_batch_job(self, prompts, model=None, identidad=None, tono=None, custom_config=None, display_name=None, shards=None):
+        return self.batch_jobs.submit(prompts, model, identidad, tono, custom_config, display_name, shards)
+    
+    def poll_batch_job(self, job_id):
+        return self.batch_jobs.poll(job_id)
+    
+    def iter_batch_results(self, job_id, wait=True, poll_interval=None, timeout=None):
+        return self.batch_jobs.results(job_id, wait, poll_interval, timeout)
+    
+    def cancel_batch_job(self, job_id):
+        return self.batch_jobs.cancel(job_id)
+    
+    def list_batch_jobs(self):
+        return self.batch_jobs.list()
+    
     def get_chat_history(self, session_id="default"):
-        if session_id in self.chat_sessions:
-            return self.chat_sessions[session_id].get_history()
-        return []
+        stored = self.session_store.load(session_id)
+        return [types.Content.model_validate(content) for content in stored or []]
     
     def clear_chat_session(self, session_id="default"):
-        if session_id in self.chat_sessions:
-            del self.chat_sessions[session_id]
-            return True
-        return False
+        with self._get_session_lock(session_id):
+            with self._sessions_lock:
+                self._history_summaries.pop(session_id, None)
+            return self.session_store.delete(session_id)
     
     def clear_all_sessions(self):
-        self.chat_sessions.clear()
\ No newline at end of file
+        with self._sessions_lock:
+            self._history_summaries.clear()
+        self.session_store.clear()
+    
+    def close(self):
+        self.client = None
+        if self._hedge_executor is not None:
+            self._hedge_executor.shutdown(wait=False)
+        self.client_pool.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
\ No newline at end of file
@@ -0,0 +1,90 @@
+# godart/hedging.py
+import time
+import threading
+from collections import deque
+
+from .config import Config
+
+
+
+
+
+def resolve_deadline(timeout=None, deadline=None):
+    # deadline es un instante de time.monotonic(); timeout son segundos desde ahora. Gana el más cercano
+    timeout = timeout if timeout is not None else Config.REQUEST_TIMEOUT
+    if timeout is not None:
+        limit = time.monotonic() + timeout
+        deadline = limit if deadline is None else min(deadline, limit)
+    return deadline
+
+
+def remaining_time(deadline):
+    if deadline is None:
+        return None
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise TimeoutError("[!!] Se agotó el tiempo del request")
+    return remaining
+
+
+def time_left(deadline):
+    # Como remaining_time pero sin lanzar: sirve para esperas que deben registrar lo que queda en curso
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+
+def deadline_passed(deadline):
+    return deadline is not None and time.monotonic() >= deadline
+
+
+
+
+
+class HedgePolicy:
+    # Si el primer intento supera el percentil de latencia del modelo, se lanza un duplicado a otra key
+    def __init__(self, percentile=None, min_samples=None, min_delay=None, window=None):
+        self.percentile = percentile or Config.HEDGE_PERCENTILE
+        self.min_samples = min_samples or Config.HEDGE_MIN_SAMPLES
+        self.min_delay = min_delay if min_delay is not None else Config.HEDGE_MIN_DELAY
+        self.window = window or Config.HEDGE_WINDOW
+        
+        self._latencies = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+    
+    def observe(self, model, seconds):
+        with self._lock:
+            latencies = self._latencies.get(model)
+            if latencies is None:
+                latencies = self._latencies[model] = deque(maxlen=self.window)
+            latencies.append(seconds)
+    
+    def delay(self, model):
+        # None mientras no haya muestras suficientes: sin historial no se duplica nada
+        with self._lock:
+            latencies = self._latencies.get(model)
+            if latencies is None or len(latencies) < self.min_samples:
+                return None
+            ordered = sorted(latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+        return max(self.min_delay, ordered[index])
+    
+    def record(self, model, won):
+        with self._lock:
+            stats = self._stats.setdefault(model, {'hedges': 0, 'wins': 0})
+            stats['hedges'] += 1
+            stats['wins'] += 1 if won else 0
+    
+    def get_stats(self):
+        models = list(self._latencies)
+        delays = {model: self.delay(model) for model in models}
+        with self._lock:
+            return {
+                model: {
+                    'samples': len(self._latencies[model]),
+                    'delay': round(delays[model], 4) if delays[model] is not None else None,
+                    **self._stats.get(model, {'hedges': 0, 'wins': 0})
+                }
+                for model in models
+            }
\ No newline at end of file
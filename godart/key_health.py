@@ -0,0 +1,215 @@
+# godart/key_health.py
+import re
+import time
+import random
+import threading
+from email.utils import parsedate_to_datetime
+
+from .config import Config
+from .rate_limiter import next_daily_reset
+
+
+
+
+
+_RETRY_PATTERNS = (
+    re.compile(r"retryDelay['\"]?\s*[:=]\s*['\"]?(\d+(?:\.\d+)?)s", re.IGNORECASE),
+    re.compile(r"retry(?:[ -]after| in)\D{0,3}(\d+(?:\.\d+)?)\s*s", re.IGNORECASE)
+)
+_DAILY_PATTERN = re.compile(r"per ?day|\bRPD\b|daily", re.IGNORECASE)
+_QUOTA_PATTERN = re.compile(r"429|quota|resource_exhausted", re.IGNORECASE)
+_TRANSIENT_PATTERN = re.compile(r"\b(500|502|503|504)\b|unavailable|overloaded|internal error", re.IGNORECASE)
+
+
+def is_quota_error(error_msg):
+    return bool(_QUOTA_PATTERN.search(error_msg))
+
+
+def is_daily_quota_error(error_msg):
+    # Gemini indica la cuota agotada en QuotaFailure, p. ej. GenerateRequestsPerDayPerProjectPerModel
+    return is_quota_error(error_msg) and bool(_DAILY_PATTERN.search(error_msg))
+
+
+def is_transient_error(error_msg):
+    return bool(_TRANSIENT_PATTERN.search(error_msg))
+
+
+def parse_retry_after(error_msg, error=None):
+    # Orden: cabecera Retry-After de la respuesta HTTP, RetryInfo del cuerpo y "Please retry in 37.8s" del mensaje
+    headers = getattr(getattr(error, 'response', None), 'headers', None)
+    value = headers.get('retry-after') if headers is not None else None
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    
+    for pattern in _RETRY_PATTERNS:
+        match = pattern.search(error_msg)
+        if match:
+            return float(match.group(1))
+    return None
+
+
+
+
+
+class _KeyState:
+    __slots__ = ('state', 'failures', 'opens', 'open_until', 'probe_since', 'parked', 'last_error')
+    
+    def __init__(self):
+        self.state = KeyHealth.CLOSED
+        self.failures = 0
+        self.opens = 0
+        self.open_until = 0.0
+        self.probe_since = None
+        self.parked = False
+        self.last_error = None
+
+
+
+
+
+class KeyHealth:
+    # Circuit breaker por key y modelo: una key con 429 se salta sin llamar a Gemini hasta que pasa su enfriamiento
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    
+    def __init__(self, failure_threshold=None, base_cooldown=None, max_cooldown=None, probe_timeout=None, probe_poll=None):
+        self.failure_threshold = failure_threshold or Config.CIRCUIT_FAILURE_THRESHOLD
+        self.base_cooldown = base_cooldown if base_cooldown is not None else Config.CIRCUIT_BASE_COOLDOWN
+        self.max_cooldown = max_cooldown if max_cooldown is not None else Config.CIRCUIT_MAX_COOLDOWN
+        self.probe_timeout = probe_timeout if probe_timeout is not None else Config.CIRCUIT_PROBE_TIMEOUT
+        self.probe_poll = probe_poll if probe_poll is not None else Config.CIRCUIT_PROBE_POLL
+        
+        self._states = {}
+        self._lock = threading.Lock()
+    
+    def _cooldown(self, opens):
+        # Backoff exponencial con jitter para que las keys abiertas a la vez no vuelvan todas juntas
+        cooldown = min(self.max_cooldown, self.base_cooldown * 2 ** (opens - 1))
+        return cooldown * random.uniform(0.5, 1.0)
+    
+    def blocked(self, model):
+        # Keys que no deben recibir requests ahora: abiertas sin vencer o en prueba con un request en curso
+        if not self._states:
+            return set()
+        now = time.monotonic()
+        blocked = set()
+        with self._lock:
+            for (key_id, key_model), state in self._states.items():
+                if key_model != model or state.state == self.CLOSED:
+                    continue
+                if state.state == self.OPEN and now < state.open_until:
+                    blocked.add(key_id)
+                elif state.state == self.HALF_OPEN and state.probe_since is not None and now - state.probe_since < self.probe_timeout:
+                    blocked.add(key_id)
+        return blocked
+    
+    def next_available(self, model, key_ids):
+        # Segundos hasta que alguna de las keys vuelva a aceptar un request de prueba
+        now = time.monotonic()
+        waits = []
+        with self._lock:
+            for key_id in key_ids:
+                state = self._states.get((key_id, model))
+                if state is None or state.state == self.CLOSED:
+                    return 0.0
+                if state.state == self.OPEN:
+                    waits.append(max(0.0, state.open_until - now))
+                elif state.probe_since is not None:
+                    # La prueba en curso suele resolverse en lo que dura un request: se vuelve a mirar pronto
+                    waits.append(min(self.probe_poll, max(0.0, state.probe_since + self.probe_timeout - now)))
+                else:
+                    return 0.0
+        return min(waits) if waits else None
+    
+    def parked(self, key_id, model):
+        # Key sin cupo diario: no vuelve hasta el reinicio, no tiene sentido esperarla
+        state = self._states.get((key_id, model))
+        return state is not None and state.parked and state.state == self.OPEN and time.monotonic() < state.open_until
+    
+    def begin(self, key_id, model):
+        # Al vencer el enfriamiento la key pasa a half-open y el request que la tomó es la prueba
+        state = self._states.get((key_id, model))
+        if state is None or state.state == self.CLOSED:
+            return
+        with self._lock:
+            if state.state == self.OPEN and time.monotonic() >= state.open_until:
+                state.state = self.HALF_OPEN
+            if state.state == self.HALF_OPEN:
+                state.probe_since = time.monotonic()
+    
+    def record_success(self, key_id, model):
+        # Sin lock en el caso común: las keys sanas no tienen estado
+        state = self._states.get((key_id, model))
+        if state is None:
+            return None
+        with self._lock:
+            # Un request que empezó antes del 429 no cierra un circuito abierto; solo la prueba lo hace
+            if self._states.get((key_id, model)) is not state or state.state == self.OPEN:
+                return None
+            del self._states[(key_id, model)]
+            return state.state if state.state != self.CLOSED else None
+    
+    def record_failure(self, key_id, model, error_msg, error=None):
+        # Devuelve (estado, segundos de pausa) si la key quedó abierta; None si sigue aceptando requests
+        quota = is_quota_error(error_msg)
+        if not quota and not is_transient_error(error_msg):
+            # Errores propios del request (o un timeout del caller) no dicen nada de la key: solo liberan la prueba
+            state = self._states.get((key_id, model))
+            if state is not None:
+                with self._lock:
+                    state.probe_since = None
+            return None
+        
+        with self._lock:
+            state = self._states.get((key_id, model))
+            if state is None:
+                state = self._states[(key_id, model)] = _KeyState()
+            state.failures += 1
+            state.last_error = error_msg[:200]
+            state.probe_since = None
+            
+            # Un 429 abre el circuito de inmediato; los 5xx solo tras varios seguidos o si falla la prueba
+            if not quota and state.state == self.CLOSED and state.failures < self.failure_threshold:
+                return None
+            
+            now = time.monotonic()
+            state.opens += 1
+            state.parked = quota and is_daily_quota_error(error_msg)
+            if state.parked:
+                # Sin cupo diario la key queda aparcada hasta el reinicio de medianoche (hora del Pacífico)
+                cooldown = max(0.0, next_daily_reset() - time.time())
+            else:
+                retry_after = parse_retry_after(error_msg, error) if quota else None
+                cooldown = min(self.max_cooldown, retry_after) if retry_after is not None else self._cooldown(state.opens)
+            
+            state.state = self.OPEN
+            state.open_until = now + cooldown
+            return ('parked' if state.parked else self.OPEN), cooldown
+    
+    def reset(self, key_id=None, model=None):
+        with self._lock:
+            if key_id is None and model is None:
+                self._states.clear()
+                return
+            for state_key in [k for k in self._states if (key_id is None or k[0] == key_id) and (model is None or k[1] == model)]:
+                del self._states[state_key]
+    
+    def get_stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                f"{key_id}:{model}": {
+                    'state': 'parked' if state.parked and state.state == self.OPEN else state.state,
+                    'failures': state.failures,
+                    'retry_in': round(max(0.0, state.open_until - now), 1) if state.state == self.OPEN else 0,
+                    'last_error': state.last_error
+                }
+                for (key_id, model), state in self._states.items()
+            }
\ No newline at end of file
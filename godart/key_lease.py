@@ -0,0 +1,19 @@
+# godart/key_lease.py
+
+
+
+
+
+class KeyLease:
+    __slots__ = ('key_id', 'api_key', 'account_name', 'model', 'tracker', 'reservation')
+    
+    def __init__(self, key_data, model, tracker, reservation):
+        self.key_id = key_data['key_id']
+        self.api_key = key_data['api_key']
+        self.account_name = key_data['account_name']
+        self.model = model
+        self.tracker = tracker
+        self.reservation = reservation
+    
+    def settle(self, tokens_used):
+        self.tracker.settle(self.reservation, tokens_used)
\ No newline at end of file
@@ -0,0 +1,151 @@
+# godart/key_scheduler.py
+import time
+import heapq
+import threading
+from itertools import count
+from collections import deque
+
+from .config import Config
+
+
+
+
+
+class _ModelPool:
+    def __init__(self):
+        self.version = None
+        self.keys = {}
+        self.heap = []
+        self.entries = {}
+        self.ring = deque()
+        self.order = []
+        self.built_at = 0
+        self.lock = threading.Lock()
+
+
+
+
+
+class KeyScheduler:
+    STRATEGIES = ('least_loaded', 'weighted', 'round_robin', 'first_fit')
+    
+    def __init__(self, strategy=None, refresh_interval=None):
+        self.strategy = strategy or Config.KEY_SELECTION_STRATEGY
+        self.refresh_interval = refresh_interval if refresh_interval is not None else Config.KEY_SCHEDULER_REFRESH
+        
+        if self.strategy not in self.STRATEGIES:
+            raise ValueError(f"[!!] Estrategia de selección inválida: {self.strategy}. Usa una de {self.STRATEGIES}")
+        
+        self._pools = {}
+        self._pools_lock = threading.Lock()
+        self._seq = count()
+    
+    def _get_pool(self, model):
+        pool = self._pools.get(model)
+        if pool is None:
+            with self._pools_lock:
+                pool = self._pools.setdefault(model, _ModelPool())
+        return pool
+    
+    def _score(self, tracker, estimated_tokens=0):
+        usage = tracker.get_current_usage()
+        rpm_load = usage['requests'] / max(usage['rpm_limit'], 1)
+        
+        if self.strategy == 'least_loaded':
+            return rpm_load
+        
+        # weighted: la dimensión más cercana a su límite decide, así las keys con más cupo reciben más tráfico
+        tpm_load = (usage['tokens'] + estimated_tokens) / max(usage['tpm_limit'], 1)
+        rpd_load = usage['requests_today'] / usage['rpd_limit'] if usage['rpd_limit'] else 0
+        return max(rpm_load, tpm_load, rpd_load)
+    
+    def _push(self, pool, key_id, score):
+        entry = [score, next(self._seq), key_id]
+        old = pool.entries.get(key_id)
+        if old is not None:
+            old[2] = None
+        pool.entries[key_id] = entry
+        heapq.heappush(pool.heap, entry)
+    
+    def _rebuild(self, pool, keys, version, tracker_for, estimated_tokens):
+        pool.version = version
+        pool.keys = {k['key_id']: k for k in keys}
+        pool.order = [k['key_id'] for k in keys]
+        pool.ring = deque(pool.order)
+        pool.entries = {}
+        # round_robin y first_fit no usan puntajes: con backend compartido cada puntaje es una consulta
+        if self.strategy not in ('least_loaded', 'weighted'):
+            pool.heap = []
+            pool.built_at = time.monotonic()
+            return
+        pool.heap = [[self._score(tracker_for(key_id), estimated_tokens), next(self._seq), key_id] for key_id in pool.order]
+        for entry in pool.heap:
+            pool.entries[entry[2]] = entry
+        heapq.heapify(pool.heap)
+        pool.built_at = time.monotonic()
+    
+    def _sync(self, pool, keys, version, tracker_for, estimated_tokens):
+        stale = version is None or version != pool.version
+        if not stale and self.strategy in ('least_loaded', 'weighted'):
+            # Los puntajes solo bajan con el tiempo: se recalculan todos cada refresh_interval
+            stale = time.monotonic() - pool.built_at > self.refresh_interval
+        if stale:
+            self._rebuild(pool, keys, version, tracker_for, estimated_tokens)
+    
+    def _iter_heap(self, pool, tracker_for, estimated_tokens, popped):
+        while pool.heap:
+            entry = heapq.heappop(pool.heap)
+            key_id = entry[2]
+            if key_id is None:
+                continue
+            
+            # Re-evaluación perezosa: si el puntaje real empeoró y ya no es el mejor, vuelve al heap
+            score = self._score(tracker_for(key_id), estimated_tokens)
+            if pool.heap and score > entry[0] and score > pool.heap[0][0]:
+                self._push(pool, key_id, score)
+                continue
+            
+            del pool.entries[key_id]
+            popped.append(key_id)
+            yield key_id
+    
+    def _iter_ring(self, pool):
+        for _ in range(len(pool.ring)):
+            key_id = pool.ring[0]
+            pool.ring.rotate(-1)
+            yield key_id
+    
+    def acquire(self, model, keys, tracker_for, estimated_tokens=0, exclude=(), version=None):
+        pool = self._get_pool(model)
+        
+        with pool.lock:
+            self._sync(pool, keys, version, tracker_for, estimated_tokens)
+            
+            popped = []
+            min_wait = float('inf')
+            soonest_key = None
+            
+            if self.strategy == 'round_robin':
+                candidates = self._iter_ring(pool)
+            elif self.strategy == 'first_fit':
+                candidates = iter(pool.order)
+            else:
+                candidates = self._iter_heap(pool, tracker_for, estimated_tokens, popped)
+            
+            try:
+                for key_id in candidates:
+                    if key_id in exclude:
+                        continue
+                    
+                    reservation, wait_time = tracker_for(key_id).try_acquire(estimated_tokens)
+                    if reservation:
+                        return pool.keys[key_id], reservation, 0, None
+                    
+                    if wait_time < min_wait:
+                        min_wait = wait_time
+                        soonest_key = pool.keys[key_id]
+            finally:
+                for key_id in popped:
+                    self._push(pool, key_id, self._score(tracker_for(key_id), estimated_tokens))
+            
+            return None, None, min_wait, soonest_key
\ No newline at end of file
@@ -0,0 +1,229 @@
+# godart/log_sink.py
+import os
+import json
+import time
+import atexit
+import threading
+from collections import deque
+
+from .config import Config
+from .telemetry import logger
+
+
+
+
+
+class RequestLogSink:
+    POLICIES = ('drop_oldest', 'drop_newest', 'spill')
+    
+    def __init__(self, flush_batch, batch_size=None, flush_interval=None, max_queue=None, overflow_policy=None, spill_path=None, retries=None, retry_delay=None):
+        self.flush_batch = flush_batch
+        self.batch_size = batch_size or Config.LOG_BATCH_SIZE
+        self.flush_interval = flush_interval or Config.LOG_FLUSH_INTERVAL
+        self.max_queue = max_queue or Config.LOG_MAX_QUEUE
+        self.overflow_policy = overflow_policy or Config.LOG_OVERFLOW_POLICY
+        self.spill_path = spill_path or Config.LOG_SPILL_PATH
+        self.retries = retries if retries is not None else Config.LOG_FLUSH_RETRIES
+        self.retry_delay = retry_delay if retry_delay is not None else Config.LOG_FLUSH_RETRY_DELAY
+        
+        if self.overflow_policy not in self.POLICIES:
+            raise ValueError(f"[!!] Política de desborde inválida: {self.overflow_policy}. Usa una de {self.POLICIES}")
+        
+        self.dropped = 0
+        self.spilled = 0
+        self.flushed = 0
+        self.replayed = 0
+        
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self._closed = False
+        
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+        atexit.register(self.close)
+    
+    def __len__(self):
+        with self._cond:
+            return len(self._queue)
+    
+    def emit(self, record):
+        overflow = None
+        with self._cond:
+            if self._closed:
+                overflow = [record]
+            elif len(self._queue) >= self.max_queue:
+                if self.overflow_policy == 'drop_newest':
+                    self.dropped += 1
+                    return
+                overflow = [self._queue.popleft()]
+                self._queue.append(record)
+            else:
+                self._queue.append(record)
+            
+            if len(self._queue) >= self.batch_size:
+                self._cond.notify()
+        
+        if overflow:
+            self._handle_overflow(overflow)
+    
+    def _handle_overflow(self, records):
+        if self.overflow_policy == 'spill' and self.spill_path:
+            self._spill(records)
+        else:
+            with self._cond:
+                self.dropped += len(records)
+    
+    def _spill(self, records):
+        try:
+            with self._spill_lock, open(self.spill_path, 'a', encoding='utf-8') as fh:
+                for record in records:
+                    fh.write(json.dumps(record, default=str) + '\n')
+            with self._cond:
+                self.spilled += len(records)
+        except Exception as e:
+            logger.error(f"[!!] Error al volcar logs a disco: {e}")
+            with self._cond:
+                self.dropped += len(records)
+    
+    def _take_batch(self):
+        with self._cond:
+            count = min(len(self._queue), self.batch_size)
+            return [self._queue.popleft() for _ in range(count)]
+    
+    def _send(self, batch):
+        # Un corte breve de Supabase no manda el lote a la política de desborde: se reintenta con backoff
+        for attempt in range(self.retries + 1):
+            try:
+                self.flush_batch(batch)
+                return True
+            except Exception as e:
+                if attempt == self.retries:
+                    logger.error(f"[!!] Error al enviar lote de logs: {e}")
+                    return False
+                time.sleep(self.retry_delay * 2 ** attempt)
+    
+    def _read_spill_batch(self, fh):
+        # Lee hasta batch_size registros desde la posición actual; las líneas corruptas se descartan
+        records = []
+        while len(records) < self.batch_size:
+            line = fh.readline()
+            if not line:
+                return records, True
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                with self._cond:
+                    self.dropped += 1
+        return records, False
+    
+    def _load_offset(self, offset_path):
+        try:
+            with open(offset_path, encoding='utf-8') as fh:
+                return int(fh.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+    
+    def _save_offset(self, offset_path, offset):
+        tmp_path = f"{offset_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as fh:
+            fh.write(str(offset))
+        os.replace(tmp_path, offset_path)
+    
+    def _replay_spill(self):
+        # Tras un envío exitoso se reenvía lo volcado a disco mientras Supabase no respondía.
+        # Se lee por lotes y el avance queda en disco: si el proceso muere, se retoma sin reenviar lo ya enviado
+        if not self.spill_path:
+            return
+        replay_path = f"{self.spill_path}.replay"
+        offset_path = f"{self.spill_path}.offset"
+        while True:
+            try:
+                with self._spill_lock:
+                    if not os.path.exists(replay_path):
+                        if not os.path.exists(self.spill_path):
+                            return
+                        # Los desbordes que lleguen durante el reenvío van a un archivo nuevo
+                        os.replace(self.spill_path, replay_path)
+                        self._save_offset(offset_path, 0)
+                
+                with open(replay_path, 'rb') as fh:
+                    fh.seek(self._load_offset(offset_path))
+                    while True:
+                        batch, done = self._read_spill_batch(fh)
+                        if batch:
+                            try:
+                                self.flush_batch(batch)
+                            except Exception as e:
+                                # Lo pendiente queda en el archivo de reenvío para el próximo envío exitoso
+                                logger.error(f"[!!] Error al reenviar logs volcados a disco: {e}")
+                                return
+                            with self._cond:
+                                self.replayed += len(batch)
+                        self._save_offset(offset_path, fh.tell())
+                        if done:
+                            break
+                
+                os.remove(replay_path)
+                os.remove(offset_path)
+            except Exception as e:
+                logger.error(f"[!!] Error al leer logs volcados a disco: {e}")
+                return
+    
+    def flush(self):
+        # Un solo flush a la vez para que los lotes salgan en orden
+        with self._flush_lock:
+            sent = False
+            while True:
+                batch = self._take_batch()
+                if not batch:
+                    break
+                if not self._send(batch):
+                    self._handle_overflow(batch)
+                    return
+                sent = True
+                with self._cond:
+                    self.flushed += len(batch)
+            if sent:
+                self._replay_spill()
+    
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._closed and len(self._queue) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+                closed = self._closed
+            self.flush()
+            if closed:
+                return
+    
+    def close(self, timeout=None):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        atexit.unregister(self.close)
+        self._worker.join(timeout if timeout is not None else self.flush_interval + 5)
+        self.flush()
+    
+    def get_stats(self):
+        with self._cond:
+            return {
+                'queued': len(self._queue),
+                'flushed': self.flushed,
+                'dropped': self.dropped,
+                'spilled': self.spilled,
+                'replayed': self.replayed
+            }
+    
+    @staticmethod
+    def build_record(key_id, success, error_message=None, model=None):
+        return {
+            'key_id': str(key_id),
+            'success': success,
+            'error_message': error_message,
+            'model': model or Config.DEFAULT_MODEL,
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        }
\ No newline at end of file
@@ -0,0 +1,77 @@
+# godart/model_router.py
+from .config import Config
+from .key_health import is_quota_error
+
+
+
+
+
+class ModelResponse(str):
+    # Texto normal con el modelo que respondió: el código que espera un str no cambia
+    def __new__(cls, text, model=None, requested=None):
+        response = super().__new__(cls, text)
+        response.model = model
+        response.requested = requested or model
+        return response
+    
+    @property
+    def fallback(self):
+        return self.model != self.requested
+
+
+
+
+
+class ModelRouter:
+    # Si el modelo pedido no tiene cupo en ninguna key, el request baja al siguiente de su cadena (max → base → mini)
+    FALLBACK_ERRORS = ('no hay api keys disponibles', 'todas las api keys del pool están agotadas', 'no configurado en supabase')
+    
+    def __init__(self, fallbacks=None, size_routes=None, max_wait=None):
+        self.fallbacks = {alias: tuple(chain) for alias, chain in (fallbacks if fallbacks is not None else Config.MODEL_FALLBACKS).items()}
+        self.size_routes = sorted(size_routes if size_routes is not None else Config.MODEL_SIZE_ROUTES or (), key=lambda route: float('inf') if route[0] is None else route[0])
+        self.max_wait = max_wait if max_wait is not None else Config.MODEL_FALLBACK_MAX_WAIT
+    
+    def route_by_size(self, estimated_tokens):
+        # size_routes: ((4000, 'mini'), (32000, 'base'), (None, 'max')); None = sin límite
+        for limit, model_alias in self.size_routes:
+            if limit is None or estimated_tokens <= limit:
+                return model_alias
+        return None
+    
+    def chain(self, model_alias):
+        chain = [model_alias]
+        for fallback in self.fallbacks.get(model_alias, ()):
+            if fallback not in chain:
+                chain.append(fallback)
+        return chain
+    
+    def wait_time(self, manager, model_alias, estimated_tokens=0):
+        if not manager.supabase.get_model_config(model_alias):
+            return float('inf')
+        return manager._capacity_wait(model_alias, estimated_tokens)
+    
+    def select(self, model_alias, estimated_tokens=0, explicit=True):
+        # Con model=None el modelo puede elegirse por tamaño del request
+        if not explicit and self.size_routes:
+            return self.route_by_size(estimated_tokens) or model_alias
+        return model_alias
+    
+    def plan(self, manager, model_alias, estimated_tokens=0):
+        chain = self.chain(model_alias)
+        if len(chain) == 1:
+            return chain
+        
+        # Si el modelo pedido tiene cupo no se consultan los demás: la cadena queda en su orden
+        waits = {model_alias: self.wait_time(manager, model_alias, estimated_tokens)}
+        if waits[model_alias] <= self.max_wait:
+            return chain
+        
+        # Los modelos con cupo dentro de max_wait conservan el orden de la cadena; los saturados van al final por espera
+        waits.update({alias: self.wait_time(manager, alias, estimated_tokens) for alias in chain[1:]})
+        return sorted(chain, key=lambda alias: (0, chain.index(alias)) if waits[alias] <= self.max_wait else (1, waits[alias]))
+    
+    def should_fallback(self, error):
+        if isinstance(error, TimeoutError):
+            return False
+        error_msg = str(error).lower()
+        return any(message in error_msg for message in self.FALLBACK_ERRORS) or is_quota_error(error_msg)
\ No newline at end of file
@@ -0,0 +1,323 @@
+# godart/rate_backends.py
+import time
+import uuid
+import sqlite3
+import threading
+
+from .rate_limiter import RateLimitTracker, next_daily_reset
+
+
+
+
+
+def evaluate_window(entries, day_count, tokens, rpm_limit, tpm_limit, rpd_limit, day_reset_at, now):
+    # Misma regla que RateLimitTracker, sobre una ventana leída del backend: entries = [(timestamp, tokens)] ordenadas
+    window = RateLimitTracker.WINDOW
+    
+    if rpd_limit and day_count >= rpd_limit:
+        return False, "RPD", max(0, day_reset_at - now)
+    
+    if len(entries) >= rpm_limit:
+        index = max(0, len(entries) - rpm_limit)
+        return False, "RPM", max(0, entries[index][0] + window - now)
+    
+    token_total = sum(entry_tokens for _, entry_tokens in entries)
+    if entries and token_total + tokens > tpm_limit:
+        remaining = token_total
+        for timestamp, entry_tokens in entries:
+            remaining -= entry_tokens
+            if remaining + tokens <= tpm_limit:
+                return False, "TPM", max(0, timestamp + window - now)
+        return False, "TPM", max(0, entries[-1][0] + window - now)
+    return True, None, 0
+
+
+
+
+
+class SharedReservation:
+    __slots__ = ('id', 'timestamp', 'tokens')
+    
+    def __init__(self, reservation_id, timestamp, tokens):
+        self.id = reservation_id
+        self.timestamp = timestamp
+        self.tokens = tokens
+
+
+
+
+
+class SQLiteRateLimitBackend:
+    # Un archivo SQLite en modo WAL compartido por todos los procesos del host
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        
+        conn = self._connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS godart_rate_usage ('
+            'id TEXT PRIMARY KEY, bucket TEXT NOT NULL, ts REAL NOT NULL, tokens INTEGER NOT NULL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_godart_rate_usage_bucket_ts ON godart_rate_usage (bucket, ts)')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS godart_rate_daily ('
+            'bucket TEXT NOT NULL, reset_at REAL NOT NULL, count INTEGER NOT NULL, PRIMARY KEY (bucket, reset_at))'
+        )
+    
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # isolation_level=None: las transacciones se abren a mano con BEGIN IMMEDIATE
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+    
+    def _read_locked(self, conn, bucket, now, day_reset_at):
+        conn.execute('DELETE FROM godart_rate_usage WHERE bucket = ? AND ts <= ?', (bucket, now - RateLimitTracker.WINDOW))
+        entries = conn.execute(
+            'SELECT ts, tokens FROM godart_rate_usage WHERE bucket = ? ORDER BY ts',
+            (bucket,)
+        ).fetchall()
+        row = conn.execute(
+            'SELECT count FROM godart_rate_daily WHERE bucket = ? AND reset_at = ?',
+            (bucket, day_reset_at)
+        ).fetchone()
+        return entries, row[0] if row else 0
+    
+    def _insert_locked(self, conn, bucket, tokens, now, day_reset_at):
+        reservation_id = uuid.uuid4().hex
+        conn.execute(
+            'INSERT INTO godart_rate_usage (id, bucket, ts, tokens) VALUES (?, ?, ?, ?)',
+            (reservation_id, bucket, now, tokens)
+        )
+        conn.execute(
+            'INSERT INTO godart_rate_daily (bucket, reset_at, count) VALUES (?, ?, 1) '
+            'ON CONFLICT (bucket, reset_at) DO UPDATE SET count = count + 1',
+            (bucket, day_reset_at)
+        )
+        conn.execute('DELETE FROM godart_rate_daily WHERE bucket = ? AND reset_at < ?', (bucket, day_reset_at))
+        return SharedReservation(reservation_id, now, tokens)
+    
+    def _transaction(self, func):
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            result = func(conn)
+            conn.execute('COMMIT')
+            return result
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+    
+    def acquire(self, bucket, tokens, rpm_limit, tpm_limit, rpd_limit):
+        def run(conn):
+            now = time.time()
+            day_reset_at = next_daily_reset(now)
+            entries, day_count = self._read_locked(conn, bucket, now, day_reset_at)
+            can_request, limit_type, wait_time = evaluate_window(entries, day_count, tokens, rpm_limit, tpm_limit, rpd_limit, day_reset_at, now)
+            if not can_request:
+                return None, limit_type, wait_time
+            return self._insert_locked(conn, bucket, tokens, now, day_reset_at), None, 0
+        return self._transaction(run)
+    
+    def check(self, bucket, tokens, rpm_limit, tpm_limit, rpd_limit):
+        def run(conn):
+            now = time.time()
+            day_reset_at = next_daily_reset(now)
+            entries, day_count = self._read_locked(conn, bucket, now, day_reset_at)
+            return evaluate_window(entries, day_count, tokens, rpm_limit, tpm_limit, rpd_limit, day_reset_at, now)
+        return self._transaction(run)
+    
+    def record(self, bucket, tokens):
+        def run(conn):
+            now = time.time()
+            return self._insert_locked(conn, bucket, tokens, now, next_daily_reset(now))
+        return self._transaction(run)
+    
+    def settle(self, bucket, reservation, tokens_used):
+        conn = self._connect()
+        conn.execute('UPDATE godart_rate_usage SET tokens = ? WHERE id = ?', (tokens_used, reservation.id))
+    
+    def usage(self, bucket):
+        def run(conn):
+            now = time.time()
+            entries, day_count = self._read_locked(conn, bucket, now, next_daily_reset(now))
+            return len(entries), sum(tokens for _, tokens in entries), day_count
+        return self._transaction(run)
+    
+    def reset(self, bucket=None):
+        def run(conn):
+            if bucket is None:
+                conn.execute('DELETE FROM godart_rate_usage')
+                conn.execute('DELETE FROM godart_rate_daily')
+            else:
+                conn.execute('DELETE FROM godart_rate_usage WHERE bucket = ?', (bucket,))
+                conn.execute('DELETE FROM godart_rate_daily WHERE bucket = ?', (bucket,))
+        self._transaction(run)
+
+
+
+
+
+class RedisRateLimitBackend:
+    # Compatible con Redis/Valkey/KeyDB; usa WATCH/MULTI para que leer-verificar-escribir sea atómico
+    def __init__(self, client=None, url=None, prefix='godart:rl'):
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise ImportError("[!!] RedisRateLimitBackend requiere el paquete 'redis' (pip install redis)")
+            client = redis.Redis.from_url(url or 'redis://localhost:6379/0')
+        
+        self.client = client
+        self.prefix = prefix
+    
+    def _keys(self, bucket, day_reset_at=None):
+        base = f"{self.prefix}:{bucket}"
+        day_key = f"{base}:day:{int(day_reset_at)}" if day_reset_at else None
+        return f"{base}:win", f"{base}:tok", day_key
+    
+    def _read(self, pipe, bucket, now, day_reset_at):
+        win_key, tok_key, day_key = self._keys(bucket, day_reset_at)
+        cutoff = now - RateLimitTracker.WINDOW
+        
+        members = pipe.zrangebyscore(win_key, '-inf', '+inf', withscores=True)
+        expired = [member for member, score in members if score <= cutoff]
+        live = [(member, score) for member, score in members if score > cutoff]
+        
+        tokens = pipe.hmget(tok_key, [member for member, _ in live]) if live else []
+        entries = [(score, int(value or 0)) for (_, score), value in zip(live, tokens)]
+        day_count = int(pipe.get(day_key) or 0)
+        return entries, day_count, expired
+    
+    def _run(self, bucket, tokens, rpm_limit, tpm_limit, rpd_limit, insert, check=True):
+        win_key, tok_key, _ = self._keys(bucket)
+        while True:
+            now = time.time()
+            day_reset_at = next_daily_reset(now)
+            day_key = self._keys(bucket, day_reset_at)[2]
+            
+            with self.client.pipeline() as pipe:
+                try:
+                    pipe.watch(win_key, tok_key, day_key)
+                    entries, day_count, expired = self._read(pipe, bucket, now, day_reset_at)
+                    
+                    result = (True, None, 0)
+                    if check:
+                        result = evaluate_window(entries, day_count, tokens, rpm_limit, tpm_limit, rpd_limit, day_reset_at, now)
+                    
+                    pipe.multi()
+                    if expired:
+                        pipe.zrem(win_key, *expired)
+                        pipe.hdel(tok_key, *expired)
+                    
+                    reservation = None
+                    if insert and result[0]:
+                        reservation = SharedReservation(uuid.uuid4().hex, now, tokens)
+                        pipe.zadd(win_key, {reservation.id: now})
+                        pipe.hset(tok_key, reservation.id, tokens)
+                        pipe.expire(win_key, RateLimitTracker.WINDOW * 2)
+                        pipe.expire(tok_key, RateLimitTracker.WINDOW * 2)
+                        pipe.incr(day_key)
+                        pipe.expireat(day_key, int(day_reset_at) + 60)
+                    pipe.execute()
+                    return result, reservation, entries, day_count
+                except Exception as e:
+                    # WatchError: otro proceso modificó el bucket entre la lectura y la escritura
+                    if type(e).__name__ == 'WatchError':
+                        continue
+                    raise
+    
+    def acquire(self, bucket, tokens, rpm_limit, tpm_limit, rpd_limit):
+        (can_request, limit_type, wait_time), reservation, _, _ = self._run(bucket, tokens, rpm_limit, tpm_limit, rpd_limit, insert=True)
+        if not can_request:
+            return None, limit_type, wait_time
+        return reservation, None, 0
+    
+    def check(self, bucket, tokens, rpm_limit, tpm_limit, rpd_limit):
+        result, _, _, _ = self._run(bucket, tokens, rpm_limit, tpm_limit, rpd_limit, insert=False)
+        return result
+    
+    def record(self, bucket, tokens):
+        _, reservation, _, _ = self._run(bucket, tokens, None, None, None, insert=True, check=False)
+        return reservation
+    
+    def settle(self, bucket, reservation, tokens_used):
+        win_key, tok_key, _ = self._keys(bucket)
+        # Solo si la reserva sigue en la ventana; si ya expiró no cuenta para el total
+        if self.client.zscore(win_key, reservation.id) is not None:
+            self.client.hset(tok_key, reservation.id, tokens_used)
+    
+    def usage(self, bucket):
+        _, _, entries, day_count = self._run(bucket, 0, None, None, None, insert=False, check=False)
+        return len(entries), sum(tokens for _, tokens in entries), day_count
+    
+    def reset(self, bucket=None):
+        pattern = f"{self.prefix}:{bucket if bucket is not None else '*'}:*"
+        keys = list(self.client.scan_iter(match=pattern))
+        if keys:
+            self.client.delete(*keys)
+
+
+
+
+
+class SharedRateLimitTracker:
+    # Misma interfaz que RateLimitTracker; el estado vive en el backend y lo ven todos los workers
+    POLL_INTERVAL = 0.005
+    
+    def __init__(self, backend, bucket, rpm_limit, tpm_limit, rpd_limit=None):
+        self.backend = backend
+        self.bucket = bucket
+        self.rpm_limit = rpm_limit
+        self.tpm_limit = tpm_limit
+        self.rpd_limit = rpd_limit
+    
+    def can_make_request(self, estimated_tokens=0):
+        can_request, limit_type, _ = self.backend.check(self.bucket, estimated_tokens, self.rpm_limit, self.tpm_limit, self.rpd_limit)
+        return can_request, limit_type
+    
+    def record_request(self, tokens_used):
+        self.backend.record(self.bucket, tokens_used)
+    
+    def acquire(self, tokens=0, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        
+        while True:
+            reservation, _, wait_time = self.backend.acquire(self.bucket, tokens, self.rpm_limit, self.tpm_limit, self.rpd_limit)
+            if reservation:
+                return reservation
+            
+            # Sin notificaciones entre procesos: se espera lo que indica la ventana compartida
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or wait_time > remaining:
+                    return None
+                wait_time = min(wait_time, remaining)
+            time.sleep(max(wait_time, self.POLL_INTERVAL))
+    
+    def try_acquire(self, tokens=0):
+        # Una sola transacción devuelve la reserva o la espera; un candidato rechazado no cuesta más consultas
+        reservation, _, wait_time = self.backend.acquire(self.bucket, tokens, self.rpm_limit, self.tpm_limit, self.rpd_limit)
+        return reservation, 0 if reservation else wait_time
+    
+    def settle(self, reservation, tokens_used):
+        self.backend.settle(self.bucket, reservation, tokens_used)
+        reservation.tokens = tokens_used
+    
+    def get_wait_time(self, limit_type, estimated_tokens=0):
+        _, _, wait_time = self.backend.check(self.bucket, estimated_tokens, self.rpm_limit, self.tpm_limit, self.rpd_limit)
+        return wait_time
+    
+    def get_current_usage(self):
+        requests, tokens, requests_today = self.backend.usage(self.bucket)
+        return {
+            'requests': requests,
+            'tokens': tokens,
+            'requests_today': requests_today,
+            'rpm_limit': self.rpm_limit,
+            'tpm_limit': self.tpm_limit,
+            'rpd_limit': self.rpd_limit
+        }
\ No newline at end of file
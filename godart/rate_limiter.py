@@ -0,0 +1,175 @@
+# godart/rate_limiter.py
+import time
+import threading
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+try:
+    from zoneinfo import ZoneInfo
+    _QUOTA_TZ = ZoneInfo('America/Los_Angeles')
+except Exception:
+    _QUOTA_TZ = timezone.utc
+
+
+
+
+
+def next_daily_reset(now=None):
+    # Las cuotas diarias de Gemini se reinician a medianoche, hora del Pacífico
+    current = datetime.fromtimestamp(now if now is not None else time.time(), _QUOTA_TZ)
+    tomorrow = (current + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return tomorrow.timestamp()
+
+
+
+
+
+class UsageEntry:
+    __slots__ = ('timestamp', 'tokens')
+    
+    def __init__(self, timestamp, tokens):
+        self.timestamp = timestamp
+        self.tokens = tokens
+
+
+
+
+
+class RateLimitTracker:
+    WINDOW = 60
+    
+    def __init__(self, rpm_limit, tpm_limit, rpd_limit=None):
+        self.rpm_limit = rpm_limit
+        self.tpm_limit = tpm_limit
+        self.rpd_limit = rpd_limit
+        
+        self._entries = deque()
+        self._token_total = 0
+        self._day_count = 0
+        self._day_reset_at = next_daily_reset()
+        self._cond = threading.Condition()
+    
+    def _clean_old_entries(self, now):
+        cutoff_time = now - self.WINDOW
+        entries = self._entries
+        
+        while entries and entries[0].timestamp <= cutoff_time:
+            self._token_total -= entries.popleft().tokens
+        
+        if time.time() >= self._day_reset_at:
+            self._day_count = 0
+            self._day_reset_at = next_daily_reset()
+    
+    def _check_locked(self, estimated_tokens):
+        if self.rpd_limit and self._day_count >= self.rpd_limit:
+            return False, "RPD"
+        
+        if len(self._entries) >= self.rpm_limit:
+            return False, "RPM"
+        
+        # Con la ventana vacía se admite aunque el estimado supere el TPM, si no nunca pasaría
+        if self._entries and self._token_total + estimated_tokens > self.tpm_limit:
+            return False, "TPM"
+        return True, None
+    
+    def _wait_time_locked(self, limit_type, estimated_tokens, now):
+        entries = self._entries
+        
+        if limit_type == "RPD":
+            return max(0, self._day_reset_at - time.time())
+        
+        if limit_type == "RPM" and entries:
+            # Deben expirar len - rpm + 1 entradas para bajar del límite
+            index = max(0, len(entries) - self.rpm_limit)
+            return max(0, entries[index].timestamp + self.WINDOW - now)
+        
+        if limit_type == "TPM" and entries:
+            remaining = self._token_total
+            for entry in entries:
+                remaining -= entry.tokens
+                if remaining + estimated_tokens <= self.tpm_limit:
+                    return max(0, entry.timestamp + self.WINDOW - now)
+            return max(0, entries[-1].timestamp + self.WINDOW - now)
+        return 0
+    
+    def _append_locked(self, tokens, now):
+        entry = UsageEntry(now, tokens)
+        self._entries.append(entry)
+        self._token_total += tokens
+        self._day_count += 1
+        return entry
+    
+    def can_make_request(self, estimated_tokens=0):
+        with self._cond:
+            self._clean_old_entries(time.monotonic())
+            return self._check_locked(estimated_tokens)
+    
+    def record_request(self, tokens_used):
+        with self._cond:
+            now = time.monotonic()
+            self._clean_old_entries(now)
+            self._append_locked(tokens_used, now)
+    
+    def acquire(self, tokens=0, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._clean_old_entries(now)
+                
+                can_request, limit_type = self._check_locked(tokens)
+                if can_request:
+                    return self._append_locked(tokens, now)
+                
+                wait_time = self._wait_time_locked(limit_type, tokens, now)
+                if deadline is not None:
+                    remaining = deadline - now
+                    if remaining <= 0 or wait_time > remaining:
+                        return None
+                    wait_time = min(wait_time, remaining)
+                
+                # settle() avisa si se liberan tokens antes de que expire la ventana
+                self._cond.wait(max(wait_time, 0.001))
+    
+    def try_acquire(self, tokens=0):
+        # Un solo intento sin esperar: la reserva, o None y los segundos hasta que haya cupo
+        with self._cond:
+            now = time.monotonic()
+            self._clean_old_entries(now)
+            can_request, limit_type = self._check_locked(tokens)
+            if can_request:
+                return self._append_locked(tokens, now), 0
+            return None, self._wait_time_locked(limit_type, tokens, now)
+    
+    def settle(self, reservation, tokens_used):
+        with self._cond:
+            now = time.monotonic()
+            self._clean_old_entries(now)
+            
+            delta = tokens_used - reservation.tokens
+            reservation.tokens = tokens_used
+            
+            # Si la reserva ya salió de la ventana no forma parte del total
+            if reservation.timestamp > now - self.WINDOW:
+                self._token_total += delta
+                if delta < 0:
+                    self._cond.notify_all()
+    
+    def get_wait_time(self, limit_type, estimated_tokens=0):
+        with self._cond:
+            now = time.monotonic()
+            self._clean_old_entries(now)
+            return self._wait_time_locked(limit_type, estimated_tokens, now)
+    
+    def get_current_usage(self):
+        with self._cond:
+            self._clean_old_entries(time.monotonic())
+            return {
+                'requests': len(self._entries),
+                'tokens': self._token_total,
+                'requests_today': self._day_count,
+                'rpm_limit': self.rpm_limit,
+                'tpm_limit': self.tpm_limit,
+                'rpd_limit': self.rpd_limit
+            }
\ No newline at end of file
@@ -0,0 +1,469 @@
+# godart/request_queue.py
+import time
+import heapq
+import asyncio
+import threading
+from itertools import count
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from .config import Config
+from .hedging import resolve_deadline, deadline_passed
+
+
+
+
+
+class _QueuedRequest:
+    __slots__ = ('priority', 'tenant', 'model', 'tokens', 'call', 'deadline', 'future', 'enqueued_at', 'reserved_model')
+    
+    def __init__(self, priority, tenant, model, tokens, call, deadline):
+        self.priority = priority
+        self.tenant = tenant
+        self.model = model
+        self.tokens = tokens
+        self.call = call
+        self.deadline = deadline
+        self.future = None
+        self.enqueued_at = time.monotonic()
+        self.reserved_model = None
+
+
+
+
+
+class _PriorityLane:
+    # Una prioridad: un FIFO por tenant y reparto justo ponderado entre tenants (stride scheduling)
+    PASSES_MAX = 1024
+    
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.virtual_time = 0.0
+        
+        self._tenants = {}
+        self._passes = {}
+        self._heap = []
+        self._seq = count()
+    
+    @property
+    def tenants(self):
+        return len(self._tenants)
+    
+    def push(self, request):
+        queue = self._tenants.get(request.tenant)
+        if queue is None:
+            queue = self._tenants[request.tenant] = deque()
+            # Un tenant que vuelve tras estar inactivo no acumula crédito por ese tiempo
+            start = max(self._passes.pop(request.tenant, 0.0), self.virtual_time)
+            heapq.heappush(self._heap, (start, next(self._seq), request.tenant))
+        queue.append(request)
+        self.size += 1
+    
+    def peek(self):
+        if not self._heap:
+            return None
+        return self._tenants[self._heap[0][2]][0]
+    
+    def pop(self, weight_for):
+        start, _, tenant = heapq.heappop(self._heap)
+        queue = self._tenants[tenant]
+        request = queue.popleft()
+        self.size -= 1
+        
+        # Cada request adelanta al tenant 1/peso: con peso 2 recibe el doble de turnos que uno con peso 1
+        self.virtual_time = start
+        finish = start + 1.0 / weight_for(tenant)
+        if queue:
+            heapq.heappush(self._heap, (finish, next(self._seq), tenant))
+        else:
+            del self._tenants[tenant]
+            self._passes[tenant] = finish
+            if len(self._passes) > self.PASSES_MAX:
+                self._passes = {key: value for key, value in self._passes.items() if value > self.virtual_time}
+        return request
+    
+    def drain(self):
+        requests = [request for queue in self._tenants.values() for request in queue]
+        self._tenants.clear()
+        self._heap.clear()
+        self.size = 0
+        return requests
+
+
+
+
+
+class _BaseRequestQueue:
+    def __init__(self, manager, priorities=None, max_size=None, workers=None, tenant_weights=None, telemetry=None):
+        self.manager = manager
+        self.priorities = tuple(priorities or Config.QUEUE_PRIORITIES)
+        self.workers = workers or Config.QUEUE_WORKERS
+        self.tenant_weights = dict(tenant_weights or {})
+        self.telemetry = telemetry if telemetry is not None else manager.telemetry
+        
+        # max_size puede ser un número para todas las prioridades o un dict por prioridad
+        max_size = max_size or Config.QUEUE_MAX_SIZE
+        self._lanes = {
+            priority: _PriorityLane(max_size.get(priority, Config.QUEUE_MAX_SIZE) if isinstance(max_size, dict) else max_size)
+            for priority in self.priorities
+        }
+        
+        self.submitted = 0
+        self.dispatched = 0
+        self.rejected = 0
+        self.expired = 0
+        self._active = 0
+        self._closed = False
+        self._deadlines = []
+        self._seq = count()
+        # Cupo tomado por requests despachados hasta que terminan, por modelo: el tracker aún no los ve al despachar
+        self._reserved = {}
+    
+    def set_weight(self, tenant, weight):
+        self.tenant_weights[tenant] = weight
+    
+    def _weight(self, tenant):
+        return self.tenant_weights.get(tenant, 1.0)
+    
+    def _build(self, method, content, priority, tenant, kwargs):
+        priority = priority or self.priorities[0]
+        if priority not in self._lanes:
+            raise ValueError(f"[!!] Prioridad inválida: {priority}. Usa una de {self.priorities}")
+        
+        # El tiempo en cola cuenta para el timeout del request
+        deadline = resolve_deadline(kwargs.pop('timeout', None), kwargs.pop('deadline', None))
+        model = kwargs.get('model') or Config.DEFAULT_MODEL
+        tokens = self.manager._estimate_tokens(content)
+        return _QueuedRequest(priority, tenant, model, tokens, lambda: method(content, deadline=deadline, **kwargs), deadline)
+    
+    def _admit_locked(self, request):
+        if self._closed:
+            raise Exception("[!!] La cola de requests está cerrada")
+        
+        lane = self._lanes[request.priority]
+        if lane.size >= lane.max_size:
+            self.rejected += 1
+            self.telemetry.inc('queue_rejected_total', priority=request.priority)
+            raise Exception(f"[!!] Cola '{request.priority}' llena ({lane.max_size} requests en espera)")
+        
+        lane.push(request)
+        if request.deadline is not None:
+            heapq.heappush(self._deadlines, (request.deadline, next(self._seq), request))
+        self.submitted += 1
+        self.telemetry.set_gauge('queue_depth', lane.size, priority=request.priority)
+    
+    def _pending_locked(self):
+        return any(lane.size for lane in self._lanes.values())
+    
+    def _capacity_wait(self, request, reserved):
+        # Con router basta con que algún modelo de la cadena tenga cupo; devuelve la espera y el modelo con cupo
+        router = self.manager.model_router
+        models = router.chain(request.model) if router is not None else (request.model,)
+        min_wait = float('inf')
+        for model in models:
+            min_wait = min(min_wait, self.manager._capacity_wait(model, request.tokens, reserved.get(model, 0)))
+            if min_wait <= 0:
+                return 0, model
+        return min_wait, None
+    
+    def _expire_locked(self):
+        # Los requests vencidos fallan al llegar su deadline aunque no estén al frente de su cola
+        while self._deadlines:
+            deadline, _, request = self._deadlines[0]
+            queued = request.enqueued_at is not None and not request.future.done()
+            if queued and not deadline_passed(deadline):
+                break
+            heapq.heappop(self._deadlines)
+            if queued:
+                self.expired += 1
+                request.future.set_exception(TimeoutError("[!!] Se agotó el tiempo del request en la cola"))
+    
+    def _heads_locked(self):
+        # Solo lee el frente de cada cola; el cupo se calcula fuera del lock porque consulta Supabase y los trackers
+        self._expire_locked()
+        heads = []
+        for priority in self.priorities:
+            lane = self._lanes[priority]
+            request = lane.peek()
+            while request is not None and request.future.done():
+                # Los requests vencidos o cancelados salen de la cola sin ocupar un worker
+                lane.pop(self._weight)
+                request = lane.peek()
+            self.telemetry.set_gauge('queue_depth', lane.size, priority=priority)
+            if request is not None:
+                heads.append(request)
+        # Copia de las reservas: solo el dispatcher las suma, así que la copia nunca subestima el cupo tomado
+        return heads, dict(self._reserved)
+    
+    def _pick(self, heads, reserved):
+        # Prioridad estricta: una prioridad baja solo avanza si las altas están vacías o su modelo no tiene cupo
+        min_wait = float('inf')
+        for request in heads:
+            # Sin keys posibles (espera infinita) se envía igual para que el manager informe el error
+            wait, model = self._capacity_wait(request, reserved)
+            if wait <= 0 or wait == float('inf'):
+                request.reserved_model = model
+                return request, 0
+            min_wait = min(min_wait, wait)
+        return None, min_wait
+    
+    def _take_locked(self, request):
+        # Mientras se calculaba el cupo pudo llegar otro request al frente o vencer este
+        lane = self._lanes[request.priority]
+        if lane.peek() is not request or request.future.done():
+            return False
+        lane.pop(self._weight)
+        self.telemetry.set_gauge('queue_depth', lane.size, priority=request.priority)
+        return True
+    
+    def _mark_dispatched(self, request):
+        # enqueued_at = None marca que el request ya salió de la cola
+        wait = time.monotonic() - request.enqueued_at
+        request.enqueued_at = None
+        self._active += 1
+        self.dispatched += 1
+        # El cupo se reserva antes de soltar el lock: el siguiente cálculo ya lo descuenta
+        if request.reserved_model is not None:
+            self._reserved[request.reserved_model] = self._reserved.get(request.reserved_model, 0) + 1
+        self.telemetry.observe('queue_wait_seconds', wait, priority=request.priority)
+    
+    def _release_locked(self, request):
+        model = request.reserved_model
+        if model is None:
+            return
+        request.reserved_model = None
+        self._reserved[model] -= 1
+        if not self._reserved[model]:
+            del self._reserved[model]
+    
+    def _idle_wait(self, wait):
+        # Los trackers dan la espera exacta; el tope cubre cupo liberado por reservas que se ajustan a la baja
+        if not self._pending_locked():
+            return None
+        if self._deadlines:
+            wait = min(wait, max(0.0, self._deadlines[0][0] - time.monotonic()))
+        return min(wait, Config.QUEUE_MAX_IDLE_WAIT)
+    
+    def get_stats(self):
+        return {
+            'priorities': {
+                priority: {
+                    'depth': lane.size,
+                    'tenants': lane.tenants,
+                    'max_size': lane.max_size
+                }
+                for priority, lane in self._lanes.items()
+            },
+            'active': self._active,
+            'submitted': self.submitted,
+            'dispatched': self.dispatched,
+            'rejected': self.rejected,
+            'expired': self.expired
+        }
+
+
+
+
+
+class RequestQueue(_BaseRequestQueue):
+    # Cola central delante de GodartManager: los requests esperan su turno en vez de fallar con el pool saturado
+    def __init__(self, manager, priorities=None, max_size=None, workers=None, tenant_weights=None, telemetry=None):
+        super().__init__(manager, priorities, max_size, workers, tenant_weights, telemetry)
+        self._cond = threading.Condition()
+        self._changes = 0
+        self._executor = None
+        self._dispatcher = None
+    
+    def _enqueue(self, request):
+        request.future = Future()
+        with self._cond:
+            self._admit_locked(request)
+            if self._dispatcher is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='godart-queue')
+                self._dispatcher = threading.Thread(target=self._dispatch_loop, name='godart-queue-dispatcher', daemon=True)
+                self._dispatcher.start()
+            self._changes += 1
+            self._cond.notify_all()
+        return request.future
+    
+    def submit(self, prompt, priority=None, tenant='default', **kwargs):
+        return self._enqueue(self._build(self.manager.make_request, prompt, priority, tenant, kwargs))
+    
+    def submit_chat(self, message, session_id="default", priority=None, tenant=None, **kwargs):
+        # Por defecto cada sesión de chat es un tenant
+        kwargs['session_id'] = session_id
+        return self._enqueue(self._build(self.manager.make_request_chat, message, priority, tenant if tenant is not None else session_id, kwargs))
+    
+    def request(self, prompt, priority=None, tenant='default', **kwargs):
+        return self.submit(prompt, priority, tenant, **kwargs).result()
+    
+    def request_chat(self, message, session_id="default", priority=None, tenant=None, **kwargs):
+        return self.submit_chat(message, session_id, priority, tenant, **kwargs).result()
+    
+    def _dispatch_loop(self):
+        with self._cond:
+            while True:
+                if self._closed and not self._pending_locked():
+                    return
+                
+                if self._active >= self.workers:
+                    self._cond.wait()
+                    continue
+                
+                heads, reserved = self._heads_locked()
+                changes = self._changes
+                self._cond.release()
+                try:
+                    request, wait = self._pick(heads, reserved)
+                finally:
+                    self._cond.acquire()
+                
+                if request is None:
+                    if self._closed and not self._pending_locked():
+                        return
+                    # Un aviso recibido mientras se calculaba el cupo se habría perdido: se reevalúa sin esperar
+                    if changes == self._changes:
+                        # Despierta cuando un tracker libera cupo, termina un request o llega uno nuevo
+                        self._cond.wait(self._idle_wait(wait))
+                    continue
+                
+                if not self._take_locked(request) or not request.future.set_running_or_notify_cancel():
+                    request.reserved_model = None
+                    continue
+                self._mark_dispatched(request)
+                self._executor.submit(self._run, request)
+    
+    def _run(self, request):
+        try:
+            request.future.set_result(request.call())
+        except BaseException as e:
+            request.future.set_exception(e)
+        finally:
+            with self._cond:
+                self._active -= 1
+                self._release_locked(request)
+                self._changes += 1
+                self._cond.notify_all()
+    
+    def close(self, wait=True, cancel_pending=False):
+        with self._cond:
+            self._closed = True
+            if cancel_pending:
+                for lane in self._lanes.values():
+                    for request in lane.drain():
+                        request.future.cancel()
+            self._cond.notify_all()
+        
+        if self._dispatcher is not None and wait:
+            self._dispatcher.join()
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+
+
+
+class AsyncRequestQueue(_BaseRequestQueue):
+    # Versión para AsyncGodartManager: el despacho corre como tarea del event loop
+    def __init__(self, manager, priorities=None, max_size=None, workers=None, tenant_weights=None, telemetry=None):
+        super().__init__(manager, priorities, max_size, workers, tenant_weights, telemetry)
+        self._wakeup = None
+        self._dispatcher = None
+        self._tasks = set()
+    
+    def _enqueue(self, request):
+        loop = asyncio.get_running_loop()
+        request.future = loop.create_future()
+        # El event loop es de un solo hilo: no hace falta lock
+        self._admit_locked(request)
+        if self._dispatcher is None:
+            self._wakeup = asyncio.Event()
+            self._dispatcher = loop.create_task(self._dispatch_loop())
+        self._wakeup.set()
+        return request.future
+    
+    def submit(self, prompt, priority=None, tenant='default', **kwargs):
+        return self._enqueue(self._build(self.manager.make_request, prompt, priority, tenant, kwargs))
+    
+    def submit_chat(self, message, session_id="default", priority=None, tenant=None, **kwargs):
+        kwargs['session_id'] = session_id
+        return self._enqueue(self._build(self.manager.make_request_chat, message, priority, tenant if tenant is not None else session_id, kwargs))
+    
+    async def request(self, prompt, priority=None, tenant='default', **kwargs):
+        return await self.submit(prompt, priority, tenant, **kwargs)
+    
+    async def request_chat(self, message, session_id="default", priority=None, tenant=None, **kwargs):
+        return await self.submit_chat(message, session_id, priority, tenant, **kwargs)
+    
+    async def _dispatch_loop(self):
+        while True:
+            if self._closed and not self._pending_locked():
+                return
+            
+            # Se limpia antes de calcular el cupo para no perder avisos que lleguen mientras tanto
+            self._wakeup.clear()
+            wait = None
+            if self._active < self.workers:
+                heads, reserved = self._heads_locked()
+                # El cupo consulta Supabase y los trackers: se calcula en un hilo para no bloquear el event loop
+                request, wait = await self.manager._run_blocking(self._pick, heads, reserved) if heads else (None, float('inf'))
+                if request is not None:
+                    if not self._take_locked(request):
+                        request.reserved_model = None
+                        continue
+                    self._mark_dispatched(request)
+                    task = asyncio.ensure_future(self._run(request))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+                    # Si quien espera cancela su future, se cancela también la llamada en curso
+                    request.future.add_done_callback(lambda future, task=task: task.cancel() if future.cancelled() else None)
+                    continue
+                if self._closed and not self._pending_locked():
+                    return
+                wait = self._idle_wait(wait)
+            
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+    
+    async def _run(self, request):
+        try:
+            result = await request.call()
+            if not request.future.done():
+                request.future.set_result(result)
+        except asyncio.CancelledError:
+            request.future.cancel()
+            raise
+        except Exception as e:
+            if not request.future.done():
+                request.future.set_exception(e)
+        finally:
+            self._active -= 1
+            self._release_locked(request)
+            self._wakeup.set()
+    
+    async def aclose(self, cancel_pending=False):
+        self._closed = True
+        if cancel_pending:
+            for lane in self._lanes.values():
+                for request in lane.drain():
+                    request.future.cancel()
+        if self._dispatcher is not None:
+            self._wakeup.set()
+            await self._dispatcher
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclose()
\ No newline at end of file
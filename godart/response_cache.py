@@ -0,0 +1,211 @@
+# godart/response_cache.py
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+from .config import Config
+from .telemetry import logger
+
+
+
+
+
+class MemoryCache:
+    def __init__(self, max_entries=None, ttl=None):
+        self.max_entries = max_entries or Config.RESPONSE_CACHE_MAX_ENTRIES
+        self.ttl = ttl if ttl is not None else Config.RESPONSE_CACHE_TTL
+        
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+    
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            
+            value, expires_at = entry
+            if expires_at and expires_at <= time.time():
+                del self._entries[key]
+                return None
+            
+            self._entries.move_to_end(key)
+            return value
+    
+    def set(self, key, value, expires_at=None):
+        if expires_at is None and self.ttl:
+            expires_at = time.time() + self.ttl
+        
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+
+
+
+class SQLiteCache:
+    def __init__(self, path, ttl=None):
+        self.path = path
+        self.ttl = ttl if ttl is not None else Config.RESPONSE_CACHE_TTL
+        
+        self._local = threading.local()
+        self._writes = 0
+        
+        conn = self._connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS godart_response_cache ('
+            'key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)'
+        )
+        conn.commit()
+    
+    def _connect(self):
+        # sqlite3 no comparte conexiones entre hilos: una por hilo
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+    
+    def get(self, key):
+        return self.get_with_expiry(key)[0]
+    
+    def get_with_expiry(self, key):
+        conn = self._connect()
+        row = conn.execute(
+            'SELECT value, expires_at FROM godart_response_cache WHERE key = ?',
+            (key,)
+        ).fetchone()
+        
+        if row is None or (row[1] and row[1] <= time.time()):
+            return None, None
+        return row
+    
+    def set(self, key, value, expires_at=None):
+        if expires_at is None and self.ttl:
+            expires_at = time.time() + self.ttl
+        
+        conn = self._connect()
+        conn.execute(
+            'INSERT OR REPLACE INTO godart_response_cache (key, value, expires_at) VALUES (?, ?, ?)',
+            (key, value, expires_at)
+        )
+        conn.commit()
+        
+        self._writes += 1
+        if self._writes % 500 == 0:
+            self.prune()
+    
+    def delete(self, key):
+        conn = self._connect()
+        conn.execute('DELETE FROM godart_response_cache WHERE key = ?', (key,))
+        conn.commit()
+    
+    def prune(self):
+        conn = self._connect()
+        conn.execute('DELETE FROM godart_response_cache WHERE expires_at IS NOT NULL AND expires_at <= ?', (time.time(),))
+        conn.commit()
+    
+    def clear(self):
+        conn = self._connect()
+        conn.execute('DELETE FROM godart_response_cache')
+        conn.commit()
+
+
+
+
+
+class ResponseCache:
+    def __init__(self, memory=None, disk=None, sqlite_path=None, ttl=None, max_entries=None):
+        self.memory = memory if memory is not None else MemoryCache(max_entries, ttl)
+        self.disk = disk
+        if self.disk is None and sqlite_path:
+            self.disk = SQLiteCache(sqlite_path, ttl)
+        
+        self.hits = 0
+        self.misses = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self._stats_lock = threading.Lock()
+    
+    @staticmethod
+    def make_key(model_real, system_instruction, config, prompt):
+        config_data = config.model_dump(mode='json', exclude_none=True) if hasattr(config, 'model_dump') else config
+        payload = json.dumps(
+            [model_real, system_instruction, config_data, prompt],
+            sort_keys = True,
+            ensure_ascii = False,
+            default = str
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is not None:
+            with self._stats_lock:
+                self.hits += 1
+                self.memory_hits += 1
+            return value
+        
+        if self.disk is not None:
+            try:
+                value, expires_at = self.disk.get_with_expiry(key)
+            except Exception as e:
+                logger.error(f"[!!] Error al leer cache SQLite: {e}")
+                value, expires_at = None, None
+            
+            if value is not None:
+                # Se promueve a memoria respetando la expiración original
+                self.memory.set(key, value, expires_at)
+                with self._stats_lock:
+                    self.hits += 1
+                    self.disk_hits += 1
+                return value
+        
+        with self._stats_lock:
+            self.misses += 1
+        return None
+    
+    def set(self, key, value):
+        self.memory.set(key, value)
+        if self.disk is not None:
+            try:
+                self.disk.set(key, value)
+            except Exception as e:
+                logger.error(f"[!!] Error al guardar en cache SQLite: {e}")
+    
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+    
+    def get_stats(self):
+        with self._stats_lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'hit_rate': round(self.hits / total * 100, 2) if total else 0.0,
+                'memory_entries': len(self.memory)
+            }
\ No newline at end of file
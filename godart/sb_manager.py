@@ -1,55 +1,120 @@
 # godart/sb_manager.py
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from supabase import create_client, Client
 
 from .config import Config
+from .log_sink import RequestLogSink
+from .rate_limiter import next_daily_reset
+from .telemetry import logger, get_telemetry
 
 
 
 
 
 class SupabaseManager:
-    def __init__(self):
-        Config.validate()
-        self.client: Client = create_client(Config.SUPABASE_URL, Config.SUPABASE_SERVICE_KEY)
+    def __init__(self, buffered_logging=None, snapshot_path=None, telemetry=None, client=None):
+        # client permite inyectar un cliente ya creado (por ejemplo godart.fakes.FakeSupabaseClient)
+        if client is None:
+            Config.validate()
+            client = create_client(Config.SUPABASE_URL, Config.SUPABASE_SERVICE_KEY)
+        self.client: Client = client
+        self.telemetry = telemetry if telemetry is not None else get_telemetry()
         self._model_cache = {}
+        self._missing_models = {}
         self._context_cache = {}
-    
-    def get_model_config(self, model_alias):
-        if model_alias in self._model_cache:
-            return self._model_cache[model_alias]
+        self.contexts_version = 0
         
+        self._keys_cache = None
+        self._keys_cache_time = 0
+        # key_id -> instante (time.time()) hasta el que la key no vuelve al pool aunque Supabase la liste
+        self._excluded_keys = {}
+        self.keys_version = 0
+        self._keys_lock = threading.Lock()
+        self._keys_refreshing = False
+        
+        self._bulk_logging_available = True
+        self._bulk_models_available = True
+        self._log_sink = None
+        if buffered_logging if buffered_logging is not None else Config.LOG_BUFFERED:
+            self._log_sink = RequestLogSink(self._flush_log_batch)
+        
+        self.snapshot_path = snapshot_path or Config.SUPABASE_SNAPSHOT_PATH
+        self._revalidating = False
+        if self.snapshot_path and self._load_snapshot():
+            # Se arranca con el snapshot y se revalida contra Supabase sin bloquear
+            self._revalidate_background()
+    
+    def _rpc(self, name, params=None):
+        # Cada llamada a Supabase queda medida como fase 'supabase'
+        with self.telemetry.span('supabase', rpc=name):
+            return self.client.rpc(name, params or {}).execute()
+    
+    def _is_missing_rpc(self, error):
+        error_msg = str(error).lower()
+        return 'pgrst202' in error_msg or 'could not find the function' in error_msg
+    
+    def _fetch_model_config(self, model_alias):
         try:
-            response = self.client.rpc('get_godart_model_config', {
+            response = self._rpc('get_godart_model_config', {
                 'p_model_alias': model_alias
-            }).execute()
+            })
             
             if response.data and len(response.data) > 0:
-                config = response.data[0]
-                self._model_cache[model_alias] = config
-                return config
+                self._missing_models.pop(model_alias, None)
+                return response.data[0]
+            # Solo se recuerda la ausencia confirmada por Supabase; un error de red se reintenta en la próxima llamada
+            self._missing_models[model_alias] = time.monotonic()
             return None
         except Exception as e:
-            print(f"[!!] Error al obtener configuración del modelo: {e}")
+            logger.error(f"[!!] Error al obtener configuración del modelo: {e}")
             return None
     
-    def get_context(self, context_key):
-        if context_key in self._context_cache:
-            return self._context_cache[context_key]
+    def get_model_config(self, model_alias):
+        if model_alias in self._model_cache:
+            return self._model_cache[model_alias]
+        missing_since = self._missing_models.get(model_alias)
+        if missing_since is not None and time.monotonic() - missing_since < Config.MODEL_CONFIG_MISS_TTL:
+            return None
         
+        config = self._fetch_model_config(model_alias)
+        if config:
+            self._model_cache[model_alias] = config
+        return config
+    
+    def _fetch_context(self, context_key):
         try:
-            response = self.client.rpc('get_godart_context', {
+            response = self._rpc('get_godart_context', {
                 'p_context_key': context_key
-            }).execute()
+            })
             
             if response.data and len(response.data) > 0:
-                context = response.data[0]['context_content']
-                self._context_cache[context_key] = context
-                return context
+                return response.data[0]['context_content']
             return None
         except Exception as e:
-            print(f"[!!] Error al obtener contexto: {e}")
+            logger.error(f"[!!] Error al obtener contexto: {e}")
             return None
     
+    def get_context(self, context_key):
+        if context_key in self._context_cache:
+            return self._context_cache[context_key]
+        
+        context = self._fetch_context(context_key)
+        if context:
+            self._context_cache[context_key] = context
+        return context
+    
+    def invalidate_contexts(self, context_key=None):
+        # Llamar tras editar identidades o tonos en Supabase; también descarta los caches de Gemini
+        if context_key:
+            self._context_cache.pop(context_key, None)
+        else:
+            self._context_cache.clear()
+        self.contexts_version += 1
+    
     def get_identity(self):
         return self.get_context('identity_default')
     
@@ -60,45 +125,249 @@ class SupabaseManager:
     
     def get_all_tones(self):
         try:
-            response = self.client.rpc('get_all_godart_tones').execute()
+            response = self._rpc('get_all_godart_tones')
             if response.data:
                 return {item['context_key']: item['context_content'] for item in response.data}
             return {}
         except Exception as e:
-            print(f"[!!] Error al obtener tonos: {e}")
+            logger.error(f"[!!] Error al obtener tonos: {e}")
             return {}
     
     def get_next_available_key(self):
         try:
-            response = self.client.rpc('get_next_available_godart_key').execute()
+            response = self._rpc('get_next_available_godart_key')
             return response.data[0] if response.data else None
         except Exception as e:
-            print(f"[!!] Error al obtener API key: {e}")
+            logger.error(f"[!!] Error al obtener API key: {e}")
             return None
     
-    def get_all_available_keys(self):
+    def _fetch_all_available_keys(self):
         try:
-            response = self.client.rpc('get_all_available_godart_keys').execute()
+            response = self._rpc('get_all_available_godart_keys')
             return response.data if response.data else []
         except Exception as e:
-            print(f"[!!] Error al obtener API keys: {e}")
-            return []
+            logger.error(f"[!!] Error al obtener API keys: {e}")
+            return None
+    
+    def _store_keys(self, keys):
+        with self._keys_lock:
+            if self._excluded_keys:
+                now = time.time()
+                self._excluded_keys = {key_id: until for key_id, until in self._excluded_keys.items() if until > now}
+                keys = [k for k in keys if k['key_id'] not in self._excluded_keys]
+            self._keys_cache = keys
+            self._keys_cache_time = time.monotonic()
+            self.keys_version += 1
+            return keys
+    
+    def _refresh_keys_background(self):
+        with self._keys_lock:
+            if self._keys_refreshing:
+                return
+            self._keys_refreshing = True
+        
+        def refresh():
+            try:
+                keys = self._fetch_all_available_keys()
+                if keys is not None:
+                    self._store_keys(keys)
+            finally:
+                with self._keys_lock:
+                    self._keys_refreshing = False
+        
+        threading.Thread(target=refresh, daemon=True).start()
+    
+    def get_all_available_keys(self, force_refresh=False):
+        with self._keys_lock:
+            keys = self._keys_cache
+            age = time.monotonic() - self._keys_cache_time
+        
+        # Solo se bloquea en la primera carga o si se fuerza el refresco
+        if keys is None or force_refresh:
+            fetched = self._fetch_all_available_keys()
+            if fetched is None:
+                return list(keys) if keys else []
+            return list(self._store_keys(fetched))
+        
+        if age >= Config.KEY_POOL_TTL * Config.KEY_POOL_REFRESH_AHEAD:
+            self._refresh_keys_background()
+        return list(keys)
+    
+    def invalidate_key(self, key_id, until=None):
+        # La key sale del pool hasta `until` (por defecto el reinicio de la cuota diaria); los refrescos no la devuelven
+        with self._keys_lock:
+            self._excluded_keys[key_id] = until if until is not None else next_daily_reset()
+            if self._keys_cache is not None:
+                self._keys_cache = [k for k in self._keys_cache if k['key_id'] != key_id]
+                self.keys_version += 1
+    
+    def invalidate_keys_cache(self):
+        with self._keys_lock:
+            self._keys_cache_time = 0
+        self._refresh_keys_background()
+    
+    def _flush_log_batch(self, records):
+        if self._bulk_logging_available:
+            try:
+                self._rpc('log_godart_requests_bulk', {'p_logs': records})
+                return
+            except Exception as e:
+                if not self._is_missing_rpc(e):
+                    raise
+                logger.error("[!!] RPC log_godart_requests_bulk no disponible. Usando log_godart_request por registro")
+                self._bulk_logging_available = False
+        
+        for record in records:
+            self._rpc('log_godart_request', {
+                'p_key_id': record['key_id'],
+                'p_success': record['success'],
+                'p_error_message': record['error_message'],
+                'p_model': record['model']
+            })
     
     def log_request(self, key_id, success, error_message=None, model=None):
+        if self._log_sink is not None:
+            self._log_sink.emit(RequestLogSink.build_record(key_id, success, error_message, model))
+            return
+        
         try:
-            self.client.rpc('log_godart_request', {
+            self._rpc('log_godart_request', {
                 'p_key_id': str(key_id),
                 'p_success': success,
                 'p_error_message': error_message,
                 'p_model': model or Config.DEFAULT_MODEL
-            }).execute()
+            })
         except Exception as e:
-            print(f"[!!] Error al registrar log: {e}")
+            logger.error(f"[!!] Error al registrar log: {e}")
     
     def get_statistics(self):
         try:
-            response = self.client.rpc('get_godart_keys_stats').execute()
+            response = self._rpc('get_godart_keys_stats')
             return response.data if response.data else []
         except Exception as e:
-            print(f"[!!] Error: {e}")
-            return []
\ No newline at end of file
+            logger.error(f"[!!] Error: {e}")
+            return []
+    
+    def _fetch_all_model_configs(self, models):
+        if self._bulk_models_available:
+            try:
+                response = self._rpc('get_all_godart_model_configs')
+                return {item['model_alias']: item for item in response.data or []}
+            except Exception as e:
+                if not self._is_missing_rpc(e):
+                    logger.error(f"[!!] Error al obtener modelos: {e}")
+                    return None
+                logger.error("[!!] RPC get_all_godart_model_configs no disponible. Consultando cada modelo")
+                self._bulk_models_available = False
+        
+        # Sin la RPC masiva, los alias conocidos se piden en paralelo
+        with ThreadPoolExecutor(max_workers=max(1, len(models))) as executor:
+            configs = dict(zip(models, executor.map(self._fetch_model_config, models)))
+        return {alias: config for alias, config in configs.items() if config}
+    
+    def _fetch_all_contexts(self):
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            identity = executor.submit(self._fetch_context, 'identity_default')
+            tones = executor.submit(self.get_all_tones)
+            contexts = dict(tones.result())
+            if identity.result():
+                contexts['identity_default'] = identity.result()
+        return contexts
+    
+    def preload(self, models=None, save_snapshot=True):
+        models = list(models or Config.SUPABASE_PRELOAD_MODELS)
+        
+        # Modelos, contextos y keys en paralelo: unas pocas llamadas en vez de una por alias y tono
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            models_future = executor.submit(self._fetch_all_model_configs, models)
+            contexts_future = executor.submit(self._fetch_all_contexts)
+            keys_future = executor.submit(self._fetch_all_available_keys)
+            model_configs = models_future.result()
+            contexts = contexts_future.result()
+            keys = keys_future.result()
+        
+        if model_configs:
+            self._model_cache.update(model_configs)
+        if contexts:
+            changed = any(self._context_cache.get(key) != value for key, value in contexts.items())
+            self._context_cache.update(contexts)
+            if changed:
+                self.contexts_version += 1
+        if keys is not None:
+            self._store_keys(keys)
+        
+        if save_snapshot and self.snapshot_path:
+            self.save_snapshot()
+        
+        logger.info(f" - Precarga: {len(model_configs or {})} modelos, {len(contexts)} contextos, {len(keys or [])} keys")
+        return {
+            'models': len(model_configs or {}),
+            'contexts': len(contexts),
+            'keys': len(keys or [])
+        }
+    
+    def save_snapshot(self, path=None):
+        path = path or self.snapshot_path
+        with self._keys_lock:
+            keys = self._keys_cache
+        
+        snapshot = {
+            'saved_at': time.time(),
+            'models': dict(self._model_cache),
+            'contexts': dict(self._context_cache),
+            'keys': keys
+        }
+        
+        # Incluye API keys: se escribe con permisos 600 y se reemplaza de forma atómica
+        tmp_path = f"{path}.tmp"
+        try:
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w', encoding='utf-8') as fh:
+                json.dump(snapshot, fh, ensure_ascii=False, default=str)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.error(f"[!!] Error al guardar snapshot: {e}")
+    
+    def _load_snapshot(self):
+        try:
+            with open(self.snapshot_path, encoding='utf-8') as fh:
+                snapshot = json.load(fh)
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            logger.error(f"[!!] Snapshot inválido, se ignora: {e}")
+            return False
+        
+        if time.time() - snapshot.get('saved_at', 0) > Config.SUPABASE_SNAPSHOT_MAX_AGE:
+            logger.info(" - Snapshot expirado, se ignora")
+            return False
+        
+        self._model_cache.update(snapshot.get('models') or {})
+        self._context_cache.update(snapshot.get('contexts') or {})
+        if snapshot.get('keys') is not None:
+            # La revalidación en segundo plano reemplaza estas keys apenas responda Supabase
+            self._store_keys(snapshot['keys'])
+        return True
+    
+    def _revalidate_background(self):
+        if self._revalidating:
+            return
+        self._revalidating = True
+        
+        def revalidate():
+            try:
+                self.preload()
+            except Exception as e:
+                logger.error(f"[!!] Error al revalidar snapshot: {e}")
+            finally:
+                self._revalidating = False
+        
+        threading.Thread(target=revalidate, daemon=True).start()
+    
+    def flush_logs(self):
+        if self._log_sink is not None:
+            self._log_sink.flush()
+    
+    def close(self):
+        if self._log_sink is not None:
+            self._log_sink.close()
\ No newline at end of file
@@ -0,0 +1,195 @@
+# godart/session_store.py
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from .config import Config
+from .telemetry import logger
+
+
+
+
+
+def serialize_history(history):
+    serialized = []
+    for content in history or []:
+        if hasattr(content, 'model_dump'):
+            content = content.model_dump(mode='json', exclude_none=True)
+        serialized.append(content)
+    return serialized
+
+
+def _content_text(content):
+    parts = content.get('parts') or []
+    return ' '.join(part.get('text') or '' for part in parts)
+
+
+def trim_history(history, token_budget, estimate_tokens, summarizer=None):
+    if not token_budget or not history:
+        return history
+    
+    costs = [estimate_tokens(_content_text(content)) for content in history]
+    if sum(costs) <= token_budget:
+        return history
+    
+    # Se conservan los turnos más recientes que caben en el presupuesto
+    kept_from = len(history)
+    used = 0
+    for index in range(len(history) - 1, -1, -1):
+        if used + costs[index] > token_budget:
+            break
+        used += costs[index]
+        kept_from = index
+    
+    # La ventana debe empezar en un turno del usuario para no dejar respuestas huérfanas
+    while kept_from < len(history) and history[kept_from].get('role') != 'user':
+        kept_from += 1
+    
+    window = history[kept_from:]
+    dropped = history[:kept_from]
+    
+    if summarizer and dropped:
+        try:
+            summary = summarizer(dropped)
+        except Exception as e:
+            logger.error(f"[!!] Error al resumir historial: {e}")
+            summary = None
+        
+        if summary:
+            return [
+                {'role': 'user', 'parts': [{'text': f"Resumen de la conversación previa:\n{summary}"}]},
+                {'role': 'model', 'parts': [{'text': "Entendido, continúo con ese contexto."}]}
+            ] + window
+    return window
+
+
+
+
+
+class MemorySessionStore:
+    def __init__(self, max_sessions=None, idle_ttl=None):
+        self.max_sessions = max_sessions or Config.CHAT_MAX_SESSIONS
+        self.idle_ttl = idle_ttl if idle_ttl is not None else Config.CHAT_SESSION_IDLE_TTL
+        
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+    
+    def _evict_locked(self, now):
+        # OrderedDict en orden LRU: las sesiones inactivas más antiguas están al inicio
+        while self._sessions:
+            session_id, (_, last_used) = next(iter(self._sessions.items()))
+            idle = self.idle_ttl and now - last_used > self.idle_ttl
+            if not idle and len(self._sessions) <= self.max_sessions:
+                break
+            del self._sessions[session_id]
+    
+    def load(self, session_id):
+        now = time.time()
+        with self._lock:
+            self._evict_locked(now)
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            self._sessions[session_id] = (entry[0], now)
+            self._sessions.move_to_end(session_id)
+            return list(entry[0])
+    
+    def save(self, session_id, history):
+        now = time.time()
+        with self._lock:
+            self._sessions[session_id] = (serialize_history(history), now)
+            self._sessions.move_to_end(session_id)
+            self._evict_locked(now)
+    
+    def delete(self, session_id):
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+    
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+
+
+
+
+
+class SQLiteSessionStore:
+    def __init__(self, path, idle_ttl=None, max_sessions=None):
+        self.path = path
+        self.idle_ttl = idle_ttl if idle_ttl is not None else Config.CHAT_SESSION_IDLE_TTL
+        self.max_sessions = max_sessions or Config.CHAT_MAX_SESSIONS
+        
+        self._local = threading.local()
+        self._writes = 0
+        
+        conn = self._connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS godart_chat_sessions ('
+            'session_id TEXT PRIMARY KEY, history TEXT NOT NULL, updated_at REAL NOT NULL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_godart_chat_sessions_updated ON godart_chat_sessions (updated_at)')
+        conn.commit()
+    
+    def _connect(self):
+        # sqlite3 no comparte conexiones entre hilos: una por hilo
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+    
+    def load(self, session_id):
+        conn = self._connect()
+        row = conn.execute(
+            'SELECT history, updated_at FROM godart_chat_sessions WHERE session_id = ?',
+            (session_id,)
+        ).fetchone()
+        
+        if row is None:
+            return None
+        if self.idle_ttl and time.time() - row[1] > self.idle_ttl:
+            self.delete(session_id)
+            return None
+        return json.loads(row[0])
+    
+    def save(self, session_id, history):
+        conn = self._connect()
+        conn.execute(
+            'INSERT OR REPLACE INTO godart_chat_sessions (session_id, history, updated_at) VALUES (?, ?, ?)',
+            (session_id, json.dumps(serialize_history(history), ensure_ascii=False), time.time())
+        )
+        conn.commit()
+        
+        self._writes += 1
+        if self._writes % 200 == 0:
+            self.evict()
+    
+    def evict(self):
+        conn = self._connect()
+        if self.idle_ttl:
+            conn.execute('DELETE FROM godart_chat_sessions WHERE updated_at < ?', (time.time() - self.idle_ttl,))
+        conn.execute(
+            'DELETE FROM godart_chat_sessions WHERE session_id NOT IN '
+            '(SELECT session_id FROM godart_chat_sessions ORDER BY updated_at DESC LIMIT ?)',
+            (self.max_sessions,)
+        )
+        conn.commit()
+    
+    def delete(self, session_id):
+        conn = self._connect()
+        cursor = conn.execute('DELETE FROM godart_chat_sessions WHERE session_id = ?', (session_id,))
+        conn.commit()
+        return cursor.rowcount > 0
+    
+    def clear(self):
+        conn = self._connect()
+        conn.execute('DELETE FROM godart_chat_sessions')
+        conn.commit()
\ No newline at end of file
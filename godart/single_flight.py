@@ -0,0 +1,121 @@
+# godart/single_flight.py
+import asyncio
+import threading
+
+
+
+
+
+class _Flight:
+    __slots__ = ('event', 'result', 'error', 'followers')
+    
+    def __init__(self, event):
+        self.event = event
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+
+
+
+
+class SingleFlight:
+    # Requests idénticos en curso comparten una sola llamada: el primero la hace y el resto espera su resultado
+    def __init__(self):
+        self.leaders = 0
+        self.collapsed = 0
+        
+        self._flights = {}
+        self._lock = threading.Lock()
+    
+    def do(self, key, func, timeout=None):
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight(threading.Event())
+                self.leaders += 1
+                leader = True
+            else:
+                flight.followers += 1
+                self.collapsed += 1
+                leader = False
+        
+        if not leader:
+            if not flight.event.wait(timeout):
+                raise TimeoutError("[!!] Se agotó el tiempo del request")
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+        
+        try:
+            flight.result = func()
+            return flight.result, False
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.event.set()
+    
+    def get_stats(self):
+        with self._lock:
+            return {
+                'in_flight': len(self._flights),
+                'leaders': self.leaders,
+                'collapsed': self.collapsed
+            }
+
+
+
+
+
+class AsyncSingleFlight:
+    # Versión para asyncio: los seguidores esperan el Future del primer request sin ocupar hilos
+    def __init__(self):
+        self.leaders = 0
+        self.collapsed = 0
+        
+        self._flights = {}
+    
+    async def do(self, key, coro_factory, timeout=None):
+        # El event loop es de un solo hilo: no hace falta lock
+        flight = self._flights.get(key)
+        if flight is not None:
+            flight.followers += 1
+            self.collapsed += 1
+            # shield: cancelar a un seguidor (o su timeout) no cancela la llamada compartida
+            try:
+                return await asyncio.wait_for(asyncio.shield(flight.event), timeout), True
+            except asyncio.TimeoutError:
+                raise TimeoutError("[!!] Se agotó el tiempo del request")
+        
+        flight = self._flights[key] = _Flight(asyncio.get_running_loop().create_future())
+        self.leaders += 1
+        try:
+            result = await coro_factory()
+            flight.event.set_result(result)
+            return result, False
+        except asyncio.CancelledError:
+            # Los seguidores no fueron cancelados: reciben un error propio en vez de CancelledError
+            if flight.followers:
+                flight.event.set_exception(Exception("[!!] El request compartido fue cancelado"))
+                flight.event.exception()
+            raise
+        except Exception as e:
+            if flight.followers:
+                # exception() marca el error como consumido aunque todos los seguidores se hayan cancelado
+                flight.event.set_exception(e)
+                flight.event.exception()
+            raise
+        finally:
+            del self._flights[key]
+            if not flight.event.done():
+                flight.event.cancel()
+    
+    def get_stats(self):
+        return {
+            'in_flight': len(self._flights),
+            'leaders': self.leaders,
+            'collapsed': self.collapsed
+        }
\ No newline at end of file
@@ -0,0 +1,64 @@
+# godart/streaming.py
+import time
+
+
+
+
+
+class _BaseStream:
+    def __init__(self, model=None, started_at=None):
+        self.model = model
+        self.key_id = None
+        self.usage_metadata = None
+        self.started_at = started_at if started_at is not None else time.perf_counter()
+        self.time_to_first_token = None
+        self.total_time = None
+        self._parts = []
+    
+    @property
+    def text(self):
+        return ''.join(self._parts)
+    
+    def _on_chunk(self, text):
+        if self.time_to_first_token is None:
+            self.time_to_first_token = time.perf_counter() - self.started_at
+        self._parts.append(text)
+    
+    def _on_finish(self):
+        self.total_time = time.perf_counter() - self.started_at
+
+
+
+
+
+class GodartStream(_BaseStream):
+    def __init__(self, chunks, model=None, started_at=None):
+        super().__init__(model, started_at)
+        self._chunks = chunks(self)
+    
+    def __iter__(self):
+        for text in self._chunks:
+            self._on_chunk(text)
+            yield text
+        self._on_finish()
+    
+    def close(self):
+        self._chunks.close()
+
+
+
+
+
+class AsyncGodartStream(_BaseStream):
+    def __init__(self, chunks, model=None, started_at=None):
+        super().__init__(model, started_at)
+        self._chunks = chunks(self)
+    
+    async def __aiter__(self):
+        async for text in self._chunks:
+            self._on_chunk(text)
+            yield text
+        self._on_finish()
+    
+    async def aclose(self):
+        await self._chunks.aclose()
\ No newline at end of file
@@ -0,0 +1,326 @@
+# godart/telemetry.py
+import sys
+import time
+import bisect
+import logging
+import threading
+
+from .config import Config
+
+
+
+
+
+logger = logging.getLogger('godart')
+# Como toda librería: sin handlers propios al importar, los mensajes siguen la configuración de logging de la app
+logger.addHandler(logging.NullHandler())
+
+_console_handler = None
+
+
+def configure_logging(level=None, console=None):
+    # Opt-in para scripts sin logging propio: configure_logging(console=True) imprime los mensajes en stdout
+    global _console_handler
+    level = level if level is not None else Config.TELEMETRY_LOG_LEVEL
+    console = console if console is not None else Config.TELEMETRY_CONSOLE
+    
+    logger.setLevel(logging.getLevelName(level) if isinstance(level, str) else level)
+    if console and _console_handler is None:
+        _console_handler = logging.StreamHandler(sys.stdout)
+        _console_handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(_console_handler)
+        # Sin propagar para que un handler raíz de la app no duplique cada mensaje
+        logger.propagate = False
+    elif not console and _console_handler is not None:
+        logger.removeHandler(_console_handler)
+        _console_handler = None
+        logger.propagate = True
+    return logger
+
+
+
+
+
+class Span:
+    # Interfaz mínima al estilo OpenTelemetry; al cerrarse registra la duración como fase
+    __slots__ = ('name', 'attributes', 'start_time', 'end_time', 'status', 'error', '_telemetry', '_native')
+    
+    def __init__(self, telemetry, name, attributes, native=None):
+        self.name = name
+        self.attributes = attributes
+        self.start_time = time.perf_counter()
+        self.end_time = None
+        self.status = 'ok'
+        self.error = None
+        self._telemetry = telemetry
+        self._native = native
+    
+    @property
+    def duration(self):
+        end = self.end_time if self.end_time is not None else time.perf_counter()
+        return end - self.start_time
+    
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+        if self._native is not None:
+            self._native.set_attribute(key, value)
+    
+    def set_attributes(self, attributes):
+        for key, value in attributes.items():
+            self.set_attribute(key, value)
+    
+    def set_status(self, status, description=None):
+        self.status = status
+        if description:
+            self.error = description
+    
+    def record_exception(self, exception):
+        self.status = 'error'
+        self.error = str(exception)
+        if self._native is not None:
+            self._native.record_exception(exception)
+    
+    def end(self):
+        if self.end_time is not None:
+            return
+        self.end_time = time.perf_counter()
+        if self._native is not None:
+            self._native.end()
+        self._telemetry._finish_span(self)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        # GeneratorExit y KeyboardInterrupt no son errores del request
+        if exc_value is not None and isinstance(exc_value, Exception):
+            self.record_exception(exc_value)
+        self.end()
+        return False
+
+
+
+
+
+class Telemetry:
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+    # Atributos de un span que pasan a ser etiquetas del histograma de fases
+    SPAN_LABELS = ('model', 'key_id', 'rpc')
+    
+    HELP = {
+        'requests_total': 'Requests a Gemini por resultado',
+        'quota_errors_total': 'Errores 429 o de cuota por key y modelo',
+        'rotations_total': 'Rotaciones a otra key del pool',
+        'coalesced_total': 'Requests idénticos que compartieron una llamada en curso',
+        'hedges_total': 'Requests duplicados en otra key por latencia alta',
+        'circuit_transitions_total': 'Cambios de estado del circuit breaker por key',
+        'model_fallbacks_total': 'Requests respondidos por un modelo distinto del pedido',
+        'queue_rejected_total': 'Requests rechazados por cola llena',
+        'queue_depth': 'Requests esperando en la cola por prioridad',
+        'queue_wait_seconds': 'Tiempo de espera en la cola antes de enviarse',
+        'batch_job_shards_total': 'Shards de batch jobs enviados y terminados por estado',
+        'tokens_total': 'Tokens reportados por Gemini',
+        'phase_seconds': 'Duración de cada fase del request',
+        'ttft_seconds': 'Tiempo hasta el primer token en streams'
+    }
+    
+    def __init__(self, hooks=None, tracer=None, buckets=None, namespace='godart'):
+        self.tracer = tracer
+        self.buckets = tuple(sorted(buckets or self.DEFAULT_BUCKETS))
+        self.namespace = namespace
+        
+        self._hooks = list(hooks or [])
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+    
+    def add_hook(self, hook):
+        # hook(event, fields): recibe cada evento emitido
+        self._hooks.append(hook)
+    
+    def remove_hook(self, hook):
+        if hook in self._hooks:
+            self._hooks.remove(hook)
+    
+    def emit(self, event, **fields):
+        for hook in list(self._hooks):
+            try:
+                hook(event, fields)
+            except Exception as e:
+                logger.error(f"[!!] Error en hook de telemetría: {e}")
+    
+    def _labels(self, labels):
+        return tuple(sorted((key, '' if value is None else str(value)) for key, value in labels.items()))
+    
+    def inc(self, name, value=1, **labels):
+        key = (name, self._labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+    
+    def set_gauge(self, name, value, **labels):
+        key = (name, self._labels(labels))
+        with self._lock:
+            self._gauges[key] = value
+    
+    def observe(self, name, value, **labels):
+        key = (name, self._labels(labels))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+    
+    def span(self, name, **attributes):
+        native = None
+        if self.tracer is not None:
+            native = self.tracer.start_span(name, attributes={k: v for k, v in attributes.items() if v is not None})
+        return Span(self, name, attributes, native)
+    
+    def _finish_span(self, span):
+        labels = {key: span.attributes[key] for key in self.SPAN_LABELS if span.attributes.get(key) is not None}
+        self.observe('phase_seconds', span.duration, phase=span.name, **labels)
+        if self._hooks:
+            self.emit('span', name=span.name, duration=span.duration, status=span.status, error=span.error, **span.attributes)
+    
+    def record_request(self, model, key_id, status):
+        self.inc('requests_total', model=model, key_id=key_id, status=status)
+        if self._hooks:
+            self.emit('request', model=model, key_id=key_id, status=status)
+    
+    def record_quota_error(self, model, key_id):
+        self.inc('quota_errors_total', model=model, key_id=key_id)
+        if self._hooks:
+            self.emit('quota_error', model=model, key_id=key_id)
+    
+    def record_rotation(self, model, key_id):
+        self.inc('rotations_total', model=model, key_id=key_id)
+        if self._hooks:
+            self.emit('rotation', model=model, key_id=key_id)
+    
+    def record_coalesced(self, model):
+        self.inc('coalesced_total', model=model)
+        if self._hooks:
+            self.emit('coalesced', model=model)
+    
+    def record_hedge(self, model):
+        self.inc('hedges_total', model=model)
+        if self._hooks:
+            self.emit('hedge', model=model)
+    
+    def record_circuit(self, model, key_id, state):
+        self.inc('circuit_transitions_total', model=model, key_id=key_id, state=state)
+        if self._hooks:
+            self.emit('circuit', model=model, key_id=key_id, state=state)
+    
+    def record_fallback(self, requested, model):
+        self.inc('model_fallbacks_total', requested=requested, model=model)
+        if self._hooks:
+            self.emit('fallback', requested=requested, model=model)
+    
+    def record_tokens(self, model, key_id, usage):
+        prompt = usage.prompt_token_count or 0
+        output = usage.candidates_token_count or 0
+        cached = usage.cached_content_token_count or 0
+        self.inc('tokens_total', prompt, model=model, key_id=key_id, kind='prompt')
+        self.inc('tokens_total', output, model=model, key_id=key_id, kind='output')
+        if cached:
+            self.inc('tokens_total', cached, model=model, key_id=key_id, kind='cached')
+        if self._hooks:
+            self.emit('tokens', model=model, key_id=key_id, prompt=prompt, output=output, cached=cached)
+    
+    def record_ttft(self, model, key_id, seconds):
+        self.observe('ttft_seconds', seconds, model=model, key_id=key_id)
+        if self._hooks:
+            self.emit('ttft', model=model, key_id=key_id, seconds=seconds)
+    
+    def get_stats(self):
+        with self._lock:
+            counters = {key: value for key, value in self._counters.items()}
+            gauges = dict(self._gauges)
+            histograms = {key: (list(h[0]), h[1], h[2]) for key, h in self._histograms.items()}
+        
+        stats = {'counters': {}, 'gauges': {}, 'histograms': {}}
+        for (name, labels), value in counters.items():
+            stats['counters'].setdefault(name, []).append({'labels': dict(labels), 'value': value})
+        for (name, labels), value in gauges.items():
+            stats['gauges'].setdefault(name, []).append({'labels': dict(labels), 'value': value})
+        for (name, labels), (_, total, count) in histograms.items():
+            stats['histograms'].setdefault(name, []).append({
+                'labels': dict(labels),
+                'count': count,
+                'sum': round(total, 6),
+                'avg': round(total / count, 6) if count else 0
+            })
+        return stats
+    
+    def total(self, name):
+        # Suma de un contador sobre todas sus etiquetas
+        with self._lock:
+            return sum(value for (counter, _), value in self._counters.items() if counter == name)
+    
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+    
+    def _format_labels(self, labels, extra=None):
+        items = list(labels) + list(extra or [])
+        if not items:
+            return ''
+        escaped = (
+            f'{key}="' + value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+            for key, value in items
+        )
+        return '{' + ','.join(escaped) + '}'
+    
+    def export_prometheus(self):
+        with self._lock:
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+            histograms = sorted((key, (list(h[0]), h[1], h[2])) for key, h in self._histograms.items())
+        
+        lines = []
+        described = set()
+        
+        def describe(name, kind):
+            if name in described:
+                return
+            described.add(name)
+            lines.append(f"# HELP {self.namespace}_{name} {self.HELP.get(name, name)}")
+            lines.append(f"# TYPE {self.namespace}_{name} {kind}")
+        
+        for (name, labels), value in counters:
+            describe(name, 'counter')
+            lines.append(f"{self.namespace}_{name}{self._format_labels(labels)} {value}")
+        
+        for (name, labels), value in gauges:
+            describe(name, 'gauge')
+            lines.append(f"{self.namespace}_{name}{self._format_labels(labels)} {value}")
+        
+        for (name, labels), (buckets, total, count) in histograms:
+            describe(name, 'histogram')
+            cumulative = 0
+            for bound, hits in zip(self.buckets + (float('inf'),), buckets):
+                cumulative += hits
+                le = '+Inf' if bound == float('inf') else repr(float(bound))
+                lines.append(f"{self.namespace}_{name}_bucket{self._format_labels(labels, [('le', le)])} {cumulative}")
+            lines.append(f"{self.namespace}_{name}_sum{self._format_labels(labels)} {total}")
+            lines.append(f"{self.namespace}_{name}_count{self._format_labels(labels)} {count}")
+        
+        return '\n'.join(lines) + '\n'
+
+
+
+
+
+_default_telemetry = Telemetry()
+
+
+def get_telemetry():
+    # Instancia compartida del proceso, como el registro por defecto de prometheus_client
+    return _default_telemetry
\ No newline at end of file
@@ -0,0 +1,211 @@
+# godart/token_estimator.py
+import hashlib
+import threading
+from collections import OrderedDict
+
+from .config import Config
+from .telemetry import logger
+
+
+
+
+
+# Caracteres por token de partida para cada alfabeto; el ratio aprendido corrige el resto
+CHARS_PER_TOKEN = {
+    'en': 4.0,
+    'latin': 3.6,
+    'cyrillic': 3.0,
+    'cjk': 1.3,
+    'other': 3.0
+}
+
+
+def detect_language(text, sample_size=2000):
+    sample = text[:sample_size]
+    letters = latin = cyrillic = cjk = other = 0
+    for char in sample:
+        if char.isascii():
+            if char.isalpha():
+                letters += 1
+            continue
+        code = ord(char)
+        if 0x00C0 <= code <= 0x024F:
+            latin += 1
+        elif 0x0400 <= code <= 0x04FF:
+            cyrillic += 1
+        elif 0x3040 <= code <= 0x30FF or 0x4E00 <= code <= 0x9FFF or 0xAC00 <= code <= 0xD7AF:
+            cjk += 1
+        elif char.isalpha():
+            other += 1
+        else:
+            continue
+        letters += 1
+    
+    if not letters:
+        return 'en'
+    if cjk / letters > 0.3:
+        return 'cjk'
+    if cyrillic / letters > 0.3:
+        return 'cyrillic'
+    if other / letters > 0.3:
+        return 'other'
+    if latin / letters > 0.01:
+        return 'latin'
+    return 'en'
+
+
+def split_contents(contents):
+    # Separa texto y partes multimodales de un prompt, historial o lista de Content/Part/dict
+    texts = []
+    media = 0
+    pending = [contents]
+    while pending:
+        item = pending.pop()
+        if item is None:
+            continue
+        if isinstance(item, str):
+            texts.append(item)
+        elif isinstance(item, (list, tuple)):
+            pending.extend(item)
+        elif isinstance(item, dict):
+            if item.get('parts') is not None:
+                pending.append(item['parts'])
+            elif item.get('text') is not None:
+                texts.append(item['text'])
+            else:
+                media += 1
+        elif getattr(item, 'parts', None) is not None:
+            pending.append(item.parts)
+        elif isinstance(getattr(item, 'text', None), str):
+            texts.append(item.text)
+        else:
+            media += 1
+    return texts, media
+
+
+
+
+
+class TokenEstimate:
+    __slots__ = ('model', 'language', 'input_tokens', 'output_tokens', 'raw_input', 'counted')
+    
+    def __init__(self, model, language, input_tokens, output_tokens, raw_input, counted=False):
+        self.model = model
+        self.language = language
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+        self.raw_input = raw_input
+        self.counted = counted
+    
+    @property
+    def total(self):
+        return self.input_tokens + self.output_tokens
+    
+    def __repr__(self):
+        return f"TokenEstimate(model={self.model!r}, language={self.language!r}, input={self.input_tokens}, output={self.output_tokens})"
+
+
+
+
+
+class TokenEstimator:
+    RATIO_BOUNDS = (0.25, 4.0)
+    
+    def __init__(self, learning_rate=None, default_output=None, media_tokens=None, count_tokens=None, count_cache_size=None):
+        self.learning_rate = learning_rate or Config.TOKEN_ESTIMATE_LEARNING_RATE
+        self.default_output = default_output or Config.TOKEN_ESTIMATE_OUTPUT_DEFAULT
+        self.media_tokens = media_tokens if media_tokens is not None else Config.TOKEN_ESTIMATE_MEDIA_TOKENS
+        self.count_tokens = count_tokens if count_tokens is not None else Config.TOKEN_ESTIMATE_COUNT_TOKENS
+        self.count_cache_size = count_cache_size or Config.TOKEN_ESTIMATE_COUNT_CACHE_SIZE
+        
+        self._ratios = {}
+        self._outputs = {}
+        self._counts = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def _raw_tokens(self, texts, media, language):
+        chars = sum(len(text) for text in texts)
+        return int(chars / CHARS_PER_TOKEN[language]) + media * self.media_tokens
+    
+    def estimate_text(self, contents, model=None):
+        texts, media = split_contents(contents)
+        if not texts and not media:
+            return 0
+        language = detect_language(texts[0] if len(texts) == 1 else ' '.join(text[:500] for text in texts))
+        raw = self._raw_tokens(texts, media, language)
+        return int(raw * self._ratios.get((model, language), 1.0))
+    
+    def _count_with_api(self, client, model, text):
+        key = hashlib.sha256(f"{model}\0{text}".encode('utf-8')).hexdigest()
+        with self._lock:
+            cached = self._counts.get(key)
+            if cached is not None:
+                self._counts.move_to_end(key)
+                return cached
+        
+        total = client.models.count_tokens(model=model, contents=text).total_tokens
+        with self._lock:
+            self._counts[key] = total
+            while len(self._counts) > self.count_cache_size:
+                self._counts.popitem(last=False)
+        return total
+    
+    def estimate(self, model, prompt, system_instruction=None, history=None, max_output_tokens=None, client=None, model_real=None):
+        prompt_texts, prompt_media = split_contents(prompt)
+        history_texts, history_media = split_contents(history)
+        system_texts = [system_instruction] if system_instruction else []
+        
+        texts = system_texts + history_texts + prompt_texts
+        media = prompt_media + history_media
+        language = detect_language(' '.join(text[:500] for text in texts))
+        raw_input = self._raw_tokens(texts, media, language)
+        
+        input_tokens = None
+        counted = False
+        if self.count_tokens and client is not None:
+            # count_tokens solo se usa para texto; el resultado se cachea por contenido
+            try:
+                input_tokens = sum(self._count_with_api(client, model_real or model, text) for text in texts if text)
+                input_tokens += media * self.media_tokens
+                counted = True
+            except Exception as e:
+                logger.warning(f"[!!] Error en count_tokens, usando estimación local: {e}")
+        
+        if input_tokens is None:
+            input_tokens = int(raw_input * self._ratios.get((model, language), 1.0))
+        
+        with self._lock:
+            output_tokens = int(self._outputs.get(model, self.default_output))
+        if max_output_tokens:
+            output_tokens = min(output_tokens, max_output_tokens)
+        
+        return TokenEstimate(model, language, input_tokens, output_tokens, raw_input, counted)
+    
+    def observe(self, estimate, usage_metadata):
+        if estimate is None or usage_metadata is None:
+            return
+        
+        prompt_tokens = usage_metadata.prompt_token_count
+        output_tokens = (usage_metadata.candidates_token_count or 0) + (getattr(usage_metadata, 'thoughts_token_count', None) or 0)
+        rate = self.learning_rate
+        low, high = self.RATIO_BOUNDS
+        
+        with self._lock:
+            # Media móvil exponencial del error real/estimado por modelo e idioma
+            if prompt_tokens and estimate.raw_input:
+                key = (estimate.model, estimate.language)
+                observed = min(max(prompt_tokens / estimate.raw_input, low), high)
+                current = self._ratios.get(key)
+                self._ratios[key] = observed if current is None else current + rate * (observed - current)
+            
+            if usage_metadata.candidates_token_count is not None:
+                current = self._outputs.get(estimate.model)
+                self._outputs[estimate.model] = output_tokens if current is None else current + rate * (output_tokens - current)
+    
+    def get_stats(self):
+        with self._lock:
+            return {
+                'ratios': {f"{model}:{language}": round(ratio, 3) for (model, language), ratio in self._ratios.items()},
+                'expected_output': {model: round(tokens, 1) for model, tokens in self._outputs.items()},
+                'counted_entries': len(self._counts)
+            }
\ No newline at end of file
@@ -0,0 +1,32 @@
+# tests/conftest.py
+import pytest
+
+from godart import GodartManager, SupabaseManager, Telemetry
+from godart.client_pool import ClientPool
+from godart.fakes import FakeGeminiBackend, FakeGenaiClient, FakeSupabaseClient
+
+
+
+
+
+@pytest.fixture
+def make_manager():
+    # Manager sobre los fakes de Gemini y Supabase: ninguna prueba sale a la red
+    managers = []
+    
+    def make(backend=None, keys=5, manager_class=GodartManager, **kwargs):
+        backend = backend if backend is not None else FakeGeminiBackend()
+        telemetry = Telemetry()
+        supabase = SupabaseManager(client=FakeSupabaseClient(keys), telemetry=telemetry, buffered_logging=False)
+        manager = manager_class(
+            supabase,
+            client_pool = ClientPool(client_factory=lambda api_key: FakeGenaiClient(api_key, backend)),
+            telemetry = telemetry,
+            **kwargs
+        )
+        managers.append(manager)
+        return manager
+    
+    yield make
+    for manager in managers:
+        manager.close()
\ No newline at end of file
@@ -0,0 +1,56 @@
+# tests/test_async_manager.py
+import time
+import asyncio
+import threading
+
+from godart import AsyncGodartManager, SQLiteRateLimitBackend
+from godart.fakes import FakeGeminiBackend
+
+
+
+
+
+def test_shared_tracker_runs_off_the_event_loop(make_manager, tmp_path):
+    # Con SQLite o Redis la selección de key y el ajuste de la reserva no bloquean el event loop
+    manager = make_manager(FakeGeminiBackend(latency=0.001), manager_class=AsyncGodartManager, coalesce=False, rate_limit_backend=SQLiteRateLimitBackend(str(tmp_path / 'rate.db')))
+    threads = []
+    for name in ('_try_select_key', '_record_usage'):
+        method = getattr(manager, name)
+        
+        def traced(*args, method=method):
+            threads.append(threading.get_ident())
+            return method(*args)
+        setattr(manager, name, traced)
+    
+    async def run():
+        response = await manager.make_request("hola", model='mini', use_cache=False)
+        return threading.get_ident(), response
+    
+    loop_thread, response = asyncio.run(run())
+    assert response.startswith("Respuesta a: hola")
+    assert len(threads) == 2 and loop_thread not in threads
+
+
+
+
+def test_concurrent_requests_and_chat(make_manager):
+    backend = FakeGeminiBackend(latency=0.2)
+    manager = make_manager(backend, manager_class=AsyncGodartManager, coalesce=False)
+    
+    async def run():
+        started = time.monotonic()
+        responses = await asyncio.gather(*(manager.make_request(f"p{index}", model='mini', use_cache=False) for index in range(8)))
+        elapsed = time.monotonic() - started
+        
+        first = await manager.make_request_chat("me llamo Ana", session_id="s1", model='mini')
+        second = await manager.make_request_chat("¿cómo me llamo?", session_id="s1", model='mini')
+        return responses, elapsed, first, second
+    
+    responses, elapsed, first, second = asyncio.run(run())
+    assert [response.startswith(f"Respuesta a: p{index}") for index, response in enumerate(responses)] == [True] * 8
+    # Los 8 requests corren a la vez sobre el event loop, no en serie
+    assert elapsed < 0.2 * 4
+    assert first.startswith("Respuesta a: me llamo Ana")
+    assert second.startswith("Respuesta a: ¿cómo me llamo?")
+    assert len(manager.get_chat_history("s1")) == 4
+    assert backend.calls == 10
\ No newline at end of file
@@ -0,0 +1,121 @@
+# tests/test_batch_jobs.py
+import json
+
+from godart import SQLiteBatchJobStore
+from godart.fakes import FakeGeminiBackend
+
+
+
+
+
+PROMPTS = [f"prompt {index}" for index in range(25)]
+
+
+def _input_lines(backend, batch_name):
+    return [json.loads(line) for line in backend.batches[batch_name]['src'].decode('utf-8').splitlines()]
+
+
+def _result_file(backend, batch_name):
+    return backend.batches[batch_name]['result_file']
+
+
+
+
+
+def test_prompts_are_sharded_across_keys(make_manager):
+    backend = FakeGeminiBackend()
+    manager = make_manager(backend, keys=3)
+    
+    job_id = manager.submit_batch_job(PROMPTS, model='mini', tono='formal', shards=3)
+    status = manager.poll_batch_job(job_id)
+    
+    assert [shard['prompts'] for shard in status['shards']] == [9, 8, 8]
+    assert sorted(shard['key_id'] for shard in status['shards']) == ['fake-key-0', 'fake-key-1', 'fake-key-2']
+    # El batch no gasta el cupo de generate_content
+    assert backend.calls == 0
+    
+    # Cada línea lleva identidad + tono y la configuración del tono, con el índice global como key
+    lines = _input_lines(backend, status['shards'][1]['name'])
+    assert [line['key'] for line in lines] == [str(index) for index in range(9, 17)]
+    request = lines[0]['request']
+    assert request['contents'][0]['parts'][0]['text'] == "prompt 9"
+    assert request['system_instruction']['parts'][0]['text'] == manager._build_system_instruction(tono='formal')
+    assert request['generation_config']['temperature'] == 0.7
+
+
+
+
+
+def test_failing_key_hands_its_shard_to_the_next_key(make_manager):
+    backend = FakeGeminiBackend(exhausted_keys={'fake-api-key-1'})
+    manager = make_manager(backend, keys=3)
+    
+    job_id = manager.submit_batch_job(PROMPTS, model='mini', shards=3)
+    status = manager.poll_batch_job(job_id)
+    
+    assert [shard['key_id'] for shard in status['shards']] == ['fake-key-0', 'fake-key-2', 'fake-key-2']
+    results = dict(manager.iter_batch_results(job_id, poll_interval=0.01))
+    assert sorted(results) == list(range(25))
+    assert not any(isinstance(result, Exception) for result in results.values())
+
+
+
+
+
+def test_state_persists_in_sqlite_for_another_manager(make_manager, tmp_path):
+    path = str(tmp_path / 'batch_jobs.db')
+    backend = FakeGeminiBackend(batch_latency=0.2)
+    submitter = make_manager(backend, keys=2, batch_job_store=SQLiteBatchJobStore(path))
+    
+    job_id = submitter.submit_batch_job(PROMPTS, model='mini')
+    assert submitter.poll_batch_job(job_id)['state'] == 'pending'
+    assert list(submitter.iter_batch_results(job_id, wait=False)) == []
+    
+    # Otro proceso con el mismo archivo consulta el job y recoge los resultados
+    collector = make_manager(backend, keys=2, batch_job_store=SQLiteBatchJobStore(path))
+    assert [job['job_id'] for job in collector.list_batch_jobs()] == [job_id]
+    results = dict(collector.iter_batch_results(job_id, poll_interval=0.05, timeout=5))
+    
+    assert len(results) == 25
+    assert results[7].startswith("Respuesta a: prompt 7")
+    assert collector.poll_batch_job(job_id)['state'] == 'succeeded'
+    assert SQLiteBatchJobStore(path).load(job_id)['shards'][0]['state'] == 'JOB_STATE_SUCCEEDED'
+
+
+
+
+
+def test_results_keep_prompt_order_and_report_missing_lines(make_manager):
+    backend = FakeGeminiBackend()
+    manager = make_manager(backend, keys=2)
+    job_id = manager.submit_batch_job(PROMPTS, model='mini', shards=2)
+    
+    # Gemini no garantiza una línea por prompt: se quita la del prompt 3 del archivo de resultados
+    status = manager.poll_batch_job(job_id)
+    assert status['state'] == 'succeeded'
+    result_file = _result_file(backend, status['shards'][0]['name'])
+    lines = backend.files[result_file]['data'].decode('utf-8').splitlines()
+    backend.files[result_file]['data'] = '\n'.join(line for line in lines if json.loads(line)['key'] != '3').encode('utf-8')
+    
+    results = list(manager.iter_batch_results(job_id))
+    
+    assert [index for index, _ in results if index != 3] == [index for index in range(25) if index != 3]
+    assert results[-1][0] == 24
+    missing = dict(results)[3]
+    assert isinstance(missing, Exception)
+    assert all(result.startswith(f"Respuesta a: prompt {index}") for index, result in results if index != 3)
+
+
+
+
+
+def test_timeout_while_waiting(make_manager):
+    manager = make_manager(FakeGeminiBackend(batch_latency=5), keys=1)
+    job_id = manager.submit_batch_job(PROMPTS[:3], model='mini')
+    try:
+        list(manager.iter_batch_results(job_id, poll_interval=0.01, timeout=0.05))
+    except TimeoutError:
+        pass
+    else:
+        raise AssertionError("iter_batch_results no respetó el timeout")
+    assert manager.cancel_batch_job(job_id)['state'] == 'cancelled'
\ No newline at end of file
@@ -0,0 +1,112 @@
+# tests/test_batch_runner.py
+from concurrent.futures import ThreadPoolExecutor
+
+from godart import KeyHealth
+from godart.fakes import FakeGeminiBackend
+
+
+
+
+
+def test_batch_waits_for_paused_keys(make_manager):
+    # Con todas las keys en pausa al empezar, las lanes esperan el enfriamiento en vez de fallar el batch
+    manager = make_manager(keys=3, key_health=KeyHealth())
+    for index in range(3):
+        manager.key_health.record_failure(f"fake-key-{index}", 'mini', "429 RESOURCE_EXHAUSTED. Please retry in 0.3s.")
+    assert len(manager.key_health.blocked('mini')) == 3
+    
+    results = manager.make_requests_batch([f"prompt {index}" for index in range(10)], model='mini', return_exceptions=True)
+    
+    assert [result for result in results if isinstance(result, Exception)] == []
+
+
+
+
+
+def test_batch_skips_keys_parked_for_the_day(make_manager):
+    manager = make_manager(keys=3)
+    manager.key_health.record_failure('fake-key-0', 'mini', "429 RESOURCE_EXHAUSTED. Quota exceeded for quotaId: GenerateRequestsPerDayPerProjectPerModel-FreeTier")
+    assert manager.key_health.parked('fake-key-0', 'mini')
+    
+    results = manager.make_requests_batch([f"prompt {index}" for index in range(10)], model='mini', return_exceptions=True)
+    
+    assert [result for result in results if isinstance(result, Exception)] == []
+
+
+
+
+
+def test_lanes_survive_per_minute_quota_errors(make_manager):
+    # Un 429 por minuto pausa la key unos segundos; la lane espera y sigue en el batch
+    backend = FakeGeminiBackend(latency=0.01, error_rate=0.05, seed=3)
+    manager = make_manager(backend, keys=5, key_health=KeyHealth(base_cooldown=0.2))
+    
+    results = manager.make_requests_batch([f"prompt {index}" for index in range(100)], model='mini', return_exceptions=True)
+    
+    assert backend.errors > 0
+    assert [result for result in results if isinstance(result, Exception)] == []
+
+
+
+
+
+def _failing(error):
+    def fail(*args, **kwargs):
+        raise error
+    return fail
+
+
+def _run_batch(manager, prompts):
+    # run() corre en otro hilo para que una lane colgada haga fallar la prueba en vez de bloquearla
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        return pool.submit(manager.make_requests_batch, prompts, model='mini', return_exceptions=True).result(timeout=10)
+
+
+
+
+
+def test_estimator_error_does_not_lose_prompts(make_manager):
+    manager = make_manager(keys=2)
+    estimate_request = manager._estimate_request
+    failures = {'left': 3}
+    
+    def flaky_estimate(*args, **kwargs):
+        if failures['left']:
+            failures['left'] -= 1
+            raise RuntimeError("estimador caído")
+        return estimate_request(*args, **kwargs)
+    
+    manager._estimate_request = flaky_estimate
+    results = _run_batch(manager, [f"prompt {index}" for index in range(10)])
+    
+    assert [result for result in results if isinstance(result, Exception)] == []
+    assert len(results) == 10
+
+
+
+
+
+def test_tracker_error_terminates_batch(make_manager):
+    # Con el backend compartido caído cada prompt se reporta como error y run() termina
+    manager = make_manager(keys=2)
+    for key_id in ('fake-key-0', 'fake-key-1'):
+        tracker = manager._get_or_create_tracker(key_id, 'mini')
+        tracker.acquire = _failing(RuntimeError("database is locked"))
+    
+    results = _run_batch(manager, [f"prompt {index}" for index in range(5)])
+    
+    assert len(results) == 5
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+
+
+
+def test_lane_setup_error_terminates_batch(make_manager):
+    manager = make_manager(keys=2)
+    manager._get_or_create_tracker = _failing(RuntimeError("redis no disponible"))
+    
+    results = _run_batch(manager, [f"prompt {index}" for index in range(3)])
+    
+    assert len(results) == 3
+    assert all(isinstance(result, Exception) for result in results)
\ No newline at end of file
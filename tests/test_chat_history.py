@@ -0,0 +1,43 @@
+# tests/test_chat_history.py
+from godart.session_store import trim_history
+
+
+
+
+
+def test_budget_trims_what_is_sent_not_what_is_stored(make_manager):
+    manager = make_manager(history_token_budget=300)
+    for turn in range(20):
+        manager.make_request_chat(f"mensaje {turn}", session_id='s1', model='mini')
+    
+    history = manager.get_chat_history('s1')
+    assert len(history) == 40
+    assert history[0].parts[0].text == "mensaje 0"
+    assert history[-2].parts[0].text == "mensaje 19"
+    
+    _, window = manager._load_chat_window('s1')
+    assert len(window) < 40
+    assert window == trim_history(manager.session_store.load('s1'), 300, manager._estimate_tokens)
+
+
+
+
+
+def test_summary_only_covers_new_dropped_turns(make_manager):
+    calls = []
+    
+    def summarizer(contents):
+        calls.append(len(contents))
+        return f"resumen de {len(contents)} turnos"
+    
+    manager = make_manager(history_token_budget=300, history_summarizer=summarizer)
+    for turn in range(20):
+        manager.make_request_chat(f"mensaje {turn}", session_id='s1', model='mini')
+    
+    assert len(manager.get_chat_history('s1')) == 40
+    assert calls
+    # Tras el primer resumen cada turno resume el anterior más los turnos que acaban de salir de la ventana
+    assert max(calls[1:], default=0) <= 3
+    
+    manager.clear_chat_session('s1')
+    assert manager.get_chat_history('s1') == []
\ No newline at end of file
@@ -0,0 +1,95 @@
+# tests/test_circuit_breaker.py
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from godart import AsyncGodartManager, KeyHealth, SupabaseManager
+from godart.fakes import FakeGeminiBackend, FakeSupabaseClient
+
+
+
+
+
+def _request(manager, index):
+    try:
+        return manager.make_request(f"prompt {index}", model='mini', use_cache=False)
+    except Exception as e:
+        return e
+
+
+
+
+
+def test_paused_keys_do_not_fail_concurrent_requests(make_manager):
+    # 16 hilos sobre 5 keys con 429 inyectados: al pausarse todas, los requests esperan la prueba en vez de fallar
+    backend = FakeGeminiBackend(latency=0.02, error_rate=0.05, seed=1)
+    manager = make_manager(backend, coalesce=False, key_health=KeyHealth(base_cooldown=0.5))
+    
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        results = list(pool.map(lambda index: _request(manager, index), range(100)))
+    
+    assert backend.errors > 0
+    assert [result for result in results if isinstance(result, Exception)] == []
+
+
+
+
+
+def test_paused_keys_do_not_fail_concurrent_async_requests(make_manager):
+    backend = FakeGeminiBackend(latency=0.02, error_rate=0.05, seed=1)
+    manager = make_manager(backend, manager_class=AsyncGodartManager, max_concurrency=16, coalesce=False, key_health=KeyHealth(base_cooldown=0.5))
+    
+    async def run():
+        return await asyncio.gather(
+            *(manager.make_request(f"prompt {index}", model='mini', use_cache=False) for index in range(100)),
+            return_exceptions = True
+        )
+    
+    results = asyncio.run(run())
+    assert backend.errors > 0
+    assert [result for result in results if isinstance(result, Exception)] == []
+
+
+
+
+
+def test_probe_in_flight_is_a_short_wait():
+    health = KeyHealth(base_cooldown=0.01, probe_poll=0.05)
+    health.record_failure('k1', 'mini', "429 RESOURCE_EXHAUSTED")
+    health.begin('k1', 'mini')
+    assert health.next_available('mini', ['k1']) > 0
+    
+    # Vencido el enfriamiento, la key en prueba bloquea a los demás solo por probe_poll, no por probe_timeout
+    time.sleep(0.02)
+    health.begin('k1', 'mini')
+    assert health.blocked('mini') == {'k1'}
+    assert health.next_available('mini', ['k1']) <= 0.05
+
+
+
+
+
+def test_daily_quota_keeps_key_out_of_pool(make_manager):
+    # La key sin cupo diario sale del pool y un refresco desde Supabase, que la sigue listando, no la devuelve
+    backend = FakeGeminiBackend(exhausted_keys={'fake-api-key-0'})
+    manager = make_manager(backend, keys=3, coalesce=False)
+    supabase = manager.supabase
+    supabase.get_all_available_keys()
+    version = supabase.keys_version
+    
+    results = [_request(manager, index) for index in range(10)]
+    
+    assert [result for result in results if isinstance(result, Exception)] == []
+    assert manager.key_health.parked('fake-key-0', 'mini')
+    assert supabase.keys_version > version
+    assert 'fake-key-0' not in [key['key_id'] for key in supabase.get_all_available_keys()]
+    assert 'fake-key-0' not in [key['key_id'] for key in supabase.get_all_available_keys(force_refresh=True)]
+
+
+
+
+
+def test_key_exclusion_expires():
+    supabase = SupabaseManager(client=FakeSupabaseClient(2), buffered_logging=False)
+    supabase.invalidate_key('fake-key-0', until=time.time() - 1)
+    assert [key['key_id'] for key in supabase.get_all_available_keys(force_refresh=True)] == ['fake-key-0', 'fake-key-1']
\ No newline at end of file
@@ -0,0 +1,88 @@
+# tests/test_client_pool.py
+import time
+import asyncio
+
+from godart import ClientPool
+from godart.fakes import FakeGenaiClient, FakeGeminiBackend
+
+
+
+
+
+def _pool(**kwargs):
+    backend = FakeGeminiBackend()
+    created = []
+    
+    def factory(api_key):
+        client = FakeGenaiClient(api_key, backend)
+        created.append(client)
+        return client
+    
+    return ClientPool(client_factory=factory, **kwargs), created
+
+
+
+
+
+def test_lru_eviction_closes_client():
+    pool, created = _pool(max_clients=2)
+    pool.get('k0', 'api-0')
+    pool.get('k1', 'api-1')
+    pool.get('k2', 'api-2')
+    
+    assert len(pool) == 2
+    assert created[0].closed and created[0].aio.closed
+    assert not created[1].closed and not created[2].closed
+
+
+
+
+
+def test_idle_eviction_closes_client():
+    pool, created = _pool(max_clients=10, idle_timeout=0.05)
+    pool.get('k0', 'api-0')
+    time.sleep(0.1)
+    pool.get('k1', 'api-1')
+    
+    assert len(pool) == 1
+    assert created[0].closed and created[0].aio.closed
+
+
+
+
+
+def test_replaced_api_key_closes_old_client():
+    pool, created = _pool()
+    pool.get('k0', 'api-0')
+    pool.get('k0', 'api-nueva')
+    
+    assert created[0].closed and created[0].aio.closed
+    assert not created[1].closed
+
+
+
+
+
+def test_close_closes_sync_and_async_clients():
+    pool, created = _pool()
+    pool.get('k0', 'api-0')
+    pool.get('k1', 'api-1')
+    pool.close()
+    
+    assert len(pool) == 0
+    assert all(client.closed and client.aio.closed for client in created)
+
+
+
+
+
+def test_eviction_inside_event_loop_closes_async_client():
+    pool, created = _pool(max_clients=1)
+    
+    async def main():
+        pool.get('k0', 'api-0')
+        pool.get('k1', 'api-1')
+        await pool.aclose()
+    
+    asyncio.run(main())
+    assert all(client.closed and client.aio.closed for client in created)
\ No newline at end of file
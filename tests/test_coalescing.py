@@ -0,0 +1,47 @@
+# tests/test_coalescing.py
+from concurrent.futures import ThreadPoolExecutor
+
+from godart.fakes import FakeGeminiBackend
+
+
+
+
+
+def _concurrent(manager, count=4, **kwargs):
+    with ThreadPoolExecutor(max_workers=count) as pool:
+        return list(pool.map(lambda _: manager.make_request("mismo prompt", model='mini', **kwargs), range(count)))
+
+
+
+
+
+def test_coalescing_is_off_by_default(make_manager):
+    backend = FakeGeminiBackend(latency=0.1)
+    manager = make_manager(backend)
+    
+    assert manager.single_flight is None
+    _concurrent(manager)
+    assert backend.calls == 4
+
+
+
+
+
+def test_opt_in_coalescing_shares_one_call(make_manager):
+    backend = FakeGeminiBackend(latency=0.1)
+    manager = make_manager(backend, coalesce=True)
+    
+    responses = _concurrent(manager)
+    assert backend.calls == 1
+    assert len(set(responses)) == 1
+
+
+
+
+
+def test_use_cache_false_skips_coalescing(make_manager):
+    backend = FakeGeminiBackend(latency=0.1)
+    manager = make_manager(backend, coalesce=True)
+    
+    _concurrent(manager, use_cache=False)
+    assert backend.calls == 4
\ No newline at end of file
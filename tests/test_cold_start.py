@@ -0,0 +1,51 @@
+# tests/test_cold_start.py
+import os
+import stat
+import time
+
+from godart import SupabaseManager
+from godart.fakes import FakeSupabaseClient
+
+
+
+
+
+def test_preload_uses_bulk_rpcs():
+    client = FakeSupabaseClient(3)
+    supabase = SupabaseManager(client=client, buffered_logging=False)
+    assert supabase.preload(models=['mini', 'base'], save_snapshot=False) == {'models': 3, 'contexts': 1, 'keys': 3}
+    
+    # Después de la precarga los requests no vuelven a consultar Supabase
+    calls = dict(client.calls)
+    assert supabase.get_model_config('mini')['model_real_name'] == "gemini-fake-mini"
+    assert supabase.get_context('identity_default')
+    assert len(supabase.get_all_available_keys()) == 3
+    assert client.calls == calls
+    assert 'get_godart_model_config' not in calls
+
+
+
+
+
+def test_preload_falls_back_without_bulk_rpcs():
+    client = FakeSupabaseClient(3, bulk_rpcs=False)
+    supabase = SupabaseManager(client=client, buffered_logging=False)
+    assert supabase.preload(models=['mini', 'base'], save_snapshot=False)['models'] == 2
+    assert client.calls['get_godart_model_config'] == 2
+
+
+
+
+
+def test_snapshot_starts_without_waiting_for_supabase(tmp_path):
+    path = str(tmp_path / 'snapshot.json')
+    SupabaseManager(client=FakeSupabaseClient(3), snapshot_path=path, buffered_logging=False).preload(models=['mini'])
+    # Contiene API keys: solo el dueño puede leerlo
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    
+    # Un proceso nuevo arranca con el snapshot aunque Supabase tarde en responder
+    started = time.monotonic()
+    supabase = SupabaseManager(client=FakeSupabaseClient(3, latency=0.5), snapshot_path=path, buffered_logging=False)
+    assert supabase.get_model_config('mini')['model_real_name'] == "gemini-fake-mini"
+    assert [key['key_id'] for key in supabase.get_all_available_keys()] == ['fake-key-0', 'fake-key-1', 'fake-key-2']
+    assert time.monotonic() - started < 0.3
\ No newline at end of file
@@ -0,0 +1,111 @@
+# tests/test_context_cache.py
+from godart import ContextCache
+from godart.fakes import FakeCaches, FakeGenaiClient
+
+
+
+
+
+INSTRUCTION = "Eres un asistente. " * 50
+
+
+def _clients(manager, keys=5):
+    return [manager.client_pool.get(f"fake-key-{index}", f"fake-api-key-{index}") for index in range(keys)]
+
+
+
+
+
+def test_cache_is_created_once_per_key_model_and_instruction():
+    cache = ContextCache(min_tokens=0)
+    client_a = FakeGenaiClient('fake-api-key-0')
+    client_b = FakeGenaiClient('fake-api-key-1')
+    
+    name = cache.get(client_a, 'k0', 'gemini-mini', INSTRUCTION, 500)
+    assert name is not None
+    assert cache.get(client_a, 'k0', 'gemini-mini', INSTRUCTION, 500) == name
+    assert cache.get_stats()['hits'] == 1
+    
+    # Otra key, otro modelo u otra instrucción tienen su propio contenido cacheado
+    assert cache.get(client_b, 'k1', 'gemini-mini', INSTRUCTION, 500) is not None
+    assert cache.get(client_a, 'k0', 'gemini-max', INSTRUCTION, 500) not in (None, name)
+    assert cache.get(client_a, 'k0', 'gemini-mini', INSTRUCTION + "Formal.", 500) not in (None, name)
+    assert cache.get_stats()['created'] == 4
+    assert client_a.caches.calls['create'] == 3
+    assert client_b.caches.calls['create'] == 1
+
+
+
+
+
+def test_small_instructions_stay_inline():
+    cache = ContextCache(min_tokens=1024)
+    client = FakeGenaiClient('fake-api-key-0')
+    assert cache.get(client, 'k0', 'gemini-mini', "Hola", 10) is None
+    assert client.caches.calls['create'] == 0
+
+
+
+
+
+def test_ttl_is_renewed_before_expiry():
+    cache = ContextCache(ttl=100, renew_before=100, min_tokens=0)
+    client = FakeGenaiClient('fake-api-key-0')
+    
+    name = cache.get(client, 'k0', 'gemini-mini', INSTRUCTION, 500)
+    assert cache.get(client, 'k0', 'gemini-mini', INSTRUCTION, 500) == name
+    assert client.caches.calls['update'] == 1
+    assert cache.get_stats()['renewed'] == 1
+
+
+
+
+
+def test_invalidate_contexts_recreates_and_deletes_caches(make_manager):
+    manager = make_manager(keys=1, context_cache=ContextCache(min_tokens=0))
+    manager.make_request("hola", model='mini', use_cache=False)
+    manager.make_request("otra vez", model='mini', use_cache=False)
+    client = _clients(manager, 1)[0]
+    assert client.caches.calls['create'] == 1
+    
+    # Editar identidades o tonos sube contexts_version: el cache anterior se borra y se crea otro
+    manager.supabase.invalidate_contexts()
+    manager.make_request("tras editar", model='mini', use_cache=False)
+    assert client.caches.calls['create'] == 2
+    assert client.caches.calls['delete'] == 1
+    assert len(client.caches.list()) == 1
+
+
+
+
+
+def test_failed_creation_falls_back_to_inline(make_manager):
+    manager = make_manager(keys=1, context_cache=ContextCache(min_tokens=0))
+    client = _clients(manager, 1)[0]
+    client.caches = FakeCaches(fail_create=True)
+    
+    response = manager.make_request("hola", model='mini', use_cache=False)
+    
+    assert response.startswith("Respuesta a: hola")
+    assert manager.context_cache.get_stats()['fallbacks'] == 1
+    assert manager.context_cache.get_stats()['entries'] == 0
+    # Durante retry_after la key no vuelve a intentar crear el cache
+    manager.make_request("otra vez", model='mini', use_cache=False)
+    assert client.caches.calls['create'] == 1
+
+
+
+
+
+def test_expired_cache_is_retried_inline(make_manager):
+    manager = make_manager(keys=1, context_cache=ContextCache(min_tokens=0))
+    manager.make_request("hola", model='mini', use_cache=False)
+    client = _clients(manager, 1)[0]
+    
+    # Gemini borró el contenido antes de lo previsto: el request falla con 404 y se repite en línea
+    client.caches.expire()
+    response = manager.make_request("tras expirar", model='mini', use_cache=False)
+    
+    assert response.startswith("Respuesta a: tras expirar")
+    assert manager.context_cache.get_stats()['entries'] == 0
+    assert manager.key_health.get_stats() == {}
\ No newline at end of file
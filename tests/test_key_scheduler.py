@@ -0,0 +1,78 @@
+# tests/test_key_scheduler.py
+import pytest
+
+from godart import KeyScheduler, RateLimitTracker
+
+
+
+
+
+def _pool(loads):
+    # Una key por carga: cada tracker arranca con esa cantidad de requests en la ventana
+    keys = [{'key_id': f"key-{index}", 'api_key': f"api-{index}", 'account_name': f"cuenta-{index}"} for index in range(len(loads))]
+    trackers = {}
+    for key_data, load in zip(keys, loads):
+        tracker = trackers[key_data['key_id']] = RateLimitTracker(rpm_limit=10, tpm_limit=100000)
+        for _ in range(load):
+            tracker.record_request(0)
+    return keys, trackers.__getitem__
+
+
+
+
+
+def test_least_loaded_picks_the_key_with_most_headroom():
+    keys, tracker_for = _pool([6, 2, 4])
+    scheduler = KeyScheduler(strategy='least_loaded')
+    
+    key_data, reservation, _, _ = scheduler.acquire('mini', keys, tracker_for, version=1)
+    assert key_data['key_id'] == 'key-1' and reservation is not None
+    
+    # Las siguientes reservas reparten la carga entre las keys menos usadas y no tocan la más cargada
+    picked = [scheduler.acquire('mini', keys, tracker_for, version=1)[0]['key_id'] for _ in range(3)]
+    loads = [tracker_for(key_data['key_id']).get_current_usage()['requests'] for key_data in keys]
+    assert 'key-0' not in picked
+    assert loads[0] == 6 and abs(loads[1] - loads[2]) <= 1
+
+
+
+
+
+def test_first_fit_keeps_using_the_first_key_with_room():
+    keys, tracker_for = _pool([6, 2, 4])
+    scheduler = KeyScheduler(strategy='first_fit')
+    
+    picked = [scheduler.acquire('mini', keys, tracker_for, version=1)[0]['key_id'] for _ in range(4)]
+    assert picked == ['key-0'] * 4
+    assert scheduler.acquire('mini', keys, tracker_for, version=1)[0]['key_id'] == 'key-1'
+
+
+
+
+
+def test_round_robin_rotates_and_skips_excluded_keys():
+    keys, tracker_for = _pool([0, 0, 0])
+    scheduler = KeyScheduler(strategy='round_robin')
+    
+    picked = [scheduler.acquire('mini', keys, tracker_for, exclude={'key-1'}, version=1)[0]['key_id'] for _ in range(4)]
+    assert picked == ['key-0', 'key-2', 'key-0', 'key-2']
+
+
+
+
+
+def test_full_pool_reports_the_soonest_key():
+    keys, tracker_for = _pool([10, 10])
+    scheduler = KeyScheduler(strategy='weighted')
+    
+    key_data, reservation, min_wait, soonest_key = scheduler.acquire('mini', keys, tracker_for, version=1)
+    assert key_data is None and reservation is None
+    assert 0 < min_wait <= 60 and soonest_key['key_id'] in ('key-0', 'key-1')
+
+
+
+
+
+def test_invalid_strategy_is_rejected():
+    with pytest.raises(ValueError):
+        KeyScheduler(strategy='random')
\ No newline at end of file
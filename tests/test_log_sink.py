@@ -0,0 +1,113 @@
+# tests/test_log_sink.py
+import json
+
+import pytest
+
+from godart.log_sink import RequestLogSink
+
+
+
+
+
+class _FlakySupabase:
+    # Falla las primeras `failures` llamadas y luego guarda cada lote
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.batches = []
+    
+    def __call__(self, records):
+        if self.failures:
+            self.failures -= 1
+            raise Exception("503 Service Unavailable")
+        self.batches.append(list(records))
+    
+    @property
+    def records(self):
+        return [record for batch in self.batches for record in batch]
+
+
+
+
+
+class _Crash(BaseException):
+    # Simula que el proceso muere a mitad de un envío
+    pass
+
+
+def _record(index):
+    return RequestLogSink.build_record(f"key-{index}", True, model='mini')
+
+
+
+
+
+def test_failed_flush_is_retried_before_overflow():
+    supabase = _FlakySupabase(failures=2)
+    sink = RequestLogSink(supabase, flush_interval=60, retries=3, retry_delay=0.01)
+    for index in range(5):
+        sink.emit(_record(index))
+    
+    sink.flush()
+    sink.close()
+    
+    assert len(supabase.records) == 5
+    assert sink.get_stats()['dropped'] == 0
+
+
+
+
+
+def test_spilled_logs_are_replayed_after_next_successful_flush(tmp_path):
+    spill_path = tmp_path / 'pending.jsonl'
+    supabase = _FlakySupabase(failures=2)
+    sink = RequestLogSink(supabase, flush_interval=60, overflow_policy='spill', spill_path=str(spill_path), retries=1, retry_delay=0.01)
+    
+    for index in range(3):
+        sink.emit(_record(index))
+    sink.flush()
+    assert spill_path.exists()
+    assert sink.get_stats()['spilled'] == 3
+    
+    sink.emit(_record(3))
+    sink.flush()
+    sink.close()
+    
+    assert sorted(record['key_id'] for record in supabase.records) == [f"key-{index}" for index in range(4)]
+    assert sink.get_stats()['replayed'] == 3
+    assert list(tmp_path.iterdir()) == []
+
+
+
+
+
+def test_crashed_replay_resumes_without_resending(tmp_path):
+    # El reenvío avanza por lotes y guarda su posición: si el proceso muere no se repite lo ya enviado
+    spill_path = tmp_path / 'pending.jsonl'
+    spill_path.write_text(''.join(json.dumps(_record(index)) + '\n' for index in range(10)), encoding='utf-8')
+    
+    supabase = _FlakySupabase()
+    sink = RequestLogSink(supabase, batch_size=3, flush_interval=60, spill_path=str(spill_path), retries=0)
+    flush_batch = sink.flush_batch
+    
+    def crash_on_third_batch(records):
+        if len(supabase.batches) == 3:
+            raise _Crash()
+        flush_batch(records)
+    
+    sink.flush_batch = crash_on_third_batch
+    sink.emit(_record('nuevo'))
+    with pytest.raises(_Crash):
+        sink.flush()
+    sink.flush_batch = flush_batch
+    sink.close()
+    assert [len(batch) for batch in supabase.batches] == [1, 3, 3]
+    
+    restarted = RequestLogSink(supabase, batch_size=3, flush_interval=60, spill_path=str(spill_path), retries=0)
+    restarted.emit(_record('otro'))
+    restarted.flush()
+    restarted.close()
+    
+    keys = [record['key_id'] for record in supabase.records]
+    assert sorted(keys) == sorted({*keys})
+    assert len(keys) == 12
+    assert list(tmp_path.iterdir()) == []
\ No newline at end of file
@@ -0,0 +1,52 @@
+# tests/test_model_router.py
+from godart import ModelRouter
+
+
+
+
+
+def _stub_capacity(manager, waits):
+    calls = []
+    
+    def capacity_wait(model_alias, estimated_tokens=0, reserved=0):
+        calls.append(model_alias)
+        return waits.get(model_alias, 0.0)
+    
+    manager._capacity_wait = capacity_wait
+    return calls
+
+
+
+
+
+def test_plan_skips_other_tiers_when_requested_has_capacity(make_manager):
+    manager = make_manager(model_router=ModelRouter(fallbacks={'max': ('base', 'mini')}))
+    calls = _stub_capacity(manager, {})
+    
+    assert manager.model_router.plan(manager, 'max') == ['max', 'base', 'mini']
+    assert calls == ['max']
+
+
+
+
+
+def test_plan_checks_other_tiers_when_requested_is_saturated(make_manager):
+    manager = make_manager(model_router=ModelRouter(fallbacks={'max': ('base', 'mini')}, max_wait=0))
+    calls = _stub_capacity(manager, {'max': 30.0, 'base': 10.0})
+    
+    assert manager.model_router.plan(manager, 'max') == ['mini', 'base', 'max']
+    assert calls == ['max', 'base', 'mini']
+
+
+
+
+
+def test_missing_model_lookup_is_cached(make_manager):
+    # Un alias de fallback que no existe en Supabase no se consulta en cada request
+    manager = make_manager(model_router=ModelRouter(fallbacks={'max': ('turbo', 'base')}, max_wait=0))
+    client = manager.supabase.client
+    _stub_capacity(manager, {'max': 30.0})
+    
+    for _ in range(5):
+        assert manager.model_router.plan(manager, 'max') == ['base', 'max', 'turbo']
+    assert client.calls.get('get_godart_model_config') == 3
\ No newline at end of file
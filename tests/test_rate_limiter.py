@@ -0,0 +1,138 @@
+# tests/test_rate_limiter.py
+import time
+import threading
+
+from godart import KeyScheduler, RateLimitTracker, SharedRateLimitTracker, SQLiteRateLimitBackend
+
+
+
+
+
+class _CountingBackend:
+    # Cuenta las transacciones que llegan al backend compartido
+    def __init__(self, backend):
+        self.backend = backend
+        self.calls = 0
+    
+    def __getattr__(self, name):
+        method = getattr(self.backend, name)
+        
+        def counted(*args, **kwargs):
+            self.calls += 1
+            return method(*args, **kwargs)
+        return counted
+
+
+
+
+
+def test_daily_limit_blocks_until_reset():
+    tracker = RateLimitTracker(rpm_limit=100, tpm_limit=1000, rpd_limit=2)
+    tracker.record_request(1)
+    tracker.record_request(1)
+    assert tracker.can_make_request() == (False, "RPD")
+    assert tracker.get_wait_time("RPD") > 0
+    
+    # Pasada la medianoche del Pacífico el contador diario vuelve a cero
+    tracker._day_reset_at = time.time() - 1
+    assert tracker.can_make_request() == (True, None)
+    assert tracker.get_current_usage()['requests_today'] == 0
+
+
+
+
+
+def test_settle_returns_unused_tokens():
+    tracker = RateLimitTracker(rpm_limit=100, tpm_limit=1000)
+    reservation = tracker.acquire(800)
+    assert tracker.get_current_usage()['tokens'] == 800
+    assert tracker.acquire(500, timeout=0) is None
+    
+    # Ajustar la reserva al uso real libera el resto para el siguiente request
+    tracker.settle(reservation, 300)
+    assert tracker.get_current_usage()['tokens'] == 300
+    assert tracker.acquire(500, timeout=0) is not None
+    assert tracker.get_current_usage() == {
+        'requests': 2,
+        'tokens': 800,
+        'requests_today': 2,
+        'rpm_limit': 100,
+        'tpm_limit': 1000,
+        'rpd_limit': None
+    }
+
+
+
+
+
+def test_try_acquire_returns_wait_when_full():
+    tracker = RateLimitTracker(rpm_limit=1, tpm_limit=1000)
+    reservation, wait_time = tracker.try_acquire(10)
+    assert reservation is not None and wait_time == 0
+    
+    reservation, wait_time = tracker.try_acquire(10)
+    assert reservation is None
+    assert 0 < wait_time <= 60
+
+
+
+
+
+def test_shared_rejection_costs_one_transaction(tmp_path):
+    # Un candidato sin cupo en el backend compartido cuesta una sola transacción al elegir key
+    backend = _CountingBackend(SQLiteRateLimitBackend(str(tmp_path / 'rate.db')))
+    tracker = SharedRateLimitTracker(backend, 'key:mini', rpm_limit=1, tpm_limit=1000)
+    assert tracker.try_acquire(10)[0] is not None
+    
+    keys = [{'key_id': 'key', 'api_key': 'api-key', 'account_name': 'cuenta'}]
+    scheduler = KeyScheduler(strategy='first_fit')
+    # La primera llamada arma el pool del scheduler; solo se cuenta la selección en sí
+    scheduler.acquire('mini', keys, lambda key_id: tracker, estimated_tokens=10, version=1)
+    backend.calls = 0
+    key_data, reservation, min_wait, soonest_key = scheduler.acquire('mini', keys, lambda key_id: tracker, estimated_tokens=10, version=1)
+    
+    assert key_data is None and reservation is None
+    assert 0 < min_wait <= 60 and soonest_key['key_id'] == 'key'
+    assert backend.calls == 1
+
+
+
+
+def test_shared_trackers_split_one_quota(tmp_path):
+    # Dos workers con su propio backend sobre el mismo archivo ven y consumen la misma cuota
+    path = str(tmp_path / 'rate.db')
+    first = SharedRateLimitTracker(SQLiteRateLimitBackend(path), 'key:mini', rpm_limit=3, tpm_limit=1000)
+    second = SharedRateLimitTracker(SQLiteRateLimitBackend(path), 'key:mini', rpm_limit=3, tpm_limit=1000)
+    
+    reservation = first.acquire(400, timeout=0)
+    assert first.acquire(100, timeout=0) is not None
+    assert second.get_current_usage()['requests'] == 2
+    assert second.can_make_request(600) == (False, "TPM")
+    
+    # El ajuste de una reserva en un worker libera tokens para el otro
+    first.settle(reservation, 100)
+    assert second.acquire(600, timeout=0) is not None
+    assert first.try_acquire(10)[0] is None
+    assert first.can_make_request() == (False, "RPM")
+    assert second.get_current_usage()['tokens'] == 800
+
+
+
+
+
+def test_concurrent_shared_acquires_never_exceed_the_limit(tmp_path):
+    path = str(tmp_path / 'rate.db')
+    trackers = [SharedRateLimitTracker(SQLiteRateLimitBackend(path), 'key:mini', rpm_limit=5, tpm_limit=100000) for _ in range(2)]
+    granted = []
+    
+    def worker(tracker):
+        for _ in range(5):
+            if tracker.acquire(10, timeout=0) is not None:
+                granted.append(1)
+    
+    threads = [threading.Thread(target=worker, args=(trackers[index % 2],)) for index in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(granted) == 5
\ No newline at end of file
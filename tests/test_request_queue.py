@@ -0,0 +1,92 @@
+# tests/test_request_queue.py
+import time
+import asyncio
+import threading
+
+from godart import RequestQueue, AsyncRequestQueue, AsyncGodartManager
+from godart.fakes import FakeGeminiBackend
+
+
+
+
+
+def _slow_capacity(manager, delay, calls):
+    # Simula una consulta lenta de cupo (Supabase) y anota desde qué hilo se hace
+    capacity_wait = manager._capacity_wait
+    
+    def wrapper(model_alias, estimated_tokens=0, reserved=0):
+        calls.append(threading.get_ident())
+        time.sleep(delay)
+        return capacity_wait(model_alias, estimated_tokens, reserved)
+    
+    manager._capacity_wait = wrapper
+
+
+
+
+
+def test_capacity_is_computed_outside_the_lock(make_manager):
+    # Mientras el dispatcher calcula el cupo, otros hilos pueden encolar sin esperar al lock
+    manager = make_manager(FakeGeminiBackend(latency=0.001), coalesce=False)
+    calls = []
+    _slow_capacity(manager, 0.3, calls)
+    
+    with RequestQueue(manager, workers=2) as queue:
+        first = queue.submit("uno", model='mini', use_cache=False)
+        while not calls:
+            time.sleep(0.005)
+        
+        started = time.monotonic()
+        second = queue.submit("dos", model='mini', use_cache=False)
+        assert time.monotonic() - started < 0.1
+        
+        assert first.result(timeout=5).startswith("Respuesta a: uno")
+        assert second.result(timeout=5).startswith("Respuesta a: dos")
+
+
+
+
+
+def test_async_capacity_runs_off_the_event_loop(make_manager):
+    manager = make_manager(FakeGeminiBackend(latency=0.001), manager_class=AsyncGodartManager, coalesce=False)
+    calls = []
+    _slow_capacity(manager, 0.05, calls)
+    
+    async def scenario():
+        async with AsyncRequestQueue(manager, workers=2) as queue:
+            responses = await asyncio.gather(*(queue.request(f"p{index}", model='mini', use_cache=False) for index in range(4)))
+        return threading.get_ident(), responses
+    
+    loop_thread, responses = asyncio.run(scenario())
+    assert [response.startswith(f"Respuesta a: p{index}") for index, response in enumerate(responses)] == [True] * 4
+    assert calls and loop_thread not in calls
+
+
+
+
+def test_free_slot_is_reserved_for_one_request(make_manager):
+    # Con un solo hueco de RPM libre, la cola despacha un request y retiene el resto en vez de mandarlos a competir por él
+    manager = make_manager(FakeGeminiBackend(latency=0.3), keys=1, coalesce=False)
+    tracker = manager._get_or_create_tracker('fake-key-0', 'mini')
+    tracker.rpm_limit = 2
+    tracker.record_request(0)
+    
+    # La selección de key del worker tarda (Supabase): el dispatcher vuelve a calcular el cupo antes de que el tracker vea el request
+    lease_key = manager._lease_key
+    
+    def slow_lease_key(*args):
+        time.sleep(0.05)
+        return lease_key(*args)
+    
+    manager._lease_key = slow_lease_key
+    
+    with RequestQueue(manager, workers=3) as queue:
+        futures = [queue.submit(f"p{index}", model='mini', use_cache=False) for index in range(3)]
+        time.sleep(0.1)
+        stats = queue.get_stats()
+        assert stats['active'] == 1
+        assert stats['priorities'][queue.priorities[0]]['depth'] == 2
+        
+        # Al liberarse cupo los demás salen sin haber fallado
+        tracker.rpm_limit = 100
+        assert [future.result(timeout=5).startswith(f"Respuesta a: p{index}") for index, future in enumerate(futures)] == [True] * 3
\ No newline at end of file
@@ -0,0 +1,75 @@
+# tests/test_response_cache.py
+import time
+
+from godart import MemoryCache, ResponseCache
+from godart.fakes import FakeGeminiBackend
+
+
+
+
+
+def test_repeated_prompt_is_served_from_cache(make_manager):
+    backend = FakeGeminiBackend()
+    cache = ResponseCache()
+    manager = make_manager(backend, response_cache=cache)
+    
+    first = manager.make_request("hola", model='mini')
+    second = manager.make_request("hola", model='mini')
+    assert first == second
+    assert backend.calls == 1
+    assert cache.get_stats()['memory_hits'] == 1
+    
+    # Otro prompt u otra configuración es otra entrada del cache
+    manager.make_request("hola", model='mini', custom_config={'temperature': 0.1})
+    manager.make_request("chau", model='mini')
+    assert backend.calls == 3
+
+
+
+
+
+def test_use_cache_false_goes_to_gemini(make_manager):
+    backend = FakeGeminiBackend()
+    manager = make_manager(backend, response_cache=ResponseCache())
+    
+    manager.make_request("hola", model='mini')
+    manager.make_request("hola", model='mini', use_cache=False)
+    assert backend.calls == 2
+
+
+
+
+
+def test_disk_hit_is_promoted_to_memory(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    ResponseCache(sqlite_path=path).set('clave', 'valor')
+    
+    # Un proceso nuevo arranca con la memoria vacía y encuentra la respuesta en SQLite
+    cache = ResponseCache(sqlite_path=path)
+    assert cache.get('clave') == 'valor'
+    assert cache.get('clave') == 'valor'
+    assert cache.get('otra') is None
+    assert cache.get_stats() == {
+        'hits': 2,
+        'misses': 1,
+        'memory_hits': 1,
+        'disk_hits': 1,
+        'hit_rate': 66.67,
+        'memory_entries': 1
+    }
+
+
+
+
+
+def test_memory_cache_evicts_lru_and_expires():
+    cache = MemoryCache(max_entries=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    
+    cache.set('d', 4, expires_at=time.time() - 1)
+    assert cache.get('d') is None
\ No newline at end of file
@@ -0,0 +1,52 @@
+# tests/test_streaming.py
+import asyncio
+
+from godart import AsyncGodartManager
+from godart.fakes import FakeGeminiBackend
+
+
+
+
+
+def test_stream_reports_time_to_first_token(make_manager):
+    backend = FakeGeminiBackend(latency=0.4, stream_chunks=4)
+    manager = make_manager(backend, coalesce=False)
+    
+    stream = manager.make_request_stream("hola", model='mini')
+    chunks = list(stream)
+    
+    assert len(chunks) >= 4
+    assert stream.text == ''.join(chunks) and stream.text.startswith("Respuesta a: hola")
+    # El primer fragmento llega tras una fracción de la latencia total
+    assert 0 < stream.time_to_first_token < stream.total_time / 2
+    assert stream.key_id is not None and stream.usage_metadata is not None
+
+
+
+
+
+def test_async_stream_reports_time_to_first_token(make_manager):
+    backend = FakeGeminiBackend(latency=0.4, stream_chunks=4)
+    manager = make_manager(backend, manager_class=AsyncGodartManager, coalesce=False)
+    
+    async def run():
+        stream = await manager.make_request_stream("hola", model='mini')
+        return stream, [text async for text in stream]
+    
+    stream, chunks = asyncio.run(run())
+    assert stream.text == ''.join(chunks) and stream.text.startswith("Respuesta a: hola")
+    assert 0 < stream.time_to_first_token < stream.total_time / 2
+
+
+
+
+
+def test_chat_stream_saves_the_turn(make_manager):
+    manager = make_manager(FakeGeminiBackend(), coalesce=False)
+    
+    stream = manager.make_request_chat_stream("hola", session_id="s1", model='mini')
+    text = ''.join(stream)
+    
+    history = manager.get_chat_history("s1")
+    assert len(history) == 2
+    assert history[-1].parts[0].text == text
\ No newline at end of file
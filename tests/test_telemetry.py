@@ -0,0 +1,33 @@
+# tests/test_telemetry.py
+import logging
+
+from godart.telemetry import logger, configure_logging
+
+
+
+
+
+def test_import_leaves_logging_to_the_app(caplog):
+    # Importar godart no agrega handlers de consola ni corta la propagación
+    assert [type(handler) for handler in logger.handlers] == [logging.NullHandler]
+    assert logger.propagate
+    
+    with caplog.at_level(logging.INFO, logger='godart'):
+        logger.info(" - mensaje de prueba")
+    assert " - mensaje de prueba" in caplog.text
+
+
+
+
+
+def test_console_is_opt_in(capsys):
+    try:
+        configure_logging(level='INFO', console=True)
+        assert not logger.propagate
+        logger.info(" - a consola")
+        assert " - a consola" in capsys.readouterr().out
+    finally:
+        configure_logging(level=logging.NOTSET, console=False)
+    
+    assert [type(handler) for handler in logger.handlers] == [logging.NullHandler]
+    assert logger.propagate
\ No newline at end of file
@@ -0,0 +1,68 @@
+# tests/test_thread_safety.py
+from concurrent.futures import ThreadPoolExecutor
+
+from godart import KeyHealth
+from godart.fakes import FakeGeminiBackend
+
+
+
+
+
+THREADS = 16
+REQUESTS_PER_THREAD = 100
+
+
+def _reservations(manager):
+    return sum(tracker.get_current_usage()['requests_today'] for tracker in manager.rate_trackers.values())
+
+
+
+
+
+def test_shared_manager_does_not_mix_requests(make_manager):
+    # Una sola instancia para 16 hilos con 429 aleatorios: cada respuesta corresponde a su prompt
+    backend = FakeGeminiBackend(latency=0.001, jitter=0.001, error_rate=0.02, seed=7)
+    manager = make_manager(backend, coalesce=False, key_health=KeyHealth(base_cooldown=0.2))
+    
+    def worker(thread):
+        mismatched = []
+        for index in range(REQUESTS_PER_THREAD):
+            prompt = f"t{thread}-r{index}"
+            try:
+                response = manager.make_request(prompt, model='mini', use_cache=False)
+            except Exception:
+                continue
+            if not response.startswith(f"Respuesta a: {prompt} "):
+                mismatched.append((prompt, response[:40]))
+        return mismatched
+    
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        mismatched = [item for items in pool.map(worker, range(THREADS)) for item in items]
+    
+    assert mismatched == []
+    assert backend.errors > 0
+    # Cada intento hecho a Gemini, incluidos los 429, tomó exactamente una reserva de algún tracker
+    assert _reservations(manager) == backend.calls
+
+
+
+
+
+def test_shared_manager_keeps_chat_sessions_apart(make_manager):
+    backend = FakeGeminiBackend(latency=0.001, seed=7)
+    manager = make_manager(backend, coalesce=False)
+    
+    def worker(thread):
+        session_id = f"sesion-{thread}"
+        for index in range(10):
+            manager.make_request_chat(f"t{thread}-m{index}", session_id=session_id, model='mini')
+        return session_id
+    
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        sessions = list(pool.map(worker, range(THREADS)))
+    
+    for thread, session_id in enumerate(sessions):
+        history = manager.get_chat_history(session_id)
+        assert [content.parts[0].text for content in history[::2]] == [f"t{thread}-m{index}" for index in range(10)]
+        assert all(content.parts[0].text.startswith(f"Respuesta a: t{thread}-m") for content in history[1::2])
+    assert _reservations(manager) == backend.calls
\ No newline at end of file
@@ -0,0 +1,101 @@
+# tests/test_timeouts.py
+import time
+import asyncio
+
+import pytest
+
+from godart import AsyncGodartManager, HedgePolicy, KeyScheduler
+from godart.fakes import FakeGeminiBackend
+
+
+
+
+
+def test_request_times_out_at_deadline(make_manager):
+    manager = make_manager(FakeGeminiBackend(latency=0.5), coalesce=False)
+    
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        manager.make_request("hola", model='mini', use_cache=False, timeout=0.1)
+    assert time.monotonic() - started < 0.4
+
+
+
+
+
+def test_async_request_times_out_at_deadline(make_manager):
+    manager = make_manager(FakeGeminiBackend(latency=0.5), manager_class=AsyncGodartManager, coalesce=False)
+    
+    async def run():
+        await manager.make_request("hola", model='mini', use_cache=False, timeout=0.1)
+    
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        asyncio.run(run())
+    assert time.monotonic() - started < 0.4
+
+
+
+
+
+def test_hedged_attempts_are_settled_after_deadline(make_manager):
+    # El duplicado se consigue ya vencido el deadline: igual ambos intentos quedan registrados en Supabase
+    hedge_policy = HedgePolicy(min_samples=1, min_delay=0)
+    hedge_policy.observe('mini', 0.01)
+    manager = make_manager(FakeGeminiBackend(latency=0.2), keys=3, coalesce=False, hedge_policy=hedge_policy)
+    lease_hedge_key = manager._lease_hedge_key
+    
+    def slow_lease(*args, **kwargs):
+        time.sleep(0.15)
+        return lease_hedge_key(*args, **kwargs)
+    
+    manager._lease_hedge_key = slow_lease
+    with pytest.raises(TimeoutError):
+        manager.make_request("hola", model='mini', use_cache=False, deadline=time.monotonic() + 0.1)
+    
+    time.sleep(0.5)
+    assert {log['p_key_id'] for log in manager.supabase.client.logs} == {'fake-key-0', 'fake-key-1'}
+
+
+
+
+
+def test_stream_respects_deadline(make_manager):
+    manager = make_manager(FakeGeminiBackend(latency=0.3), coalesce=False)
+    stream = manager.make_request_stream("hola", model='mini', timeout=0.1)
+    
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        list(stream)
+    assert time.monotonic() - started < 0.5
+
+
+
+
+
+def test_async_stream_respects_deadline(make_manager):
+    manager = make_manager(FakeGeminiBackend(latency=0.3), manager_class=AsyncGodartManager, coalesce=False)
+    
+    async def run():
+        stream = await manager.make_request_stream("hola", model='mini', timeout=0.1)
+        return [text async for text in stream]
+    
+    with pytest.raises(TimeoutError):
+        asyncio.run(run())
+
+
+
+
+def test_hedge_on_another_key_wins_over_slow_primary(make_manager):
+    hedge_policy = HedgePolicy(min_samples=1, min_delay=0)
+    hedge_policy.observe('mini', 0.05)
+    backend = FakeGeminiBackend(latency=0.01, key_latency={'fake-api-key-0': 1.0})
+    manager = make_manager(backend, keys=2, coalesce=False, hedge_policy=hedge_policy, key_scheduler=KeyScheduler(strategy='first_fit'))
+    
+    started = time.monotonic()
+    response = manager.make_request("hola", model='mini', use_cache=False)
+    assert response.startswith("Respuesta a: hola")
+    assert time.monotonic() - started < 0.5
+    
+    stats = hedge_policy.get_stats()['mini']
+    assert stats['hedges'] == 1 and stats['wins'] == 1
\ No newline at end of file
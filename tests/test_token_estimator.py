@@ -0,0 +1,60 @@
+# tests/test_token_estimator.py
+from types import SimpleNamespace
+
+from godart import TokenEstimator
+from godart.fakes import FakeGeminiBackend
+
+
+
+
+
+def _usage(prompt_tokens, output_tokens):
+    return SimpleNamespace(prompt_token_count=prompt_tokens, candidates_token_count=output_tokens, thoughts_token_count=None)
+
+
+
+
+
+def test_ratio_and_output_follow_observed_usage():
+    estimator = TokenEstimator(learning_rate=0.5, default_output=100)
+    prompt = "The quick brown fox jumps over the lazy dog. " * 20
+    first = estimator.estimate('mini', prompt)
+    assert first.language == 'en' and first.output_tokens == 100
+    
+    # La primera observación fija la razón real/estimado; las siguientes se promedian con la tasa de aprendizaje
+    estimator.observe(first, _usage(first.raw_input * 2, 300))
+    second = estimator.estimate('mini', prompt)
+    assert second.input_tokens == first.raw_input * 2
+    assert second.output_tokens == 300
+    
+    estimator.observe(second, _usage(first.raw_input, 100))
+    third = estimator.estimate('mini', prompt)
+    assert third.input_tokens == int(first.raw_input * 1.5)
+    assert third.output_tokens == 200
+    
+    # Otro modelo no hereda lo aprendido
+    assert estimator.estimate('max', prompt).input_tokens == first.raw_input
+
+
+
+
+
+def test_ratio_is_clamped():
+    estimator = TokenEstimator(learning_rate=0.5)
+    estimate = estimator.estimate('mini', "hola " * 100)
+    estimator.observe(estimate, _usage(estimate.raw_input * 100, None))
+    assert estimator.get_stats()['ratios'] == {f"mini:{estimate.language}": TokenEstimator.RATIO_BOUNDS[1]}
+    assert estimator.get_stats()['expected_output'] == {}
+
+
+
+
+
+def test_manager_learns_from_responses(make_manager):
+    estimator = TokenEstimator()
+    manager = make_manager(FakeGeminiBackend(), token_estimator=estimator)
+    manager.make_request("hola", model='mini', use_cache=False)
+    
+    stats = estimator.get_stats()
+    assert 'mini' in stats['expected_output']
+    assert stats['ratios']
\ No newline at end of file